@@ -0,0 +1,206 @@
+from fastapi import APIRouter, HTTPException, Depends, Query, BackgroundTasks
+from firebase_admin import firestore
+from app.core.auth import verify_job_token
+from app.services.firebase_service import FirestoreUserService, db
+from app.services.timezone_utils import is_valid_timezone
+from app.services.write_pipeline import WritePipeline
+from app.services.daily_rollover import run_daily_rollover
+from app.services.weekly_rollup import run_weekly_rollup
+from app.services.waitlist_positions import run_position_assignment
+from app.services.avatar_migration import start_avatar_migration, run_avatar_migration, get_migration_state
+from app.api.waitlist import migrate_legacy_entries
+
+router = APIRouter(prefix="/jobs", tags=["jobs"], dependencies=[Depends(verify_job_token)])
+user_service = FirestoreUserService()
+
+
+@router.post("/weekly-rollup")
+def weekly_rollup():
+    """
+    Save last week's workout progress for all users whose local week just ended.
+    Intended to be called hourly by Cloud Scheduler with the X-Job-Token header.
+    """
+    try:
+        stats = run_weekly_rollup()
+        return {"status": "success", "data": stats}
+    except Exception as e:
+        print(f"Error running weekly rollup: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/daily-rollover")
+def daily_rollover():
+    """
+    Close the previous day for all users whose local day has started since the last run.
+    Intended to be called every 15 minutes by Cloud Scheduler with the X-Job-Token header.
+    """
+    try:
+        stats = run_daily_rollover()
+        return {"status": "success", "data": stats}
+    except Exception as e:
+        print(f"Error running daily rollover: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/assign-waitlist-positions")
+def assign_waitlist_positions():
+    """
+    Number waitlist entries that joined since the last run, in join order.
+    Intended to be called every minute by Cloud Scheduler with the X-Job-Token header.
+    """
+    try:
+        stats = run_position_assignment()
+        return {"status": "success", "data": stats}
+    except Exception as e:
+        print(f"Error assigning waitlist positions: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/migrate-waitlist-ids")
+def migrate_waitlist_ids(cursor: str = None, page_size: int = Query(200, ge=1, le=500)):
+    """
+    Move waitlist entries from before email-keyed IDs to their normalized-email IDs for one page.
+    Call repeatedly with the returned cursor until 'done' is true; the last page also seeds the segment counts.
+    """
+    try:
+        return {"status": "success", "data": migrate_legacy_entries(cursor, page_size)}
+    except Exception as e:
+        print(f"Error migrating waitlist IDs: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/fix-avatars")
+def fix_user_avatars(background_tasks: BackgroundTasks, restart: bool = False):
+    """
+    Start (or resume) the background migration that fixes missing avatars for all users -
+    prioritize Google photos, then generate fallback. Poll /jobs/fix-avatars/status for progress.
+    """
+    try:
+        state, claimed = start_avatar_migration(restart)
+    except Exception as e:
+        print(f"Error starting avatar migration: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if not claimed:
+        return {"message": "Avatar migration already running", "job": state}
+
+    background_tasks.add_task(run_avatar_migration, state)
+    return {"message": "Avatar migration started", "job": state}
+
+
+@router.get("/fix-avatars/status")
+def get_fix_avatars_status():
+    """Get progress of the avatar migration job"""
+    try:
+        return {"job": get_migration_state()}
+    except Exception as e:
+        print(f"Error reading avatar migration state: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/migrate-weight-logs")
+def migrate_weight_logs(cursor: str = None, page_size: int = Query(200, ge=1, le=500)):
+    """
+    Move embedded weight_logs arrays into the weight_logs subcollection for one page of users.
+    Call repeatedly with the returned cursor until 'done' is true.
+    """
+    try:
+        users_ref = db.collection('users')
+        doc_id_field = firestore.FieldPath.document_id()
+        query = users_ref.order_by(doc_id_field).select(['weight_logs'])
+        if cursor:
+            query = query.where(doc_id_field, '>', users_ref.document(cursor))
+        user_docs = list(query.limit(page_size).stream())
+
+        users_migrated = 0
+        logs_migrated = 0
+        logs_collided = 0
+        logs_undated = 0
+        for user_doc in user_docs:
+            user_data = user_doc.to_dict()
+            if 'weight_logs' in user_data:
+                counts = user_service.migrate_weight_logs(user_doc.id, user_data)
+                logs_migrated += counts['migrated']
+                logs_collided += counts['collided']
+                logs_undated += counts['undated']
+                users_migrated += 1
+
+        return {
+            "status": "success",
+            "data": {
+                "users_scanned": len(user_docs),
+                "users_migrated": users_migrated,
+                "logs_migrated": logs_migrated,
+                "logs_collided": logs_collided,
+                "logs_undated": logs_undated,
+                "cursor": user_docs[-1].id if user_docs else cursor,
+                "done": len(user_docs) < page_size
+            }
+        }
+    except Exception as e:
+        print(f"Error migrating weight logs: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/backfill-timezones")
+def backfill_timezones(cursor: str = None, page_size: int = Query(500, ge=1, le=500)):
+    """
+    Store 'UTC' for users with a missing or invalid timezone, which date logic already treats as UTC.
+    Scheduled jobs select users by timezone, so users without a valid one would never be processed.
+    Call repeatedly with the returned cursor until 'done' is true.
+    """
+    try:
+        users_ref = db.collection('users')
+        doc_id_field = firestore.FieldPath.document_id()
+        query = users_ref.order_by(doc_id_field).select(['timezone'])
+        if cursor:
+            query = query.where(doc_id_field, '>', users_ref.document(cursor))
+        user_docs = list(query.limit(page_size).stream())
+
+        users_updated = 0
+        with WritePipeline(db) as writes:
+            for user_doc in user_docs:
+                if not is_valid_timezone((user_doc.to_dict() or {}).get('timezone')):
+                    writes.update(user_doc.reference, {'timezone': 'UTC'})
+                    users_updated += 1
+
+        return {
+            "status": "success",
+            "data": {
+                "users_scanned": len(user_docs),
+                "users_updated": users_updated,
+                "cursor": user_docs[-1].id if user_docs else cursor,
+                "done": len(user_docs) < page_size
+            }
+        }
+    except Exception as e:
+        print(f"Error backfilling timezones: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/migrate-presence")
+def migrate_presence(cursor: str = None, page_size: int = Query(300, ge=1, le=500)):
+    """
+    Copy last_active timestamps from user documents into the presence store for one page of users.
+    Call repeatedly with the returned cursor until 'done' is true.
+    """
+    try:
+        users_ref = db.collection('users')
+        doc_id_field = firestore.FieldPath.document_id()
+        query = users_ref.order_by(doc_id_field).select(['last_active'])
+        if cursor:
+            query = query.where(doc_id_field, '>', users_ref.document(cursor))
+        user_docs = list(query.limit(page_size).stream())
+
+        return {
+            "status": "success",
+            "data": {
+                "users_scanned": len(user_docs),
+                "presence_saved": user_service.import_presence(user_docs),
+                "cursor": user_docs[-1].id if user_docs else cursor,
+                "done": len(user_docs) < page_size
+            }
+        }
+    except Exception as e:
+        print(f"Error migrating presence: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
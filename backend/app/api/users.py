@@ -1,73 +1,26 @@
-from fastapi import APIRouter, HTTPException, Body, Query, Request
+import asyncio
+import json
+from fastapi import APIRouter, HTTPException, Body, Query, Request, Depends
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from app.models.user_model import UserProfile
+from app.core.auth import verify_firebase_token
 from app.services.firebase_service import FirestoreUserService
 from app.services.firebase_service import db  # Import the Firestore client
 
 router = APIRouter(prefix="/users", tags=["users"])
 user_service = FirestoreUserService()
 
+# Presence stream: comment line sent when idle so proxies keep the connection open,
+# and how often the friend list is re-read to pick up new or removed friends
+PRESENCE_KEEPALIVE_SECONDS = 15
+PRESENCE_FRIENDS_REFRESH_SECONDS = 300
+
 
 # --- STATIC ROUTES FIRST ---
 
 
 
-@router.post("/fix-avatars")
-def fix_user_avatars():
-    """Fix missing avatars for all users - prioritize Google photos, then generate fallback"""
-    from firebase_admin import auth
-    
-    users_ref = db.collection('users')
-    all_users = users_ref.stream()
-    
-    fixed_count = 0
-    restored_google_photos = 0
-    
-    for user in all_users:
-        data = user.to_dict()
-        user_id = user.id
-        email = data.get('email')
-        
-        # Check if user needs avatar fix
-        current_avatar = data.get('avatar')
-        needs_fix = not current_avatar
-        
-        # Also check if current avatar is a generated one that could be replaced with Google photo
-        if current_avatar and 'ui-avatars.com' in current_avatar:
-            needs_fix = True
-        
-        if needs_fix and email:
-            try:
-                # Try to get the user's Firebase Auth record to get Google photo
-                auth_user = auth.get_user_by_email(email)
-                if auth_user.photo_url:
-                    # User has Google photo, use it
-                    db.collection('users').document(user_id).update({'avatar': auth_user.photo_url})
-                    restored_google_photos += 1
-                    fixed_count += 1
-                    print(f"Restored Google photo for user {user_id}: {data.get('name', email)}")
-                    continue
-            except Exception as e:
-                print(f"Could not get Firebase Auth data for {email}: {e}")
-        
-        # If no Google photo available and no avatar, generate fallback
-        if not current_avatar:
-            name = data.get('name', '')
-            username = data.get('username', '')
-            fallback_avatar = user_service.generate_avatar_url(name, username)
-            
-            try:
-                db.collection('users').document(user_id).update({'avatar': fallback_avatar})
-                fixed_count += 1
-                print(f"Generated fallback avatar for user {user_id}: {name or username}")
-            except Exception as e:
-                print(f"Failed to update avatar for user {user_id}: {e}")
-    
-    return {
-        "message": f"Fixed avatars for {fixed_count} users",
-        "google_photos_restored": restored_google_photos,
-        "fallback_avatars_generated": fixed_count - restored_google_photos
-    }
-
 @router.get("/search")
 def search_users(q: str = Query(..., min_length=1)):
     users_ref = db.collection('users')
@@ -85,18 +38,8 @@ def search_users(q: str = Query(..., min_length=1)):
         
         # Check if query matches username or name (case-insensitive, partial match)
         if query_lower in username or query_lower in name:
-            last_active = data.get("last_active")
-            is_online = user_service.is_user_online(last_active) if last_active else False
-            
             # Ensure user has an avatar
-            avatar = data.get("avatar")
-            if not avatar:
-                avatar = user_service.generate_avatar_url(data.get("name", ""), data.get("username", ""))
-                # Save the generated avatar back to the database
-                try:
-                    db.collection('users').document(user.id).update({'avatar': avatar})
-                except Exception as e:
-                    print(f"Failed to update avatar for user {user.id}: {e}")
+            avatar = data.get("avatar") or user_service.default_avatar(user.id, data, user.update_time)
             # Keep existing avatar (including Google photos) as is
             
             user_matches.append({
@@ -104,7 +47,6 @@ def search_users(q: str = Query(..., min_length=1)):
                 "username": data.get("username"),
                 "name": data.get("name"),
                 "avatar": avatar,
-                "online": is_online,
                 # Add match score for sorting (exact matches first, then starts with, then contains)
                 "match_score": (
                     0 if username == query_lower or name == query_lower else
@@ -119,24 +61,94 @@ def search_users(q: str = Query(..., min_length=1)):
     # Remove match_score from final results and limit to 50 results
     users = [{k: v for k, v in user.items() if k != 'match_score'} for user in user_matches[:50]]
     
+    # Online status for the returned users only, in one bulk presence read
+    online = user_service.online_status([user["id"] for user in users])
+    for user in users:
+        user["online"] = online[user["id"]]
+    
     return {"results": users}
 
 # --- DYNAMIC ROUTES AFTER ---
 
+# Fields that can be requested with GET /users/{user_id}?fields=: the profile model plus stored and derived fields
+PROFILE_FIELDS = frozenset(UserProfile.__fields__) | {
+    "avatar", "created_at", "friends", "friend_requests", "last_activity", "last_active", "online"
+}
+
 # User profile endpoints
 @router.get("/{user_id}")
-def get_user(user_id: str):
-    user = user_service.get_user(user_id)
-    if not user:
+def get_user(user_id: str, fields: str = None):
+    """
+    Get a user's profile.
+
+    Args:
+        user_id: The user's Firebase ID
+        fields: Comma-separated fields to return, e.g. "name,avatar,online" (default: all)
+    """
+    requested = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+    unknown = sorted(set(requested or []) - PROFILE_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    projection = None
+    if requested:
+        # 'online' comes from the presence store; username is read so existence can be checked
+        projection = [field for field in requested if field != "online"] or ["username"]
+    
+    user = user_service.get_user(user_id, projection)
+    if user is None:
         raise HTTPException(status_code=404, detail="User not found")
     
+    if requested:
+        user = {key: value for key, value in user.items() if key in requested}
+    
     # Add online status to user data
-    last_active = user.get("last_active")
-    is_online = user_service.is_user_online(last_active) if last_active else False
-    user["online"] = is_online
+    if not requested or "online" in requested:
+        is_online = user_service.is_user_online(user.get("last_active"), user_id)
+        user["online"] = is_online
     
     return user
 
+@router.get("/{user_id}/card")
+def get_user_card(user_id: str):
+    """
+    Get the fields needed to display a user (name, username, avatar, online status).
+
+    Args:
+        user_id: The user's Firebase ID
+    """
+    card = user_service.get_user_card(user_id)
+    if not card:
+        raise HTTPException(status_code=404, detail="User not found")
+    card.pop("last_active", None)
+    return card
+
+@router.get("/{user_id}/bootstrap")
+def get_dashboard_bootstrap(user_id: str, decoded_token: dict = Depends(verify_firebase_token)):
+    """
+    Get all first-paint dashboard data in a single request.
+
+    Combines the user profile, today's water/workout/streak status, workout
+    consistency, latest body fat, active goals and last week's saved progress.
+    Only the signed-in user can read their own dashboard.
+
+    Args:
+        user_id: The user's Firebase ID
+
+    Returns:
+        Dictionary with user, today, consistency, body_fat, goals and weekly_progress
+    """
+    if decoded_token.get('uid') != user_id:
+        raise HTTPException(status_code=403, detail="Not allowed to read another user's dashboard")
+    try:
+        payload = user_service.get_dashboard_bootstrap(user_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if payload is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    payload['user']["online"] = user_service.is_user_online(payload['user'].get("last_active"), user_id)
+    return payload
+
 @router.post("/{user_id}", response_model=dict)
 def create_user(user_id: str, user: UserProfile):
     try:
@@ -185,8 +197,38 @@ def add_weight_log(user_id: str, weight: float = Body(...), date: str = Body(...
     return {"success": success}
 
 @router.get("/{user_id}/weight-logs")
-def get_weight_logs(user_id: str):
-    return user_service.get_weight_logs(user_id)
+def get_weight_logs(
+    user_id: str,
+    start: str = None,
+    end: str = None,
+    limit: int = Query(None, ge=1, le=1000),
+    after: str = None
+):
+    """
+    Get weight logs in chronological order.
+
+    Args:
+        user_id: The user's Firebase ID
+        start: Earliest date to include (YYYY-MM-DD or ISO timestamp)
+        end: Latest date to include (YYYY-MM-DD includes the whole day)
+        limit: Page size
+        after: Cursor - the 'date' of the last entry from the previous page
+    """
+    return user_service.get_weight_logs(user_id, start, end, limit, after)
+
+@router.get("/{user_id}/weight/trends")
+def get_weight_trends(user_id: str, days: int = Query(None, ge=1, le=730)):
+    """
+    Get smoothed weight trends (EMA, 7/30-day rolling means, weekly rate of change).
+
+    Args:
+        user_id: The user's Firebase ID
+        days: Include daily trend series for this many trailing days (optional)
+    """
+    try:
+        return user_service.get_weight_trends(user_id, days)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/{user_id}/check-username")
 def check_username(username: str):
@@ -196,7 +238,6 @@ def check_username(username: str):
 # Update user activity (heartbeat endpoint)
 @router.post("/{user_id}/activity")
 def update_user_activity(user_id: str):
-    print(f"DEBUG API: /activity endpoint called for user {user_id}")
     success = user_service.update_user_activity(user_id)
     if not success:
         raise HTTPException(status_code=500, detail="Failed to update activity")
@@ -284,6 +325,57 @@ def get_user_friends(user_id: str):
     friends = user_service.get_user_friends(user_id)
     return {"friends": friends}
 
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@router.get("/{user_id}/presence/stream")
+async def stream_friend_presence(user_id: str, request: Request, decoded_token: dict = Depends(verify_firebase_token)):
+    """
+    Stream friends' online status as Server-Sent Events.
+
+    Sends a 'snapshot' event with every friend's status, then 'presence'
+    events containing only the friends whose status changed.
+
+    Args:
+        user_id: The user's Firebase ID (must match the authenticated user)
+    """
+    if decoded_token.get('uid') != user_id:
+        raise HTTPException(status_code=403, detail="Not allowed to stream another user's friends")
+    friend_ids = await run_in_threadpool(user_service.get_friend_ids, user_id)
+
+    async def events():
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        watched = list(friend_ids)
+        token, snapshot = await run_in_threadpool(user_service.subscribe_presence, watched, loop, queue)
+        friends_checked_at = loop.time()
+        try:
+            yield _sse_event("snapshot", {"online": snapshot})
+            while not await request.is_disconnected():
+                try:
+                    changes = await asyncio.wait_for(queue.get(), timeout=PRESENCE_KEEPALIVE_SECONDS)
+                    yield _sse_event("presence", {"online": changes})
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+
+                if loop.time() - friends_checked_at >= PRESENCE_FRIENDS_REFRESH_SECONDS:
+                    friends_checked_at = loop.time()
+                    current = await run_in_threadpool(user_service.get_friend_ids, user_id)
+                    added = [friend_id for friend_id in current if friend_id not in watched]
+                    removed = [friend_id for friend_id in watched if friend_id not in current]
+                    if added or removed:
+                        added_status = await run_in_threadpool(user_service.update_presence_subscription, token, current)
+                        watched = list(current)
+                        yield _sse_event("friends", {"added": added_status, "removed": removed})
+        finally:
+            user_service.unsubscribe_presence(token)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/{user_id}/friendship-status/{other_user_id}")
 def check_friendship_status(user_id: str, other_user_id: str):
     are_friends = user_service.are_friends(user_id, other_user_id)
@@ -351,6 +443,40 @@ def get_water_history(user_id: str, days: int = 7):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/{user_id}/today")
+def get_today_status(user_id: str):
+    """
+    Get today's water total, workout-logged flag and all streaks in one call.
+
+    Args:
+        user_id: The user's Firebase ID
+
+    Returns:
+        Dictionary with date, timezone, water, has_logged_workout and streaks
+    """
+    try:
+        return user_service.get_today_status(user_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/{user_id}/heatmap")
+def get_activity_heatmap(user_id: str, year: int = Query(None, ge=2000, le=2100)):
+    """
+    Get a yearly activity heatmap of water and workouts.
+
+    Args:
+        user_id: The user's Firebase ID
+        year: Calendar year (defaults to the current year in the user's timezone)
+
+    Returns:
+        Per-day 'intensity' (0-4), 'water' and 'workouts' arrays starting at January 1st
+    """
+    try:
+        heatmap = user_service.get_activity_heatmap(user_id, year)
+        return heatmap
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 # ============ STREAK ENDPOINTS (Reusable for any activity type) ============
 
 @router.get("/{user_id}/streak/{streak_type}")
@@ -360,7 +486,7 @@ def get_streak(user_id: str, streak_type: str = "water"):
     
     Args:
         user_id: The user's Firebase ID
-        streak_type: Type of streak (water, workout, food, etc.)
+        streak_type: Type of streak (water, workout or food)
     
     Returns:
         Streak data with current_streak, last_logged_date, start_date
@@ -379,7 +505,7 @@ def update_streak(user_id: str, streak_type: str = "water"):
     
     Args:
         user_id: The user's Firebase ID
-        streak_type: Type of streak (water, workout, food, etc.)
+        streak_type: Type of streak (water, workout or food)
     
     Returns:
         Updated streak data
@@ -414,7 +540,7 @@ def reset_streak(user_id: str, streak_type: str = "water"):
     
     Args:
         user_id: The user's Firebase ID
-        streak_type: Type of streak to reset
+        streak_type: Type of streak to reset (water, workout or food)
     
     Returns:
         Reset streak data
@@ -497,6 +623,37 @@ def get_body_fat_history(user_id: str, limit: int = Query(100, ge=1, le=500)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/{user_id}/timeseries/{metric}")
+def get_metric_timeseries(
+    user_id: str,
+    metric: str,
+    start: str = Query(None, alias="from"),
+    end: str = Query(None, alias="to"),
+    resolution: str = "week",
+    points: int = Query(100, ge=3, le=1000)
+):
+    """
+    Get a downsampled chart series for weight or body fat.
+    
+    Args:
+        user_id: The user's Firebase ID
+        metric: 'weight' or 'body_fat'
+        start: First date to include (YYYY-MM-DD)
+        end: Last date to include (YYYY-MM-DD)
+        resolution: 'day', 'week', 'month' (mean/min/max/count per bucket) or 'lttb'
+        points: Maximum number of points returned for 'lttb'
+    
+    Returns:
+        Series with one point per bucket, oldest first
+    """
+    try:
+        return user_service.get_metric_series(user_id, metric, start, end, resolution, points)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # ============ ACTIVITY FEED ENDPOINT ============
 
 @router.get("/{user_id}/activities")
@@ -1,11 +1,46 @@
-from fastapi import APIRouter, HTTPException, Body
+from fastapi import APIRouter, HTTPException, Body, Depends
+from fastapi.responses import StreamingResponse
+from firebase_admin import firestore
+from app.core.auth import verify_job_token
 from app.services.firebase_service import db
+from app.services.waitlist_positions import unassigned_position
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import List, Dict, Any
-import uuid
+import csv
+import hashlib
+import io
+import json
+import random
 
 router = APIRouter(prefix="/waitlist", tags=["waitlist"])
 
+# Budgets that mark a high value prospect
+HIGH_VALUE_BUDGETS = ['500-plus', 'flexible', '200-500']
+
+# Entries fetched per query page when exporting
+EXPORT_PAGE_SIZE = 500
+EXPORT_COLUMNS = [
+    'id', 'position', 'email', 'phone', 'person_type', 'activity_level', 'current_situation',
+    'desired_results', 'biggest_challenge', 'previous_attempts', 'budget', 'status',
+    'priority_score', 'tags', 'joined_at'
+]
+
+# Records whether entries from before email-keyed IDs may still exist ('legacy_entries')
+sequence_ref = db.collection('waitlist_meta').document('sequence')
+
+# Entry counts per tag, person type and budget: per-join increments spread over
+# shard documents, so concurrent joins do not all write the same document, plus
+# the totals of older entries, seeded into the segments document by
+# /jobs/migrate-waitlist-ids. Joins flag their entry with 'segment_counted', so
+# seeding skips entries that are already in the shards.
+segments_ref = db.collection('waitlist_meta').document('segments')
+SEGMENT_FIELDS = ['tags', 'person_type', 'budget']
+SEGMENT_SHARDS = 16
+
+class AlreadyRegistered(Exception):
+    pass
+
 @router.post("/join")
 def join_waitlist(
     person_type: str = Body(...),
@@ -20,14 +55,11 @@ def join_waitlist(
 ):
     """Add a new person to the waitlist"""
     try:
-        # Check if email already exists in waitlist
-        existing_entries = db.collection('waitlist').where('email', '==', email).stream()
-        for entry in existing_entries:
-            raise HTTPException(status_code=400, detail="Email already registered in waitlist")
+        normalized_email = normalize_email(email)
         
-        # Create waitlist entry
+        # Entries are keyed by their email, so a duplicate signup hits the same document
         waitlist_entry = {
-            "id": str(uuid.uuid4()),
+            "id": waitlist_id_for_email(normalized_email),
             "person_type": person_type,
             "activity_level": activity_level,
             "current_situation": current_situation,
@@ -35,17 +67,21 @@ def join_waitlist(
             "biggest_challenge": biggest_challenge,
             "previous_attempts": previous_attempts,
             "budget": budget,
-            "email": email,
+            "email": normalized_email,
             "phone": phone,
             "joined_at": datetime.utcnow(),
             "status": "active",  # active, contacted, converted
             "priority_score": calculate_priority_score(person_type, budget, current_situation),
-            "tags": generate_tags(person_type, activity_level, current_situation, desired_results)
+            "tags": generate_tags(person_type, activity_level, current_situation, desired_results),
+            "segment_counted": True
         }
         
-        # Save to Firestore
-        doc_ref = db.collection('waitlist').document(waitlist_entry["id"])
-        doc_ref.set(waitlist_entry)
+        # Check for the email and save in one transaction; positions are numbered afterwards by a job
+        try:
+            insert_entry(db.transaction(), waitlist_entry, email)
+        except AlreadyRegistered:
+            raise HTTPException(status_code=400, detail="Email already registered in waitlist")
+        position = unassigned_position(waitlist_entry["joined_at"])
         
         # TODO: Send confirmation email and WhatsApp message here
         
@@ -53,7 +89,7 @@ def join_waitlist(
             "success": True,
             "message": "Successfully joined the waitlist",
             "waitlist_id": waitlist_entry["id"],
-            "position": get_waitlist_position(waitlist_entry["id"])
+            "position": position
         }
         
     except HTTPException:
@@ -68,25 +104,26 @@ def get_waitlist_stats():
     try:
         waitlist_ref = db.collection('waitlist')
         
-        # Count total entries
-        total_entries = len(list(waitlist_ref.stream()))
-        
-        # Count by person type
-        executives = len(list(waitlist_ref.where('person_type', '==', 'executive').stream()))
-        professionals = len(list(waitlist_ref.where('person_type', '==', 'professional').stream()))
-        students = len(list(waitlist_ref.where('person_type', '==', 'student').stream()))
-        
-        # Count by budget (high value prospects)
-        high_budget = len(list(waitlist_ref.where('budget', 'in', ['500-plus', 'flexible', '200-500']).stream()))
+        # Server-side count() aggregations: one read per 1000 matching entries instead of reading every document
+        queries = {
+            "total": waitlist_ref,
+            "executives": waitlist_ref.where('person_type', '==', 'executive'),
+            "professionals": waitlist_ref.where('person_type', '==', 'professional'),
+            "students": waitlist_ref.where('person_type', '==', 'student'),
+            "high_budget": waitlist_ref.where('budget', 'in', HIGH_VALUE_BUDGETS),
+        }
+        with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+            futures = {name: executor.submit(count_entries, query) for name, query in queries.items()}
+        counts = {name: future.result() for name, future in futures.items()}
         
         return {
-            "total_entries": total_entries,
+            "total_entries": counts["total"],
             "by_type": {
-                "executives": executives,
-                "professionals": professionals,
-                "students": students
+                "executives": counts["executives"],
+                "professionals": counts["professionals"],
+                "students": counts["students"]
             },
-            "high_value_prospects": high_budget
+            "high_value_prospects": counts["high_budget"]
         }
         
     except Exception as e:
@@ -121,6 +158,105 @@ def get_waitlist_entries(limit: int = 50, status: str = None):
         print(f"Error getting waitlist entries: {e}")
         raise HTTPException(status_code=500, detail="Failed to get waitlist entries")
 
+@router.get("/export", dependencies=[Depends(verify_job_token)])
+def export_waitlist_entries(
+    format: str = "csv",
+    status: str = None,
+    tag: str = None,
+    min_priority: int = None,
+    max_priority: int = None
+):
+    """
+    Stream all matching waitlist entries as CSV or NDJSON.
+    Contains contact details, so it requires the X-Job-Token header like the batch jobs.
+    
+    Entries are read page by page with query cursors and written as they
+    arrive, so memory use does not grow with the size of the waitlist.
+    Ordered by priority score, highest first.
+    """
+    if format not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="Format must be 'csv' or 'ndjson'")
+    
+    query = db.collection('waitlist')
+    if status:
+        query = query.where('status', '==', status)
+    if tag:
+        query = query.where('tags', 'array_contains', tag)
+    if min_priority is not None:
+        query = query.where('priority_score', '>=', min_priority)
+    if max_priority is not None:
+        query = query.where('priority_score', '<=', max_priority)
+    query = query.order_by('priority_score', direction=firestore.Query.DESCENDING)
+    
+    rows = (serialize_entry(doc.to_dict()) for doc in stream_pages(query))
+    if format == "ndjson":
+        body = (json.dumps(row) + "\n" for row in rows)
+        media_type = "application/x-ndjson"
+    else:
+        body = csv_lines(rows)
+        media_type = "text/csv"
+    
+    filename = f"waitlist-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.{format}"
+    return StreamingResponse(body, media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@router.get("/segments")
+def get_segment_counts():
+    """
+    Get entry counts per tag, person type and budget from the precomputed segment counters.
+    
+    'seeded' is false until /jobs/migrate-waitlist-ids has counted the entries from
+    before the counters existed; until then only later joins are included.
+    """
+    try:
+        counts = read_segment_counts()
+        return {
+            "total": counts.get('total', 0),
+            "tags": counts.get('tags', {}),
+            "person_type": counts.get('person_type', {}),
+            "budget": counts.get('budget', {}),
+            "seeded": counts.get('seeded', False)
+        }
+    except Exception as e:
+        print(f"Error getting waitlist segments: {e}")
+        raise HTTPException(status_code=500, detail="Failed to get waitlist segments")
+
+@router.get("/segments/{tag}", dependencies=[Depends(verify_job_token)])
+def get_segment_entries(tag: str, limit: int = 50, status: str = None, min_priority: int = None, cursor: str = None):
+    """
+    Get the highest priority entries carrying a tag, e.g. 'time-pressed-executive'.
+    
+    Pass the returned next_cursor as cursor to get the following page.
+    """
+    try:
+        limit = max(1, min(limit, 500))
+        query = db.collection('waitlist').where('tags', 'array_contains', tag)
+        if status:
+            query = query.where('status', '==', status)
+        if min_priority is not None:
+            query = query.where('priority_score', '>=', min_priority)
+        query = query.order_by('priority_score', direction=firestore.Query.DESCENDING)
+        
+        if cursor:
+            cursor_doc = db.collection('waitlist').document(cursor).get()
+            if not cursor_doc.exists:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            query = query.start_after(cursor_doc)
+        
+        docs = list(query.limit(limit).stream())
+        entries = [serialize_entry(doc.to_dict()) for doc in docs]
+        
+        return {
+            "tag": tag,
+            "entries": entries,
+            "count": len(entries),
+            "next_cursor": docs[-1].id if len(docs) == limit else None
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error getting waitlist segment {tag}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to get waitlist segment")
+
 @router.put("/entries/{waitlist_id}/status")
 def update_waitlist_status(waitlist_id: str, status: str = Body(...)):
     """Update waitlist entry status"""
@@ -147,6 +283,213 @@ def update_waitlist_status(waitlist_id: str, status: str = Body(...)):
         print(f"Error updating waitlist status: {e}")
         raise HTTPException(status_code=500, detail="Failed to update status")
 
+def stream_pages(query, page_size: int = EXPORT_PAGE_SIZE):
+    """Yield every document matching a query, fetching one page at a time with cursors"""
+    last_doc = None
+    while True:
+        page = query.start_after(last_doc) if last_doc else query
+        docs = list(page.limit(page_size).stream())
+        yield from docs
+        if len(docs) < page_size:
+            return
+        last_doc = docs[-1]
+
+def serialize_entry(data: dict) -> dict:
+    """Convert a waitlist document into JSON-safe export columns"""
+    row = {column: data.get(column) for column in EXPORT_COLUMNS}
+    if isinstance(row['joined_at'], datetime):
+        row['joined_at'] = row['joined_at'].isoformat()
+    return row
+
+def csv_lines(rows):
+    """Yield a CSV header and one CSV line per row"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow({**row, 'tags': ';'.join(row['tags'] or [])})
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+def normalize_email(email: str) -> str:
+    return email.strip().lower()
+
+def waitlist_id_for_email(normalized_email: str) -> str:
+    """Deterministic waitlist document ID for an email"""
+    return hashlib.sha256(normalized_email.encode()).hexdigest()
+
+@firestore.transactional
+def insert_entry(transaction, waitlist_entry: dict, submitted_email: str):
+    """
+    Write a new waitlist entry and count it in a segment shard.
+    Raises AlreadyRegistered if the email is already on the waitlist.
+    """
+    doc_ref = db.collection('waitlist').document(waitlist_entry["id"])
+    entry_doc = doc_ref.get(transaction=transaction)
+    sequence_doc = sequence_ref.get(transaction=transaction)
+    sequence_data = sequence_doc.to_dict() if sequence_doc.exists else {}
+    
+    if entry_doc.exists:
+        raise AlreadyRegistered()
+    if sequence_data.get('legacy_entries', True):
+        # Entries from before email-keyed IDs can only be found by querying, with the case they were
+        # submitted in, until /jobs/migrate-waitlist-ids has re-keyed them and cleared the flag
+        emails = list({submitted_email, waitlist_entry["email"]})
+        legacy_query = db.collection('waitlist').where('email', 'in', emails).limit(1)
+        if list(transaction.get(legacy_query)):
+            raise AlreadyRegistered()
+    
+    transaction.set(doc_ref, waitlist_entry)
+    transaction.set(segment_shard_ref(random.randrange(SEGMENT_SHARDS)), segment_increments(waitlist_entry), merge=True)
+
+def segment_shard_ref(shard: int):
+    return segments_ref.collection('shards').document(str(shard))
+
+def segment_increments(entry: dict, sign: int = 1) -> dict:
+    """Segment counter increments that add (sign=1) or remove (sign=-1) an entry"""
+    return {
+        'total': firestore.Increment(sign),
+        'tags': {tag: firestore.Increment(sign) for tag in entry.get('tags', [])},
+        'person_type': {entry.get('person_type') or 'unknown': firestore.Increment(sign)},
+        'budget': {entry.get('budget') or 'unknown': firestore.Increment(sign)},
+        'updated_at': datetime.utcnow()
+    }
+
+def read_segment_counts() -> dict:
+    """Sum the seeded segments document and its shards; 'seeded' tells whether the segments document exists"""
+    counts = {'total': 0, 'tags': {}, 'person_type': {}, 'budget': {}, 'seeded': False}
+    refs = [segments_ref] + [segment_shard_ref(shard) for shard in range(SEGMENT_SHARDS)]
+    for doc in db.get_all(refs):
+        if not doc.exists:
+            continue
+        if doc.reference.path == segments_ref.path:
+            counts['seeded'] = True
+        data = doc.to_dict()
+        counts['total'] += data.get('total', 0)
+        for field in SEGMENT_FIELDS:
+            for value, count in data.get(field, {}).items():
+                counts[field][value] = counts[field].get(value, 0) + count
+    return counts
+
+@firestore.transactional
+def rekey_legacy_entry(transaction, legacy_ref) -> str:
+    """
+    Move an entry from before email-keyed IDs to the ID of its normalized email.
+    
+    If that ID is already taken (the same email joined again with different
+    case), the earlier signup is kept there and the other one is removed from
+    the waitlist and its segment counts (if it was counted yet).
+    
+    Returns:
+        str: 'moved', 'merged' or 'skipped' (already keyed, deleted or without an email).
+    """
+    legacy_doc = legacy_ref.get(transaction=transaction)
+    data = legacy_doc.to_dict() if legacy_doc.exists else {}
+    if not data.get('email'):
+        return 'skipped'
+    normalized_email = normalize_email(data['email'])
+    entry_ref = db.collection('waitlist').document(waitlist_id_for_email(normalized_email))
+    if entry_ref.id == legacy_ref.id:
+        return 'skipped'
+    
+    entry_doc = entry_ref.get(transaction=transaction)
+    segments_doc = segments_ref.get(transaction=transaction)
+    moved = {**data, 'id': entry_ref.id, 'email': normalized_email}
+    transaction.delete(legacy_ref)
+    if not entry_doc.exists:
+        transaction.set(entry_ref, moved)
+        return 'moved'
+    
+    existing = entry_doc.to_dict()
+    if data.get('joined_at') and (not existing.get('joined_at') or data['joined_at'] < existing['joined_at']):
+        transaction.set(entry_ref, moved)
+        removed = existing
+    else:
+        removed = data
+    # Unflagged entries are only counted once seeded, which happens after the last page of this migration
+    if removed.get('segment_counted') or segments_doc.exists:
+        transaction.set(segment_shard_ref(random.randrange(SEGMENT_SHARDS)), segment_increments(removed, -1), merge=True)
+    return 'merged'
+
+def migrate_legacy_entries(cursor: str = None, page_size: int = 200) -> dict:
+    """
+    Re-key one page of entries to their normalized-email IDs, ordered by document ID.
+    
+    Once the last page is done, joins stop querying for legacy entries by email,
+    duplicate checks are case-insensitive for every entry, and the segment
+    counts are seeded.
+    
+    Returns:
+        dict: 'scanned', 'moved' and 'merged' counts, the next 'cursor', 'done' and
+            'seeded' (entries counted into the segments document on this call).
+    """
+    waitlist_ref = db.collection('waitlist')
+    doc_id_field = firestore.FieldPath.document_id()
+    query = waitlist_ref.order_by(doc_id_field).select(['email'])
+    if cursor:
+        query = query.where(doc_id_field, '>', waitlist_ref.document(cursor))
+    docs = list(query.limit(page_size).stream())
+    
+    results = {'moved': 0, 'merged': 0, 'skipped': 0}
+    for doc in docs:
+        email = (doc.to_dict() or {}).get('email')
+        if email and doc.id != waitlist_id_for_email(normalize_email(email)):
+            results[rekey_legacy_entry(db.transaction(), doc.reference)] += 1
+    
+    done = len(docs) < page_size
+    seeded = 0
+    if done:
+        sequence_ref.set({'legacy_entries': False, 'updated_at': datetime.utcnow()}, merge=True)
+        seeded = seed_segment_counts()
+    return {
+        "scanned": len(docs),
+        "moved": results['moved'],
+        "merged": results['merged'],
+        "cursor": docs[-1].id if docs else cursor,
+        "done": done,
+        "seeded": seeded
+    }
+
+def seed_segment_counts() -> int:
+    """
+    Count entries that joins did not count into the shards into the segments document, if it does not exist yet.
+    
+    Entries that join during the scan are flagged and counted by their own
+    join, so each entry is counted exactly once.
+    
+    Returns:
+        int: Entries counted (0 if the segments document already existed).
+    """
+    if segments_ref.get().exists:
+        return 0
+    counts = {'total': 0, 'tags': {}, 'person_type': {}, 'budget': {}}
+    for doc in db.collection('waitlist').select(SEGMENT_FIELDS + ['segment_counted']).stream():
+        data = doc.to_dict()
+        if data.get('segment_counted'):
+            continue
+        counts['total'] += 1
+        for tag in data.get('tags', []):
+            counts['tags'][tag] = counts['tags'].get(tag, 0) + 1
+        for field in ('person_type', 'budget'):
+            value = data.get(field) or 'unknown'
+            counts[field][value] = counts[field].get(value, 0) + 1
+    
+    @firestore.transactional
+    def initialize(transaction):
+        if segments_ref.get(transaction=transaction).exists:
+            return 0
+        transaction.set(segments_ref, {**counts, 'updated_at': datetime.utcnow()})
+        return counts['total']
+    
+    return initialize(db.transaction())
+
+def count_entries(query) -> int:
+    """Count the documents matching a query with a count() aggregation"""
+    result = query.count(alias='count').get()
+    return int(result[0][0].value)
+
 def calculate_priority_score(person_type: str, budget: str, current_situation: str) -> int:
     """Calculate priority score for waitlist entry"""
     score = 0
@@ -194,25 +537,22 @@ def generate_tags(person_type: str, activity_level: str, current_situation: str,
     return list(set(tags))  # Remove duplicates
 
 def get_waitlist_position(waitlist_id: str) -> int:
-    """Get position in waitlist based on join date"""
+    """Get position in waitlist from the entry's assigned position, estimating it until the job numbers the entry"""
     try:
         # Get the entry
-        doc = db.collection('waitlist').document(waitlist_id).get()
+        doc = db.collection('waitlist').document(waitlist_id).get(field_paths=['position', 'joined_at'])
         if not doc.exists:
             return -1
         
         entry_data = doc.to_dict()
-        joined_at = entry_data.get('joined_at')
+        if entry_data.get('position'):
+            return entry_data['position']
         
+        joined_at = entry_data.get('joined_at')
         if not joined_at:
             return -1
-        
-        # Count entries that joined before this one
-        earlier_entries = db.collection('waitlist').where('joined_at', '<', joined_at).stream()
-        position = len(list(earlier_entries)) + 1
-        
-        return position
+        return unassigned_position(joined_at)
         
     except Exception as e:
         print(f"Error calculating waitlist position: {e}")
-        return -1
\ No newline at end of file
+        return -1
@@ -1,19 +1,82 @@
 from fastapi import Request, HTTPException, status
-from firebase_admin import auth, credentials, initialize_app
-import firebase_admin
+from firebase_admin import auth
+import hashlib
+import hmac
+import threading
+import time
+from collections import OrderedDict
+from app.core.config import JOB_SECRET
 
-# Initialize Firebase Admin SDK (should be called once)
-if not firebase_admin._apps:
-    cred = credentials.Certificate('path/to/serviceAccountKey.json')  # Update with your key path
-    initialize_app(cred)
+# The default Firebase Admin app is initialized by app.services.firebase_service from FIREBASE_KEY_PATH
+
+# Verified ID tokens, keyed by SHA-256 of the raw token, kept until the token's own expiry
+MAX_CACHED_TOKENS = 10000
+_token_cache = OrderedDict()
+_token_cache_lock = threading.Lock()
+
+def _cached_token(token_hash: str):
+    with _token_cache_lock:
+        entry = _token_cache.get(token_hash)
+        if entry is None:
+            return None
+        decoded_token, expires_at = entry
+        if expires_at <= time.time():
+            del _token_cache[token_hash]
+            return None
+        _token_cache.move_to_end(token_hash)
+        return decoded_token
+
+def _cache_token(token_hash: str, decoded_token: dict):
+    with _token_cache_lock:
+        _token_cache[token_hash] = (decoded_token, decoded_token.get('exp', 0))
+        _token_cache.move_to_end(token_hash)
+        while len(_token_cache) > MAX_CACHED_TOKENS:
+            _token_cache.popitem(last=False)
 
 def verify_firebase_token(request: Request):
     auth_header = request.headers.get('Authorization')
     if not auth_header:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing auth header")
     token = auth_header.split('Bearer ')[-1]
+    
+    # Repeat calls with a token that was already verified skip signature checks until it expires
+    token_hash = hashlib.sha256(token.encode()).hexdigest()
+    decoded_token = _cached_token(token_hash)
+    if decoded_token is not None:
+        return decoded_token
+    
     try:
         decoded_token = auth.verify_id_token(token)
-        return decoded_token
     except Exception:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+    _cache_token(token_hash, decoded_token)
+    return decoded_token
+
+def prewarm_token_verifier():
+    """
+    Fetch Google's ID token signing certificates ahead of the first request.
+
+    The Admin SDK caches the certificates in its HTTP session according to
+    their Cache-Control headers, so warming it at startup keeps the first
+    authenticated request from paying for the download. Best-effort: failures
+    only mean the first verification fetches them instead.
+
+    The SDK has no public hook for its certificate session, so this reaches the
+    token verifier of the default app's auth client, which is why
+    requirements.txt pins firebase-admin to 7.x. The fetch itself is a plain
+    GET through that verifier's google-auth transport request.
+    """
+    try:
+        token_verifier = auth._get_client(None)._token_verifier
+        response = token_verifier.request(token_verifier.id_token_verifier.cert_url, method='GET')
+        if response.status != 200:
+            raise ValueError(f"certificate endpoint returned HTTP {response.status}")
+    except Exception as e:
+        print(f"Could not pre-warm ID token certificates: {e}")
+
+def verify_job_token(request: Request):
+    """Allow scheduled batch jobs only when the caller presents the configured job secret."""
+    if not JOB_SECRET:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Job secret not configured")
+    if not hmac.compare_digest(request.headers.get('X-Job-Token', ''), JOB_SECRET):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid job token")
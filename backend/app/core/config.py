@@ -4,3 +4,6 @@ from dotenv import load_dotenv
 load_dotenv()
 
 FIREBASE_KEY_PATH = os.getenv('FIREBASE_KEY_PATH', 'path/to/serviceAccountKey.json')
+
+# Shared secret sent by Cloud Scheduler in the X-Job-Token header to trigger batch jobs
+JOB_SECRET = os.getenv('JOB_SECRET')
@@ -1,5 +1,10 @@
-from fastapi import FastAPI
-from app.api import users, recipes, suggestions, waitlist, goals, workouts, routines
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from app.api import users, recipes, suggestions, waitlist, goals, workouts, routines, jobs
+from app.services.firebase_service import db
+from app.services.write_pipeline import begin_request_pipeline, end_request_pipeline, flush_due_backfills
+from app.core.auth import prewarm_token_verifier
 from fastapi.middleware.cors import CORSMiddleware
 
 app = FastAPI()
@@ -12,6 +17,28 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def warm_auth_certificates():
+    await run_in_threadpool(prewarm_token_verifier)
+
+@app.middleware("http")
+async def flush_request_writes(request: Request, call_next):
+    """Commit writes deferred during the request before its response is sent."""
+    writes, token = begin_request_pipeline(db)
+    try:
+        response = await call_next(request)
+    finally:
+        end_request_pipeline(token)
+    failures = await run_in_threadpool(writes.flush)
+    # Background threads get no CPU between requests on Cloud Run, so due backfills are committed here
+    await run_in_threadpool(flush_due_backfills)
+    if failures:
+        # The endpoint reported success for writes that were not saved
+        for e in failures:
+            print(f"Error flushing deferred writes for {request.url.path}: {e}")
+        return JSONResponse(status_code=500, content={"detail": "Failed to save changes"})
+    return response
+
 # Include routers for modular features
 app.include_router(users.router)
 app.include_router(recipes.router)
@@ -20,6 +47,7 @@ app.include_router(waitlist.router)
 app.include_router(goals.router)
 app.include_router(workouts.router)
 app.include_router(routines.router)
+app.include_router(jobs.router)
 
 @app.get('/')
 def root():
@@ -0,0 +1,87 @@
+"""
+Yearly activity heatmap aggregation.
+
+Builds a GitHub-style calendar of per-day activity for a whole year from
+sparse date-keyed water and workout records. Aggregation is vectorized with
+NumPy so a full year is computed in a single pass over fixed-size arrays.
+"""
+
+from collections import OrderedDict
+from datetime import date
+from typing import Dict
+
+import numpy as np
+
+from .date_arrays import daily_totals, parse_days
+
+# Number of intensity levels above zero (0 = no activity, 4 = full day)
+INTENSITY_LEVELS = 4
+
+# Glasses of water that count as a "full" hydration day
+DEFAULT_WATER_GOAL = 8
+
+# Finished-year heatmaps kept in memory, most recently used last
+MAX_CACHED_HEATMAPS = 2048
+
+
+def build_year_heatmap(year: int, water_by_date: Dict[str, float], workouts_by_date: Dict[str, float],
+                       water_goal: float = DEFAULT_WATER_GOAL) -> dict:
+    """
+    Aggregate water and workout records into per-day intensity for a year.
+
+    Intensity combines how much of the daily water goal was reached with
+    whether a workout was logged, quantized to 0-4 for heatmap colouring.
+
+    Args:
+        year: The calendar year to build.
+        water_by_date: Mapping of 'YYYY-MM-DD' to glasses of water logged that day.
+        workouts_by_date: Mapping of 'YYYY-MM-DD' to workout minutes logged that day.
+        water_goal: Glasses of water that count as a full hydration day.
+
+    Returns:
+        dict: Compact heatmap with 'year', 'start_date', 'days' and parallel
+              per-day arrays 'intensity', 'water' and 'workouts'
+              (index 0 = January 1st).
+    """
+    num_days = (date(year + 1, 1, 1) - date(year, 1, 1)).days
+
+    start = f'{year}-01-01'
+    water = daily_totals(parse_days(water_by_date.keys()), list(water_by_date.values()), start, num_days)
+    workout_days = parse_days(workouts_by_date.keys())
+    workouts = (daily_totals(workout_days, np.ones(len(workout_days)), start, num_days) > 0).astype(np.int64)
+
+    water_level = np.clip(water / water_goal, 0.0, 1.0) if water_goal > 0 else np.zeros(num_days)
+    combined = (water_level + workouts) / 2.0
+    intensity = np.ceil(combined * INTENSITY_LEVELS).astype(np.int64)
+
+    return {
+        'year': year,
+        'start_date': f'{year}-01-01',
+        'days': num_days,
+        'intensity': intensity.tolist(),
+        'water': np.round(water, 2).tolist(),
+        'workouts': workouts.tolist(),
+        'active_days': int(np.count_nonzero(intensity)),
+        'workout_days': int(workouts.sum()),
+        'total_water': round(float(water.sum()), 2)
+    }
+
+
+class HeatmapCache:
+    """LRU cache of heatmaps for finished years, which never change once computed."""
+
+    def __init__(self, max_entries: int = MAX_CACHED_HEATMAPS):
+        self._entries = OrderedDict()
+        self._max_entries = max_entries
+
+    def get(self, key: tuple):
+        heatmap = self._entries.get(key)
+        if heatmap is not None:
+            self._entries.move_to_end(key)
+        return heatmap
+
+    def put(self, key: tuple, heatmap: dict):
+        self._entries[key] = heatmap
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
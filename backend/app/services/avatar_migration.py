@@ -0,0 +1,198 @@
+"""
+Resumable background migration that fixes missing or generated user avatars.
+
+Pages through the users collection in document-ID order, looks up Firebase
+Auth records in batches of 100 (auth.get_users), prefers Google photos and
+falls back to a generated avatar. Updates are committed through the batched
+write pipeline, and after each page the cursor and counters are checkpointed
+to jobs/fix_avatars so an interrupted run resumes where it stopped.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from firebase_admin import auth, firestore
+
+from .firebase_service import db, FirestoreUserService
+from .timezone_utils import get_utc_now, get_utc_now_iso, iso_to_utc_datetime
+from .write_pipeline import WritePipeline
+
+PAGE_SIZE = 300
+
+# auth.get_users accepts at most 100 identifiers per call
+AUTH_LOOKUP_BATCH = 100
+MAX_PARALLEL_LOOKUPS = 4
+
+# A running job that has not checkpointed for this long is considered dead and may be resumed
+STALE_AFTER = timedelta(minutes=5)
+
+GENERATED_AVATAR_HOST = 'ui-avatars.com'
+
+_state_ref = db.collection('jobs').document('fix_avatars')
+
+
+def _initial_state() -> dict:
+    return {
+        'status': 'idle',
+        'cursor': None,
+        'processed': 0,
+        'google_photos_restored': 0,
+        'fallback_avatars_generated': 0,
+        'started_at': None,
+        'updated_at': None,
+        'completed_at': None,
+        'error': None
+    }
+
+
+def get_migration_state() -> dict:
+    """
+    Get the current progress of the avatar migration.
+
+    Returns:
+        dict: Job state with status, cursor and counters.
+    """
+    doc = _state_ref.get()
+    state = _initial_state()
+    if doc.exists:
+        state.update(doc.to_dict())
+    return state
+
+
+def _is_stale(state: dict) -> bool:
+    updated_at = iso_to_utc_datetime(state.get('updated_at') or '')
+    return not updated_at or get_utc_now() - updated_at > STALE_AFTER
+
+
+@firestore.transactional
+def _claim(transaction, restart: bool):
+    snapshot = _state_ref.get(transaction=transaction)
+    state = _initial_state()
+    if snapshot.exists:
+        state.update(snapshot.to_dict())
+
+    if state['status'] == 'running' and not _is_stale(state):
+        return state, False
+
+    if restart or state['status'] == 'completed':
+        state = _initial_state()
+
+    now_utc_iso = get_utc_now_iso()
+    state.update({
+        'status': 'running',
+        'started_at': state.get('started_at') or now_utc_iso,
+        'updated_at': now_utc_iso,
+        'error': None
+    })
+    transaction.set(_state_ref, state)
+    return state, True
+
+
+def start_avatar_migration(restart: bool = False) -> tuple:
+    """
+    Claim the migration job so only one worker runs it at a time.
+
+    Resumes from the last checkpoint unless restart is True or the previous
+    run completed.
+
+    Args:
+        restart: Start again from the first user instead of the saved cursor.
+
+    Returns:
+        tuple: (job state, whether the caller claimed the job and should run it)
+    """
+    return _claim(db.transaction(), restart)
+
+
+def _lookup_auth_users(emails: list) -> dict:
+    """Look up Firebase Auth records for up to AUTH_LOOKUP_BATCH emails, keyed by lowercase email."""
+    result = auth.get_users([auth.EmailIdentifier(email) for email in emails])
+    return {user.email.lower(): user for user in result.users if user.email}
+
+
+def _fetch_auth_users(emails: list) -> dict:
+    chunks = [emails[i:i + AUTH_LOOKUP_BATCH] for i in range(0, len(emails), AUTH_LOOKUP_BATCH)]
+    auth_users = {}
+    with ThreadPoolExecutor(max_workers=MAX_PARALLEL_LOOKUPS) as executor:
+        for found in executor.map(_lookup_auth_users, chunks):
+            auth_users.update(found)
+    return auth_users
+
+
+def _migrate_page(user_docs: list, service: FirestoreUserService) -> dict:
+    """Fix avatars for one page of users, returning the page's counters."""
+    candidates = []
+    for user_doc in user_docs:
+        data = user_doc.to_dict()
+        avatar = data.get('avatar')
+        if not avatar or GENERATED_AVATAR_HOST in avatar:
+            candidates.append((user_doc.id, data))
+
+    emails = sorted({data['email'] for _, data in candidates if data.get('email')})
+    auth_users = {}
+    if emails:
+        try:
+            auth_users = _fetch_auth_users(emails)
+        except Exception as e:
+            print(f"[AVATARS] Could not get Firebase Auth data for page: {e}")
+
+    counts = {'google_photos_restored': 0, 'fallback_avatars_generated': 0}
+    users_ref = db.collection('users')
+    with WritePipeline(db) as writes:
+        for user_id, data in candidates:
+            auth_user = auth_users.get((data.get('email') or '').lower())
+            if auth_user and auth_user.photo_url:
+                # User has Google photo, use it
+                writes.update(users_ref.document(user_id), {'avatar': auth_user.photo_url})
+                counts['google_photos_restored'] += 1
+            elif not data.get('avatar'):
+                fallback_avatar = service.generate_avatar_url(data.get('name', ''), data.get('username', ''))
+                writes.update(users_ref.document(user_id), {'avatar': fallback_avatar})
+                counts['fallback_avatars_generated'] += 1
+    return counts
+
+
+def run_avatar_migration(state: dict) -> dict:
+    """
+    Run (or resume) the avatar migration from the state's cursor until all users are processed.
+
+    Args:
+        state: Job state returned by start_avatar_migration.
+
+    Returns:
+        dict: Final job state.
+    """
+    service = FirestoreUserService()
+    users_ref = db.collection('users')
+    doc_id_field = firestore.FieldPath.document_id()
+
+    try:
+        while True:
+            query = users_ref.order_by(doc_id_field).select(['email', 'avatar', 'name', 'username'])
+            if state['cursor']:
+                query = query.where(doc_id_field, '>', users_ref.document(state['cursor']))
+            user_docs = list(query.limit(PAGE_SIZE).stream())
+            if not user_docs:
+                break
+
+            counts = _migrate_page(user_docs, service)
+
+            # Checkpoint after the page's writes are committed so a resume never skips users
+            state['cursor'] = user_docs[-1].id
+            state['processed'] += len(user_docs)
+            state['google_photos_restored'] += counts['google_photos_restored']
+            state['fallback_avatars_generated'] += counts['fallback_avatars_generated']
+            state['updated_at'] = get_utc_now_iso()
+            _state_ref.set(state)
+
+            if len(user_docs) < PAGE_SIZE:
+                break
+
+        state.update({'status': 'completed', 'completed_at': get_utc_now_iso(), 'updated_at': get_utc_now_iso()})
+        print(f"[AVATARS] Migration completed: {state['processed']} users processed")
+    except Exception as e:
+        print(f"[AVATARS] Migration failed at cursor {state['cursor']}: {e}")
+        state.update({'status': 'failed', 'error': str(e), 'updated_at': get_utc_now_iso()})
+
+    _state_ref.set(state)
+    return state
@@ -0,0 +1,161 @@
+"""
+Scheduled daily rollover at each timezone's local midnight.
+
+Meant to be triggered every 15 minutes (e.g. by Cloud Scheduler via
+POST /jobs/daily-rollover), so zones with half- and quarter-hour offsets roll
+over shortly after their midnight too. Each run picks the zones whose local
+date has changed since their last rollover, reads the water sessions and
+streaks of their users in batched reads, and only opens a transaction for
+users with a session left over from a previous day or a streak that lapsed
+yesterday. Zones are recorded as completed in jobs/daily_rollover only when
+all their users rolled over; a zone with failures is retried on the next run,
+which is safe because a user's rollover is a no-op once applied.
+
+Users are selected by their stored timezone, so every user needs a valid IANA
+name: update_user only stores valid zones and POST /jobs/backfill-timezones
+fills in 'UTC' for older users without one.
+
+Daily water totals live in per-date water_logs documents, so a new day starts
+at zero without any write; request paths no longer check for day boundaries.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from zoneinfo import available_timezones
+
+from .firebase_service import db, FirestoreUserService
+from .timezone_utils import get_local_day_bounds, get_utc_now, get_utc_now_iso
+
+# Users rolled over concurrently (each one runs a small transaction)
+MAX_PARALLEL_USERS = 8
+
+# Firestore limit on values per 'in' filter
+IN_FILTER_LIMIT = 30
+
+# Documents requested per batched read
+GET_ALL_CHUNK = 300
+
+
+def due_timezone_buckets(now_utc: datetime, completed_zones: dict) -> dict:
+    """
+    Group timezones whose local day has started since their last rollover by that day.
+
+    Args:
+        now_utc: Current time as a timezone-aware UTC datetime.
+        completed_zones: Mapping of zone name to the last rolled-over local date ('YYYY-MM-DD').
+
+    Returns:
+        dict: Mapping of local date string to the list of zone names due for that day.
+    """
+    buckets = {}
+    for zone_name in sorted(available_timezones()):
+        local_today = get_local_day_bounds(zone_name, now_utc)[0]
+        if completed_zones.get(zone_name) == local_today:
+            continue
+        buckets.setdefault(local_today, []).append(zone_name)
+    return buckets
+
+
+def find_rollover_candidates(user_ids: list, today: str) -> list:
+    """
+    Find users with day-boundary work, reading their sessions and streaks in bulk.
+
+    Args:
+        user_ids: Firebase IDs of users whose local date is today.
+        today: The users' local date ('YYYY-MM-DD').
+
+    Returns:
+        list: IDs of users with a water session from an earlier day or a lapsed streak.
+    """
+    yesterday = (datetime.strptime(today, '%Y-%m-%d').date() - timedelta(days=1)).strftime('%Y-%m-%d')
+    users_ref = db.collection('users')
+
+    refs = []
+    for user_id in user_ids:
+        user_ref = users_ref.document(user_id)
+        refs.append(user_ref.collection('water_session').document('current'))
+        refs.extend(user_ref.collection('streaks').document(streak_type)
+                    for streak_type in FirestoreUserService.STREAK_TYPES)
+
+    candidates = set()
+    for i in range(0, len(refs), GET_ALL_CHUNK):
+        for snapshot in db.get_all(refs[i:i + GET_ALL_CHUNK]):
+            if not snapshot.exists:
+                continue
+            data = snapshot.to_dict()
+            if snapshot.reference.parent.id == 'water_session':
+                due = (data.get('date') or today) < today
+            else:
+                due = data.get('current_streak', 0) > 0 and (data.get('last_logged_date') or today) < yesterday
+            if due:
+                candidates.add(snapshot.reference.parent.parent.id)
+    return [user_id for user_id in user_ids if user_id in candidates]
+
+
+def _roll_over_user(service: FirestoreUserService, user_id: str, today: str):
+    """Apply one user's rollover, returning its counts or None on failure."""
+    try:
+        return service.apply_daily_rollover(user_id, today)
+    except Exception as e:
+        print(f"[ROLLOVER] Failed to roll over {today} for user {user_id}: {e}")
+        return None
+
+
+def run_daily_rollover(now_utc: datetime = None) -> dict:
+    """
+    Roll over every user whose local day has started since the last run.
+
+    Args:
+        now_utc: Time to evaluate zones at (defaults to now).
+
+    Returns:
+        dict: Run statistics with 'days', 'zones', 'users', 'rolled_over',
+            'sessions_closed', 'streaks_broken' and 'failed' counts.
+    """
+    now_utc = now_utc or get_utc_now()
+    service = FirestoreUserService()
+
+    state_ref = db.collection('jobs').document('daily_rollover')
+    state_doc = state_ref.get()
+    completed_zones = state_doc.to_dict().get('completed_zones', {}) if state_doc.exists else {}
+
+    buckets = due_timezone_buckets(now_utc, completed_zones)
+    stats = {'days': len(buckets), 'zones': 0, 'users': 0, 'rolled_over': 0,
+             'sessions_closed': 0, 'streaks_broken': 0, 'failed': 0}
+    newly_completed = {}
+
+    for today, zones in buckets.items():
+        user_zones = {}
+        for i in range(0, len(zones), IN_FILTER_LIMIT):
+            query = (db.collection('users')
+                     .where('timezone', 'in', zones[i:i + IN_FILTER_LIMIT])
+                     .select(['timezone']))
+            user_zones.update((doc.id, doc.get('timezone')) for doc in query.stream())
+
+        candidates = find_rollover_candidates(list(user_zones), today)
+        with ThreadPoolExecutor(max_workers=MAX_PARALLEL_USERS) as executor:
+            results = list(executor.map(lambda user_id: _roll_over_user(service, user_id, today), candidates))
+
+        failed_zones = set()
+        for user_id, result in zip(candidates, results):
+            if result is None:
+                stats['failed'] += 1
+                failed_zones.add(user_zones[user_id])
+                continue
+            stats['rolled_over'] += 1
+            stats['sessions_closed'] += result['sessions_closed']
+            stats['streaks_broken'] += result['streaks_broken']
+        stats['zones'] += len(zones)
+        stats['users'] += len(user_zones)
+        for zone_name in zones:
+            if zone_name not in failed_zones:
+                newly_completed[zone_name] = today
+
+    if newly_completed:
+        state_ref.set({
+            'completed_zones': newly_completed,
+            'last_run_at': get_utc_now_iso()
+        }, merge=True)
+
+    print(f"[ROLLOVER] Daily rollover finished: {stats}")
+    return stats
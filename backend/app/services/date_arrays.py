@@ -0,0 +1,149 @@
+"""
+Vectorized calendar arithmetic on NumPy datetime64[D] arrays.
+
+Dates throughout the app are 'YYYY-MM-DD' strings (document IDs and fields);
+these helpers convert them to day arrays once so ranges, weekday and week
+calculations, and per-day totals run as array operations instead of
+per-day strftime/strptime loops.
+
+Local days for UTC timestamps are computed from the zone's UTC offset at each
+UTC midnight in the covered span; only timestamps on days where the offset
+changes (DST transitions) are resolved individually.
+"""
+
+from datetime import datetime, tzinfo
+
+import numpy as np
+
+SECONDS_PER_DAY = 86400
+
+# 1970-01-01 was a Thursday, so (day number + 3) % 7 is the weekday with Monday = 0
+_EPOCH_WEEKDAY_SHIFT = 3
+
+
+def parse_days(date_strings) -> np.ndarray:
+    """
+    Convert 'YYYY-MM-DD' strings to a datetime64[D] array.
+
+    Args:
+        date_strings: Iterable of date strings. Strings that are not dates become NaT.
+
+    Returns:
+        np.ndarray: datetime64[D] days, in input order.
+    """
+    date_strings = list(date_strings)
+    try:
+        return np.array(date_strings, dtype='datetime64[D]')
+    except ValueError:
+        return np.array([_parse_day(value) for value in date_strings], dtype='datetime64[D]')
+
+
+def _parse_day(value) -> np.datetime64:
+    try:
+        return np.datetime64(value, 'D')
+    except ValueError:
+        return np.datetime64('NaT', 'D')
+
+
+def days_to_strings(days: np.ndarray) -> list:
+    """Format a datetime64[D] array as 'YYYY-MM-DD' strings."""
+    return np.datetime_as_string(np.asarray(days, dtype='datetime64[D]'), unit='D').tolist()
+
+
+def days_ending(end, count: int) -> np.ndarray:
+    """
+    Get the `count` consecutive days ending at `end`, oldest first.
+
+    Args:
+        end: Last day (date, 'YYYY-MM-DD' or datetime64).
+        count: Number of days.
+
+    Returns:
+        np.ndarray: datetime64[D] days.
+    """
+    end = np.datetime64(end, 'D')
+    return end - np.arange(max(count, 0) - 1, -1, -1)
+
+
+def weekdays(days: np.ndarray) -> np.ndarray:
+    """Weekday of each day, Monday = 0 through Sunday = 6."""
+    return (np.asarray(days, dtype='datetime64[D]').astype(np.int64) + _EPOCH_WEEKDAY_SHIFT) % 7
+
+
+def week_starts(days: np.ndarray) -> np.ndarray:
+    """Monday of each day's week."""
+    days = np.asarray(days, dtype='datetime64[D]')
+    return days - weekdays(days).astype('timedelta64[D]')
+
+
+def iso_weeks(days: np.ndarray) -> tuple:
+    """
+    ISO 8601 week-numbering year and week of each day.
+
+    Args:
+        days: datetime64[D] array.
+
+    Returns:
+        tuple: (years, weeks) integer arrays.
+    """
+    # The Thursday of a day's week decides which year the week belongs to
+    thursdays = week_starts(days) + np.timedelta64(3, 'D')
+    years = thursdays.astype('datetime64[Y]')
+    weeks = (thursdays - years.astype('datetime64[D]')).astype(np.int64) // 7 + 1
+    return years.astype(np.int64) + 1970, weeks
+
+
+def _utc_offset_seconds(tz: tzinfo, epoch_seconds: int) -> int:
+    return int(datetime.fromtimestamp(int(epoch_seconds), tz).utcoffset().total_seconds())
+
+
+def local_days(epoch_seconds, tz: tzinfo) -> np.ndarray:
+    """
+    Map UTC timestamps to the local calendar day in a timezone.
+
+    Args:
+        epoch_seconds: Array of UTC timestamps in seconds.
+        tz: The timezone.
+
+    Returns:
+        np.ndarray: datetime64[D] local day of each timestamp.
+    """
+    epochs = np.floor(np.asarray(epoch_seconds, dtype=np.float64)).astype(np.int64)
+    if epochs.size == 0:
+        return np.array([], dtype='datetime64[D]')
+
+    first_day = epochs.min() // SECONDS_PER_DAY
+    midnights = np.arange(first_day, epochs.max() // SECONDS_PER_DAY + 2) * SECONDS_PER_DAY
+    midnight_offsets = np.array([_utc_offset_seconds(tz, t) for t in midnights], dtype=np.int64)
+
+    day_index = epochs // SECONDS_PER_DAY - first_day
+    offsets = midnight_offsets[day_index]
+    # A different offset at the next UTC midnight means a transition happened that day
+    changed = np.flatnonzero(offsets != midnight_offsets[day_index + 1])
+    if changed.size:
+        offsets[changed] = [_utc_offset_seconds(tz, t) for t in epochs[changed]]
+
+    return ((epochs + offsets) // SECONDS_PER_DAY).astype('datetime64[D]')
+
+
+def daily_totals(days: np.ndarray, values, start, count: int) -> np.ndarray:
+    """
+    Sum values into a dense per-day array.
+
+    Args:
+        days: datetime64[D] day of each value (NaT is ignored).
+        values: Values to add, one per day.
+        start: First day of the output.
+        count: Number of days in the output.
+
+    Returns:
+        np.ndarray: float64 totals, index 0 = start. Days outside the range are dropped.
+    """
+    totals = np.zeros(count, dtype=np.float64)
+    days = np.asarray(days, dtype='datetime64[D]')
+    if days.size == 0:
+        return totals
+    index = (days - np.datetime64(start, 'D')).astype(np.int64)
+    in_range = ~np.isnat(days) & (index >= 0) & (index < count)
+    np.add.at(totals, index[in_range], np.asarray(values, dtype=np.float64)[in_range])
+    return totals
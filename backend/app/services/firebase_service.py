@@ -1,8 +1,12 @@
 import firebase_admin
 from firebase_admin import credentials, firestore
+import contextvars
 import os
 import json
 import re
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
 from .timezone_utils import (
@@ -12,10 +16,31 @@ from .timezone_utils import (
     get_user_local_date,
     get_user_local_datetime,
     convert_utc_to_user_local,
-    should_reset_daily_metrics,
-    get_local_date_range,
+    get_zone,
     is_valid_timezone
 )
+from .activity_heatmap import HeatmapCache, build_year_heatmap
+from .date_arrays import daily_totals, days_ending, days_to_strings, local_days, parse_days, weekdays
+from .goal_progress import (
+    GOAL_CATEGORIES,
+    ActiveGoalIndex,
+    evaluate_goals,
+    water_amounts,
+    weight_amounts,
+    workout_amounts
+)
+from .presence import PresenceHub, PresenceTracker, create_presence_backend
+from .timeseries import (
+    RESOLUTIONS,
+    FinishedBucketCache,
+    aggregate_buckets,
+    bucket_starts,
+    ema_series,
+    ema_update,
+    lttb,
+    rolling_daily_mean
+)
+from .write_pipeline import BackfillQueue, WritePipeline, deferred_writes
 
 
 #key_path = 'keys/lifestyle-health-kyool-firebase-adminsdk-fbsvc-08bd67c569.json'  # Default path if env var not set
@@ -31,24 +56,400 @@ if not firebase_admin._apps:
     firebase_admin.initialize_app(cred)
 db = firestore.client()
 
+# Heatmaps for finished years never change, so the most recently used ones are kept in memory
+_finished_heatmaps = HeatmapCache()
+
+# Finished chart buckets per (user_id, metric, resolution)
+_series_cache = FinishedBucketCache()
+
+# Active goals per user, so logging an activity finds the goals it advances without a query
+_active_goals = ActiveGoalIndex()
+
+# Avatars generated at read time, persisted in the background
+_avatar_backfill = BackfillQueue(db)
+
+# Heartbeats are tracked in memory and persisted to the presence store at most once a minute per user
+_presence = PresenceTracker(create_presence_backend(
+    os.environ.get("PRESENCE_BACKEND", "firestore"), db, os.environ.get("REDIS_URL")
+))
+_presence_hub = PresenceHub(_presence)
+
+# user_id -> (timezone, expires_at). Timezones rarely change and are read on every date lookup.
+_timezone_cache = {}
+TIMEZONE_CACHE_TTL_SECONDS = 300
+
 class FirestoreUserService:
+    # Streak types the app logs itself, checked by key in the daily rollover's batched reads
+    STREAK_TYPES = ('water', 'workout', 'food')
+    
+    # Fields needed to render a user in headers, friend lists and requests
+    CARD_FIELDS = ('name', 'username', 'avatar')
+    
+    # Weight trend smoothing: EMA half-life and the daily history kept in the summary document
+    WEIGHT_EMA_HALF_LIFE_DAYS = 7
+    WEIGHT_SUMMARY_DAYS = 30
+
     #Adding Weight log functionality
+    def _weight_log_ref(self, user_id: str, date: str):
+        """Weight logs are keyed by their ISO date string, so document order is chronological."""
+        return db.collection('users').document(user_id).collection('weight_logs').document(date.replace('/', '-'))
+
     def add_weight_log(self, user_id: str, weight: float, date: str, bmi: float = None, bmr: float = None, tdee: float = None):
-        doc_ref = db.collection('users').document(user_id)
-        doc = doc_ref.get()
-        if doc.exists:
-            logs = doc.to_dict().get('weight_logs', [])
-            logs.append({'weight': weight, 'date': date, 'bmi': bmi, 'bmr': bmr, 'tdee': tdee})
-            doc_ref.update({'weight_logs': logs})
-            return True
-        return False
+        """
+        Add a weight log entry to the user's weight_logs subcollection.
+        
+        Args:
+            user_id: The user's Firebase ID.
+            weight: Weight in kilograms.
+            date: ISO date or timestamp of the measurement.
+            bmi, bmr, tdee: Metrics calculated at the time of the measurement.
+            
+        Returns:
+            bool: True if logged, False if the user does not exist.
+        """
+        user_doc = db.collection('users').document(user_id).get(field_paths=['username', 'weight_logs'])
+        if not user_doc.exists:
+            return False
+        
+        # Reads only fall back to the embedded array while the subcollection is empty,
+        # so an unmigrated user's history is moved before their first subcollection entry
+        user_data = user_doc.to_dict()
+        if 'weight_logs' in user_data:
+            self.migrate_weight_logs(user_id, user_data)
+        
+        self._weight_log_ref(user_id, date).set({
+            'weight': weight,
+            'date': date,
+            'bmi': bmi,
+            'bmr': bmr,
+            'tdee': tdee,
+            'created_at': get_utc_now_iso()
+        })
+        # The measurement may be backdated into an already finished chart bucket
+        self._invalidate_series(user_id, 'weight')
+        try:
+            summary = self._update_weight_summary(user_id, weight, date)
+        except Exception as e:
+            # The summary is rebuilt from the logs on the next trends read if it is missing
+            print(f"Error updating weight summary for user {user_id}: {e}")
+            self._weight_summary_ref(user_id).delete()
+            summary = None
+        
+        # Only the most recent measurement moves weight goals; backdated entries are history
+        measured_at = iso_to_utc_datetime(date)
+        latest_at = iso_to_utc_datetime(summary['last_measured_at']) if summary else None
+        if measured_at and latest_at and measured_at >= latest_at - timedelta(seconds=1):
+            self._advance_goals(user_id, 'weight', weight_amounts(weight), absolute=True)
+        return True
     
     #Retrieving Weight log functionality
-    def get_weight_logs(self, user_id: str):
-        doc = db.collection('users').document(user_id).get()
-        if doc.exists:
-            return doc.to_dict().get('weight_logs', [])
-        return []
+    def get_weight_logs(self, user_id: str, start: str = None, end: str = None, limit: int = None, after: str = None):
+        """
+        Get weight logs in chronological order, optionally within a date range and paginated.
+        
+        Args:
+            user_id: The user's Firebase ID.
+            start: Earliest date to include ('YYYY-MM-DD' or ISO timestamp).
+            end: Latest date to include ('YYYY-MM-DD' includes the whole day).
+            limit: Maximum number of entries to return.
+            after: Return entries after this 'date' value (the last date of the previous page).
+            
+        Returns:
+            list: Weight log entries with 'weight', 'date', 'bmi', 'bmr' and 'tdee'.
+        """
+        query = db.collection('users').document(user_id).collection('weight_logs').order_by('date')
+        if start:
+            query = query.where('date', '>=', start)
+        if end:
+            # '\uf8ff' sorts after any timestamp suffix, so a bare date includes that whole day
+            query = query.where('date', '<=', end + '\uf8ff')
+        if after:
+            query = query.where('date', '>', after)
+        if limit:
+            query = query.limit(limit)
+        
+        logs = []
+        for doc in query.stream():
+            data = doc.to_dict()
+            data.pop('created_at', None)
+            logs.append(data)
+        
+        if not logs and not (start or end or after):
+            # Users that have not been migrated yet still have the embedded array
+            doc = db.collection('users').document(user_id).get(field_paths=['weight_logs'])
+            if doc.exists:
+                legacy_logs = doc.to_dict().get('weight_logs', [])
+                return legacy_logs[:limit] if limit else legacy_logs
+        
+        return logs
+    
+    def _weight_summary_ref(self, user_id: str):
+        return db.collection('users').document(user_id).collection('summaries').document('weight')
+    
+    def _update_weight_summary(self, user_id: str, weight: float, date: str):
+        """
+        Fold a new weight log into the user's trend summary.
+        
+        Measurements newer than the last one advance the EMA in O(1), in a
+        transaction so concurrent logs do not overwrite each other's update.
+        Backdated or overwritten measurements change history, so the summary
+        is rebuilt.
+        
+        Args:
+            user_id: The user's Firebase ID.
+            weight: Weight in kilograms.
+            date: ISO date or timestamp of the measurement.
+            
+        Returns:
+            dict: The updated summary.
+        """
+        summary_ref = self._weight_summary_ref(user_id)
+        measured_at = iso_to_utc_datetime(date)
+        if measured_at is None:
+            return self._rebuild_weight_summary(user_id)
+        local_day = convert_utc_to_user_local(measured_at, self._get_user_timezone(user_id)).strftime('%Y-%m-%d')
+        
+        @firestore.transactional
+        def apply(transaction):
+            summary_doc = summary_ref.get(transaction=transaction)
+            summary = summary_doc.to_dict() if summary_doc.exists else {}
+            last_measured_at = iso_to_utc_datetime(summary.get('last_measured_at') or '')
+            if last_measured_at is None or measured_at <= last_measured_at:
+                return None
+            
+            ema = ema_update(
+                summary['ema'], last_measured_at.timestamp(), float(weight), measured_at.timestamp(),
+                self.WEIGHT_EMA_HALF_LIFE_DAYS * 86400
+            )
+            days = summary.get('days', {})
+            day = days.setdefault(local_day, {'sum': 0.0, 'count': 0})
+            day['sum'] += float(weight)
+            day['count'] += 1
+            day['ema'] = ema
+            
+            oldest_kept = (datetime.strptime(max(days), '%Y-%m-%d') - timedelta(days=self.WEIGHT_SUMMARY_DAYS - 1)).strftime('%Y-%m-%d')
+            summary = {
+                'ema': ema,
+                'latest_weight': float(weight),
+                'last_measured_at': measured_at.isoformat(),
+                'count': summary.get('count', 0) + 1,
+                'days': {key: value for key, value in days.items() if key >= oldest_kept},
+                'half_life_days': self.WEIGHT_EMA_HALF_LIFE_DAYS,
+                'updated_at': get_utc_now_iso()
+            }
+            transaction.set(summary_ref, summary)
+            return summary
+        
+        summary = apply(db.transaction())
+        if summary is None:
+            # No summary yet, or the measurement is not the newest one
+            return self._rebuild_weight_summary(user_id)
+        return summary
+    
+    def _rebuild_weight_summary(self, user_id: str, points: tuple = None):
+        """
+        Recompute the weight trend summary from the full weight log history.
+        
+        Args:
+            user_id: The user's Firebase ID.
+            points: Already-loaded (epochs, local days, weights) arrays (optional).
+            
+        Returns:
+            dict: The new summary, or None if the user has no weight logs.
+        """
+        summary_ref = self._weight_summary_ref(user_id)
+        epochs, days, weights = points or self._load_metric_points(user_id, 'weight', self._get_user_timezone(user_id))
+        if len(weights) == 0:
+            summary_ref.delete()
+            return None
+        
+        emas = ema_series(epochs, weights, self.WEIGHT_EMA_HALF_LIFE_DAYS * 86400)
+        
+        recent = days >= days[-1] - np.timedelta64(self.WEIGHT_SUMMARY_DAYS - 1, 'D')
+        recent_days, first_index, inverse = np.unique(days[recent], return_index=True, return_inverse=True)
+        sums = np.bincount(inverse, weights=weights[recent])
+        counts = np.bincount(inverse)
+        # Entries are in time order, so each day's closing EMA is at the index before the next day starts
+        last_index = np.append(first_index[1:] - 1, recent.sum() - 1)
+        closing_emas = emas[recent][last_index]
+        
+        summary = {
+            'ema': float(emas[-1]),
+            'latest_weight': float(weights[-1]),
+            'last_measured_at': datetime.fromtimestamp(epochs[-1], tz=timezone.utc).isoformat(),
+            'count': int(len(weights)),
+            'days': {
+                str(day): {'sum': float(total), 'count': int(count), 'ema': float(ema)}
+                for day, total, count, ema in zip(recent_days, sums, counts, closing_emas)
+            },
+            'half_life_days': self.WEIGHT_EMA_HALF_LIFE_DAYS,
+            'updated_at': get_utc_now_iso()
+        }
+        summary_ref.set(summary)
+        return summary
+    
+    def get_weight_trends(self, user_id: str, series_days: int = None) -> dict:
+        """
+        Get smoothed weight trends.
+        
+        Current values come from the incrementally maintained summary document,
+        so they cost a single read regardless of history length. When
+        series_days is given, daily series are also computed (vectorized) over
+        the stored logs.
+        
+        Args:
+            user_id: The user's Firebase ID.
+            series_days: Number of trailing days of daily series to include (optional).
+            
+        Returns:
+            dict: 'ema', 'rolling_7d', 'rolling_30d', 'weekly_rate' (kg per week),
+            'latest_weight', 'last_measured_at', 'count', and 'series' when requested.
+        """
+        user_tz = self._get_user_timezone(user_id)
+        points = self._load_metric_points(user_id, 'weight', user_tz) if series_days else None
+        
+        summary_doc = self._weight_summary_ref(user_id).get()
+        summary = summary_doc.to_dict() if summary_doc.exists else self._rebuild_weight_summary(user_id, points)
+        if not summary:
+            return {'ema': None, 'rolling_7d': None, 'rolling_30d': None, 'weekly_rate': None,
+                    'latest_weight': None, 'last_measured_at': None, 'count': 0, 'series': [] if series_days else None}
+        
+        today = datetime.strptime(get_user_local_date(user_tz), '%Y-%m-%d')
+        days = summary.get('days', {})
+        
+        def window_mean(window: int):
+            oldest = (today - timedelta(days=window - 1)).strftime('%Y-%m-%d')
+            daily_means = [day['sum'] / day['count'] for key, day in days.items() if key >= oldest and day['count']]
+            return round(sum(daily_means) / len(daily_means), 2) if daily_means else None
+        
+        weekly_rate = None
+        if days:
+            last_day = datetime.strptime(max(days), '%Y-%m-%d')
+            earlier = [key for key in days if key <= (last_day - timedelta(days=7)).strftime('%Y-%m-%d')]
+            if earlier:
+                reference_day = max(earlier)
+                elapsed_days = (last_day - datetime.strptime(reference_day, '%Y-%m-%d')).days
+                weekly_rate = round((summary['ema'] - days[reference_day]['ema']) / elapsed_days * 7, 3)
+        
+        trends = {
+            'ema': round(summary['ema'], 2),
+            'rolling_7d': window_mean(7),
+            'rolling_30d': window_mean(30),
+            'weekly_rate': weekly_rate,
+            'latest_weight': summary.get('latest_weight'),
+            'last_measured_at': summary.get('last_measured_at'),
+            'count': summary.get('count', 0),
+            'half_life_days': summary.get('half_life_days', self.WEIGHT_EMA_HALF_LIFE_DAYS)
+        }
+        if series_days:
+            trends['series'] = self._weight_trend_series(points, np.datetime64(today.strftime('%Y-%m-%d')), series_days)
+        return trends
+    
+    def _weight_trend_series(self, points: tuple, today: np.datetime64, series_days: int) -> list:
+        """Daily weight, EMA, 7/30-day rolling means and weekly rate for the trailing series_days days."""
+        epochs, days, weights = points
+        if len(weights) == 0:
+            return []
+        
+        emas = ema_series(epochs, weights, self.WEIGHT_EMA_HALF_LIFE_DAYS * 86400)
+        grid, daily = rolling_daily_mean(days, weights, 1)
+        _, rolling_7d = rolling_daily_mean(days, weights, 7)
+        _, rolling_30d = rolling_daily_mean(days, weights, 30)
+        
+        # EMA as of the end of each day, carried forward over days without measurements
+        closing_emas = emas[np.searchsorted(days, grid, side='right') - 1]
+        weekly_rate = np.full(len(grid), np.nan)
+        weekly_rate[7:] = closing_emas[7:] - closing_emas[:-7]
+        
+        visible = (grid > today - np.timedelta64(series_days, 'D')) & (grid <= today)
+        
+        def clean(value):
+            return None if np.isnan(value) else round(float(value), 3)
+        
+        return [
+            {
+                'date': str(day),
+                'weight': clean(daily_value),
+                'ema': clean(ema),
+                'rolling_7d': clean(mean_7d),
+                'rolling_30d': clean(mean_30d),
+                'weekly_rate': clean(rate)
+            }
+            for day, daily_value, ema, mean_7d, mean_30d, rate in zip(
+                grid[visible], daily[visible], closing_emas[visible],
+                rolling_7d[visible], rolling_30d[visible], weekly_rate[visible]
+            )
+        ]
+    
+    def migrate_weight_logs(self, user_id: str, user_data: dict = None) -> dict:
+        """
+        Move the embedded weight_logs array from the user document into the subcollection.
+        
+        Safe to re-run: document IDs are derived from the entries. Entries that
+        share a date are kept under suffixed IDs instead of overwriting each
+        other, and entries without a date cannot be placed on the timeline, so
+        they are moved to the 'weight_logs_undated' field rather than dropped.
+        The array is only removed after every entry has been written.
+        
+        Args:
+            user_id: The user's Firebase ID.
+            user_data: Already-fetched user data containing 'weight_logs' (optional).
+            
+        Returns:
+            dict: Counts of 'migrated' entries, of those 'collided' (stored under a
+                suffixed ID) and of 'undated' entries kept on the user document.
+        """
+        counts = {'migrated': 0, 'collided': 0, 'undated': 0}
+        user_ref = db.collection('users').document(user_id)
+        if user_data is None:
+            doc = user_ref.get(field_paths=['weight_logs'])
+            if not doc.exists:
+                return counts
+            user_data = doc.to_dict()
+        
+        if 'weight_logs' not in user_data:
+            return counts
+        
+        legacy_logs = [log for log in (user_data.get('weight_logs') or []) if log]
+        undated = [log for log in legacy_logs if not log.get('date')]
+        now_utc_iso = get_utc_now_iso()
+        seen_dates = {}
+        with WritePipeline(db) as writes:
+            for log in legacy_logs:
+                if not log.get('date'):
+                    continue
+                log_ref = self._weight_log_ref(user_id, log['date'])
+                duplicates = seen_dates.get(log['date'], 0)
+                seen_dates[log['date']] = duplicates + 1
+                if duplicates:
+                    log_ref = log_ref.parent.document(f"{log_ref.id}_{duplicates}")
+                    counts['collided'] += 1
+                writes.set(log_ref, {
+                    'weight': log.get('weight'),
+                    'date': log['date'],
+                    'bmi': log.get('bmi'),
+                    'bmr': log.get('bmr'),
+                    'tdee': log.get('tdee'),
+                    'created_at': now_utc_iso
+                })
+                counts['migrated'] += 1
+        
+        # Only drop the array once every entry is safely in the subcollection
+        changes = {'weight_logs': firestore.DELETE_FIELD}
+        if undated:
+            changes['weight_logs_undated'] = firestore.ArrayUnion(undated)
+            counts['undated'] = len(undated)
+            print(f"Kept {len(undated)} undated weight logs for user {user_id} in weight_logs_undated")
+        user_ref.update(changes)
+        self._invalidate_series(user_id, 'weight')
+        
+        # A summary built before the migration only covers the entries that were in the subcollection then
+        try:
+            self._rebuild_weight_summary(user_id)
+        except Exception as e:
+            print(f"Error rebuilding weight summary for user {user_id}: {e}")
+            self._weight_summary_ref(user_id).delete()
+        return counts
     
     #Adding Water log functionality
     def log_water_intake(self, user_id: str, glasses: float):
@@ -91,66 +492,8 @@ class FirestoreUserService:
         glasses_total = doc.to_dict().get('glasses', glasses) if doc.exists else glasses
         
         # Create cumulative water event using a session document approach
-        try:
-            water_events_ref = db.collection('users').document(user_id).collection('water_events')
-            session_ref = db.collection('users').document(user_id).collection('water_session').document('current')
-            
-            # Get or create the current session
-            session_doc = session_ref.get()
-            
-            if session_doc.exists:
-                session_data = session_doc.to_dict()
-                session_timestamp = session_data.get('created_at', '')
-                session_glasses = session_data.get('glasses', 0)
-                
-                # Parse timestamps to check if still within 30 seconds
-                try:
-                    from datetime import datetime
-                    current_time = datetime.fromisoformat(now_utc_iso.replace('Z', '+00:00'))
-                    session_time = datetime.fromisoformat(session_timestamp.replace('Z', '+00:00'))
-                    time_diff = (current_time - session_time).total_seconds()
-                    
-                    if time_diff < 30:
-                        # Still within 30 seconds, update existing session
-                        session_ref.update({
-                            'glasses': firestore.Increment(glasses),
-                            'last_added_at': now_utc_iso
-                        })
-                    else:
-                        # Outside 30 second window, save old session and create new one
-                        # Save the old session to events
-                        water_events_ref.add({
-                            'glasses': session_glasses,
-                            'created_at': session_timestamp,
-                            'date': today,
-                            'type': 'water_logged_session'
-                        })
-                        # Create new session
-                        session_ref.set({
-                            'glasses': glasses,
-                            'created_at': now_utc_iso,
-                            'last_added_at': now_utc_iso,
-                            'date': today
-                        })
-                except Exception as e:
-                    print(f"Error parsing timestamps: {e}")
-                    # Fallback: just create a new event
-                    water_events_ref.add({
-                        'glasses': glasses,
-                        'created_at': now_utc_iso,
-                        'date': today,
-                        'type': 'water_logged_session'
-                    })
-            else:
-                # No existing session, create new one
-                session_ref.set({
-                    'glasses': glasses,
-                    'created_at': now_utc_iso,
-                    'last_added_at': now_utc_iso,
-                    'date': today
-                })
-        except Exception as e:
-            print(f"Error managing water session: {e}")
+        self._record_water_session(user_id, today, glasses, now_utc_iso)
+        self._advance_goals(user_id, 'water', water_amounts(glasses_total), day=today)
         
         # Update streak for water logging
         streak_data = self.update_streak(user_id, 'water')
@@ -201,73 +544,108 @@ class FirestoreUserService:
         # Only create events if there's a change
         delta = glasses - old_glasses
         if delta != 0:
-            try:
-                water_events_ref = db.collection('users').document(user_id).collection('water_events')
-                session_ref = db.collection('users').document(user_id).collection('water_session').document('current')
+            self._record_water_session(user_id, today, delta, now_utc_iso)
+            self._advance_goals(user_id, 'water', water_amounts(glasses), day=today)
+        
+        # Update streak for water logging
+        streak_data = self.update_streak(user_id, 'water')
+        
+        return {
+            'glasses': glasses,
+            'streak': streak_data
+        }
+    
+    def _record_water_session(self, user_id: str, today: str, glasses: float, now_utc_iso: str):
+        """
+        Add a water change to the current 30-second session, closing the previous
+        session into water_events when the window has passed.
+        
+        The session and event writes are queued on the request's write pipeline
+        so they commit together in one batch.
+        
+        Args:
+            user_id: The user's Firebase ID.
+            today: Today's date (YYYY-MM-DD) in the user's timezone.
+            glasses: Change in glasses to record.
+            now_utc_iso: Current UTC timestamp.
+        """
+        try:
+            water_events_ref = db.collection('users').document(user_id).collection('water_events')
+            session_ref = db.collection('users').document(user_id).collection('water_session').document('current')
+            
+            # Get or create the current session
+            session_doc = session_ref.get()
+            
+            with deferred_writes(db) as writes:
+                if not session_doc.exists:
+                    # No existing session, create new one
+                    writes.set(session_ref, {
+                        'glasses': glasses,
+                        'created_at': now_utc_iso,
+                        'last_added_at': now_utc_iso,
+                        'date': today
+                    })
+                    return
                 
-                # Get or create the current session
-                session_doc = session_ref.get()
+                session_data = session_doc.to_dict()
+                session_timestamp = session_data.get('created_at', '')
                 
-                if session_doc.exists:
-                    session_data = session_doc.to_dict()
-                    session_timestamp = session_data.get('created_at', '')
-                    session_glasses = session_data.get('glasses', 0)
-                    
-                    # Parse timestamps to check if still within 30 seconds
-                    try:
-                        from datetime import datetime
-                        current_time = datetime.fromisoformat(now_utc_iso.replace('Z', '+00:00'))
-                        session_time = datetime.fromisoformat(session_timestamp.replace('Z', '+00:00'))
-                        time_diff = (current_time - session_time).total_seconds()
-                        
-                        if time_diff < 30:
-                            # Still within 30 seconds, update existing session
-                            session_ref.update({
-                                'glasses': firestore.Increment(delta),
-                                'last_added_at': now_utc_iso
-                            })
-                        else:
-                            # Outside 30 second window, save old session and create new one
-                            # Save the old session to events
-                            water_events_ref.add({
-                                'glasses': session_glasses,
-                                'created_at': session_timestamp,
-                                'date': today,
-                                'type': 'water_logged_session'
-                            })
-                            # Create new session
-                            session_ref.set({
-                                'glasses': delta,
-                                'created_at': now_utc_iso,
-                                'last_added_at': now_utc_iso,
-                                'date': today
-                            })
-                    except Exception as e:
-                        print(f"Error parsing timestamps: {e}")
-                        # Fallback: just create a new event
-                        water_events_ref.add({
-                            'glasses': delta,
-                            'created_at': now_utc_iso,
-                            'date': today,
-                            'type': 'water_logged_session'
-                        })
+                # Parse timestamps to check if still within 30 seconds
+                try:
+                    current_time = datetime.fromisoformat(now_utc_iso.replace('Z', '+00:00'))
+                    session_time = datetime.fromisoformat(session_timestamp.replace('Z', '+00:00'))
+                    time_diff = (current_time - session_time).total_seconds()
+                except Exception as e:
+                    print(f"Error parsing timestamps: {e}")
+                    # Fallback: just create a new event
+                    writes.create(water_events_ref.document(), {
+                        'glasses': glasses,
+                        'created_at': now_utc_iso,
+                        'date': today,
+                        'type': 'water_logged_session'
+                    })
+                    return
+                
+                # Sessions never span a local midnight, even if the daily rollover has not closed it yet
+                if time_diff < 30 and session_data.get('date', today) == today:
+                    # Still within 30 seconds, update existing session
+                    writes.update(session_ref, {
+                        'glasses': firestore.Increment(glasses),
+                        'last_added_at': now_utc_iso
+                    })
                 else:
-                    # No existing session, create new one
-                    session_ref.set({
-                        'glasses': delta,
+                    # Outside 30 second window, save old session to events and start a new one
+                    writes.set(*self._water_session_event(user_id, session_data))
+                    writes.set(session_ref, {
+                        'glasses': glasses,
                         'created_at': now_utc_iso,
                         'last_added_at': now_utc_iso,
                         'date': today
                     })
-            except Exception as e:
-                print(f"Error managing water session: {e}")
+        except Exception as e:
+            print(f"Error managing water session: {e}")
+    
+    def _water_session_event(self, user_id: str, session_data: dict):
+        """
+        Build the water event that closes a session.
         
-        # Update streak for water logging
-        streak_data = self.update_streak(user_id, 'water')
+        The event ID is derived from the session's start time, so the request
+        path and the daily rollover closing the same session write one event.
         
-        return {
-            'glasses': glasses,
-            'streak': streak_data
+        Args:
+            user_id: The user's Firebase ID.
+            session_data: The session document's data.
+            
+        Returns:
+            tuple: (event document reference, event data)
+        """
+        created_at = session_data.get('created_at', '')
+        event_ref = db.collection('users').document(user_id).collection('water_events').document(f"session_{created_at}")
+        return event_ref, {
+            'glasses': session_data.get('glasses', 0),
+            'created_at': created_at,
+            'date': session_data.get('date'),
+            'type': 'water_logged_session'
         }
     
     def get_today_water_intake(self, user_id: str):
@@ -300,26 +678,91 @@ class FirestoreUserService:
             list: List of dictionaries with 'date' and 'glasses' keys, sorted by date.
         """
         user_tz = self._get_user_timezone(user_id)
-        date_range = get_local_date_range(user_tz, days)
+        date_range = days_ending(get_user_local_date(user_tz), days)
+        if len(date_range) == 0:
+            return []
+        start, end = days_to_strings(date_range[[0, -1]])
+        
+        # One range query over the date-keyed logs, then missing days are filled with zeros
+        water_docs = (db.collection('users').document(user_id).collection('water_logs')
+                      .where('date', '>=', start)
+                      .where('date', '<=', end)
+                      .select(['glasses'])
+                      .stream())
+        logged = {doc.id: doc.to_dict().get('glasses', 0) or 0 for doc in water_docs}
+        totals = daily_totals(parse_days(logged.keys()), list(logged.values()), start, len(date_range))
+        
+        return [{'date': date, 'glasses': glasses} for date, glasses in zip(days_to_strings(date_range), totals.tolist())]
+    
+    def get_activity_heatmap(self, user_id: str, year: int = None) -> dict:
+        """
+        Get a yearly activity heatmap (water and workouts) for a user.
+        
+        Uses two range queries over the date-keyed water_logs and workouts
+        subcollections instead of one read per day. Heatmaps for finished
+        years are immutable, so they are cached in memory and persisted to
+        users/{id}/heatmaps/{year} after the first computation.
         
-        water_logs = []
-        for date in date_range:
-            water_log_ref = db.collection('users').document(user_id).collection('water_logs').document(date)
-            doc = water_log_ref.get()
+        Args:
+            user_id: The user's Firebase ID.
+            year: Calendar year to build (defaults to the current year in user's timezone).
             
-            if doc.exists:
-                water_logs.append({
-                    'date': date,
-                    'glasses': doc.to_dict().get('glasses', 0)
-                })
-            else:
-                water_logs.append({
-                    'date': date,
-                    'glasses': 0
-                })
+        Returns:
+            dict: Compact heatmap with per-day 'intensity', 'water' and 'workouts' arrays.
+        """
+        user_tz = self._get_user_timezone(user_id)
+        current_year = int(get_user_local_date(user_tz)[:4])
+        if year is None:
+            year = current_year
+        
+        is_finished = year < current_year
+        cache_key = (user_id, year)
+        if is_finished:
+            heatmap = _finished_heatmaps.get(cache_key)
+            if heatmap is not None:
+                return heatmap
+            
+            cached_doc = db.collection('users').document(user_id).collection('heatmaps').document(str(year)).get()
+            if cached_doc.exists:
+                heatmap = cached_doc.to_dict()
+                _finished_heatmaps.put(cache_key, heatmap)
+                return heatmap
+        
+        start_str = f'{year}-01-01'
+        end_str = f'{year}-12-31'
+        user_ref = db.collection('users').document(user_id)
+        
+        water_by_date = {}
+        workouts_by_date = {}
+        if year <= current_year:
+            water_docs = (user_ref.collection('water_logs')
+                          .where('date', '>=', start_str)
+                          .where('date', '<=', end_str)
+                          .select(['glasses'])
+                          .stream())
+            for doc in water_docs:
+                water_by_date[doc.id] = doc.to_dict().get('glasses', 0) or 0
+            
+            workouts_ref = user_ref.collection('workouts')
+            workout_docs = (workouts_ref
+                            .where(firestore.FieldPath.document_id(), '>=', workouts_ref.document(start_str))
+                            .where(firestore.FieldPath.document_id(), '<=', workouts_ref.document(end_str))
+                            .select(['duration_minutes'])
+                            .stream())
+            for doc in workout_docs:
+                workouts_by_date[doc.id] = doc.to_dict().get('duration_minutes', 0) or 0
+        
+        heatmap = build_year_heatmap(year, water_by_date, workouts_by_date)
+        heatmap['computed_at'] = get_utc_now_iso()
+        
+        if is_finished:
+            try:
+                user_ref.collection('heatmaps').document(str(year)).set(heatmap)
+            except Exception as e:
+                print(f"Failed to persist heatmap {year} for user {user_id}: {e}")
+            _finished_heatmaps.put(cache_key, heatmap)
         
-        # Already sorted in descending order from get_local_date_range, so reverse for ascending
-        return list(reversed(water_logs))
+        return heatmap
     
     # ============ GLOBAL STREAK LOGIC ============
     # These methods support streaks for any activity type (water, workout, food, etc.)
@@ -386,7 +829,8 @@ class FirestoreUserService:
                 'streak_type': streak_type,
                 'updated_at': get_utc_now_iso()
             }
-            streak_ref.set(new_streak)
+            with deferred_writes(db) as writes:
+                writes.set(streak_ref, new_streak)
             return new_streak
         
         streak_data = streak_doc.to_dict()
@@ -420,7 +864,8 @@ class FirestoreUserService:
             'streak_type': streak_type,
             'updated_at': get_utc_now_iso()
         }
-        streak_ref.update(updated_streak)
+        with deferred_writes(db) as writes:
+            writes.update(streak_ref, updated_streak)
         
         return updated_streak
     
@@ -446,6 +891,49 @@ class FirestoreUserService:
         streak_ref.set(reset_streak)
         return reset_streak
     
+    def apply_daily_rollover(self, user_id: str, today: str) -> dict:
+        """
+        Close the previous day for a user whose local day has just started.
+        
+        Run by the daily rollover job in one transaction: a water session left
+        over from an earlier day is moved into water_events, and streaks not
+        logged yesterday or today are broken.
+        
+        Args:
+            user_id: The user's Firebase ID.
+            today: The user's new local date (YYYY-MM-DD).
+            
+        Returns:
+            dict: 'sessions_closed' and 'streaks_broken' counts.
+        """
+        yesterday = (datetime.strptime(today, '%Y-%m-%d').date() - timedelta(days=1)).strftime('%Y-%m-%d')
+        user_ref = db.collection('users').document(user_id)
+        session_ref = user_ref.collection('water_session').document('current')
+        streak_refs = [user_ref.collection('streaks').document(streak_type) for streak_type in self.STREAK_TYPES]
+        
+        @firestore.transactional
+        def apply(transaction):
+            result = {'sessions_closed': 0, 'streaks_broken': 0}
+            for snapshot in db.get_all([session_ref] + streak_refs, transaction=transaction):
+                if not snapshot.exists:
+                    continue
+                data = snapshot.to_dict()
+                if snapshot.id == 'current':
+                    if (data.get('date') or today) < today:
+                        transaction.set(*self._water_session_event(user_id, data))
+                        transaction.delete(session_ref)
+                        result['sessions_closed'] += 1
+                elif data.get('current_streak', 0) > 0 and (data.get('last_logged_date') or today) < yesterday:
+                    transaction.update(snapshot.reference, {
+                        'current_streak': 0,
+                        'start_date': None,
+                        'updated_at': get_utc_now_iso()
+                    })
+                    result['streaks_broken'] += 1
+            return result
+        
+        return apply(db.transaction())
+    
     def get_all_streaks(self, user_id: str) -> dict:
         """
         Get all streaks for a user across all activity types.
@@ -501,6 +989,7 @@ class FirestoreUserService:
             body_fat_data['hip'] = hip
         
         body_fat_ref.set(body_fat_data)
+        self._invalidate_series(user_id, 'body_fat')
         
         return {
             'id': today,
@@ -553,6 +1042,143 @@ class FirestoreUserService:
             history.append(data)
         
         return history
+    # ===== METRIC TIME SERIES =====
+    
+    # metric -> (value field, timestamp field) in the stored entries
+    METRIC_FIELDS = {
+        'weight': ('weight', 'date'),
+        'body_fat': ('body_fat', 'timestamp'),
+    }
+    
+    def _load_metric_points(self, user_id: str, metric: str, user_tz: str, since: str = None, until: str = None):
+        """
+        Load raw measurements for a metric as NumPy arrays.
+        
+        Args:
+            user_id: The user's Firebase ID.
+            metric: 'weight' or 'body_fat'.
+            user_tz: IANA timezone used to assign measurements to local days.
+            since: Earliest date to load (YYYY-MM-DD), optional.
+            until: Latest date to load (YYYY-MM-DD), optional.
+            
+        Returns:
+            tuple: (epoch seconds, local datetime64[D] days, values), sorted by time.
+        """
+        value_field, time_field = self.METRIC_FIELDS[metric]
+        if metric == 'weight':
+            entries = self.get_weight_logs(user_id, start=since, end=until)
+        else:
+            query = db.collection('users').document(user_id).collection('body_fat_logs')
+            if since:
+                query = query.where('date', '>=', since)
+            if until:
+                query = query.where('date', '<=', until)
+            entries = [doc.to_dict() for doc in query.select([value_field, time_field]).stream()]
+        
+        epochs, values = [], []
+        for entry in entries:
+            value = entry.get(value_field)
+            timestamp = iso_to_utc_datetime(entry.get(time_field) or '')
+            if value is None or timestamp is None:
+                continue
+            epochs.append(timestamp.timestamp())
+            values.append(float(value))
+        
+        epochs = np.array(epochs, dtype=np.float64)
+        order = np.argsort(epochs, kind='stable')
+        epochs = epochs[order]
+        return (
+            epochs,
+            local_days(epochs, get_zone(user_tz)),
+            np.array(values, dtype=np.float64)[order]
+        )
+    
+    def _series_versions_ref(self, user_id: str):
+        return db.collection('users').document(user_id).collection('summaries').document('series_versions')
+    
+    def _invalidate_series(self, user_id: str, metric: str):
+        """
+        Drop cached chart buckets for a metric after its measurements changed.
+        
+        The local entries are dropped right away; the stored version is bumped
+        after the measurement is written, so other instances see their cached
+        buckets are out of date on their next read.
+        """
+        _series_cache.invalidate(user_id, metric)
+        self._series_versions_ref(user_id).set({metric: firestore.Increment(1)}, merge=True)
+    
+    def get_metric_series(self, user_id: str, metric: str, start: str = None, end: str = None,
+                          resolution: str = 'week', points: int = 100) -> dict:
+        """
+        Get a downsampled chart series for a metric.
+        
+        Bucketed resolutions return mean/min/max/count per local day, week or
+        month. Buckets that have already ended are cached, so repeat requests
+        only read measurements from the currently open bucket onwards; the
+        cache is only used while the user's stored series version (bumped by
+        every measurement write, from any instance) still matches. The
+        'lttb' resolution returns at most `points` raw measurements chosen by
+        Largest-Triangle-Three-Buckets for line charts.
+        
+        Args:
+            user_id: The user's Firebase ID.
+            metric: 'weight' or 'body_fat'.
+            start: First date to include (YYYY-MM-DD), optional.
+            end: Last date to include (YYYY-MM-DD), optional.
+            resolution: 'day', 'week', 'month' or 'lttb'.
+            points: Maximum number of points for 'lttb'.
+            
+        Returns:
+            dict: Series with 'metric', 'resolution', 'timezone' and 'points'.
+        """
+        if metric not in self.METRIC_FIELDS:
+            raise ValueError(f"Unsupported metric '{metric}'")
+        if resolution not in RESOLUTIONS and resolution != 'lttb':
+            raise ValueError(f"Unsupported resolution '{resolution}'")
+        
+        start = start[:10] if start else None
+        end = end[:10] if end else None
+        user_tz = self._get_user_timezone(user_id)
+        series = {'metric': metric, 'resolution': resolution, 'timezone': user_tz}
+        
+        if resolution == 'lttb':
+            epochs, days, values = self._load_metric_points(user_id, metric, user_tz, start, end)
+            keep = lttb(epochs, values, points)
+            series['points'] = [
+                {'timestamp': datetime.fromtimestamp(epochs[i], tz=timezone.utc).isoformat(), 'value': round(float(values[i]), 2)}
+                for i in keep
+            ]
+            return series
+        
+        today = np.array([get_user_local_date(user_tz)], dtype='datetime64[D]')
+        open_bucket_start = str(bucket_starts(today, resolution)[0])
+        
+        cache_key = (user_id, metric, resolution)
+        version_doc = self._series_versions_ref(user_id).get()
+        version = (version_doc.to_dict() or {}).get(metric, 0) if version_doc.exists else 0
+        cached = _series_cache.get(cache_key, version)
+        if cached:
+            # Stored dates are UTC, so read one extra day to catch entries that fall on the local boundary
+            since = str(np.datetime64(cached['complete_before']) - np.timedelta64(1, 'D'))
+            epochs, days, values = self._load_metric_points(user_id, metric, user_tz, since)
+            is_open = days >= np.datetime64(cached['complete_before'])
+            buckets = dict(cached['buckets'])
+            buckets.update(aggregate_buckets(days[is_open], values[is_open], resolution))
+        else:
+            epochs, days, values = self._load_metric_points(user_id, metric, user_tz)
+            buckets = aggregate_buckets(days, values, resolution)
+        
+        finished = {key: value for key, value in buckets.items() if key < open_bucket_start}
+        _series_cache.put(cache_key, finished, open_bucket_start, version)
+        
+        series['points'] = [
+            {'date': key, **buckets[key]}
+            for key in sorted(buckets)
+            if (not start or key >= str(bucket_starts(np.array([start], dtype='datetime64[D]'), resolution)[0]))
+            and (not end or key <= end)
+        ]
+        return series
+    
     #Getting user by ID
     def generate_avatar_url(self, name: str, username: str):
         """Generate a fallback avatar URL using ui-avatars.com"""
@@ -560,29 +1186,110 @@ class FirestoreUserService:
         # Use the full name for better avatar generation - ui-avatars.com will extract initials
         return f"https://ui-avatars.com/api/?name={display_name}&background=0d8488&color=fff&size=128"
     
-    def get_user(self, user_id: str):
-        doc = db.collection('users').document(user_id).get()
+    def default_avatar(self, user_id: str, user_data: dict, update_time=None) -> str:
+        """
+        Get the fallback avatar for a user without one, without writing on the read path.
+        
+        The URL is deterministic from the name and username, so it is returned
+        immediately and persisted later by the background backfill queue. The
+        write is conditioned on the document being unchanged since it was read,
+        so an avatar uploaded in the meantime is never overwritten.
+        
+        Args:
+            user_id: The user's Firebase ID.
+            user_data: User data with 'name' and 'username'.
+            update_time: Update time of the snapshot user_data was read from.
+            
+        Returns:
+            str: The generated avatar URL.
+        """
+        avatar = self.generate_avatar_url(user_data.get('name', ''), user_data.get('username', ''))
+        _avatar_backfill.enqueue(db.collection('users').document(user_id), {'avatar': avatar}, last_update_time=update_time)
+        return avatar
+    
+    def get_user(self, user_id: str, fields: list = None):
+        """
+        Get a user's profile.
+        
+        Args:
+            user_id: The user's Firebase ID.
+            fields: Only read and return these top-level fields (optional). Projections
+                skip large fields like 'weight_logs' and 'friends' for UI lookups.
+            
+        Returns:
+            dict: The user data, or None if the user does not exist.
+        """
+        user_ref = db.collection('users').document(user_id)
+        if fields:
+            # The avatar fallback is derived from the name and username
+            projection = set(fields) | ({'name', 'username'} if 'avatar' in fields else set())
+            doc = user_ref.get(field_paths=sorted(projection))
+        else:
+            doc = user_ref.get()
         if not doc.exists:
             return None
         
         user_data = doc.to_dict()
         
         # Ensure user has an avatar - only generate fallback if no avatar exists
-        if not user_data.get('avatar'):
-            name = user_data.get('name', '')
-            username = user_data.get('username', '')
-            fallback_avatar = self.generate_avatar_url(name, username)
-            user_data['avatar'] = fallback_avatar
-            
-            # Update the user document with the fallback avatar only if none exists
-            try:
-                db.collection('users').document(user_id).update({'avatar': fallback_avatar})
-            except Exception as e:
-                print(f"Failed to update avatar for user {user_id}: {e}")
+        if (not fields or 'avatar' in fields) and not user_data.get('avatar'):
+            user_data['avatar'] = self.default_avatar(user_id, user_data, doc.update_time)
         # If avatar already exists (including Google photos), keep it as is
         
+        if fields:
+            return {key: value for key, value in user_data.items() if key in fields}
         return user_data
     
+    def get_user_cards(self, user_ids: list) -> dict:
+        """
+        Get the display fields of several users with one batched, projected read.
+        
+        Args:
+            user_ids: Firebase IDs of the users.
+            
+        Returns:
+            dict: Mapping of user ID to {'id', 'username', 'name', 'avatar', 'online', 'last_active'}
+            for the users that exist.
+        """
+        if not user_ids:
+            return {}
+        
+        refs = [db.collection('users').document(user_id) for user_id in dict.fromkeys(user_ids)]
+        last_seen = _presence.last_seen_many(user_ids)
+        now_utc = get_utc_now()
+        cards = {}
+        for snapshot in db.get_all(refs, field_paths=list(self.CARD_FIELDS)):
+            if not snapshot.exists:
+                continue
+            data = snapshot.to_dict()
+            seen = last_seen.get(snapshot.id)
+            
+            # Ensure user has an avatar - only generate if none exists
+            avatar = data.get('avatar') or self.default_avatar(snapshot.id, data, snapshot.update_time)
+            
+            cards[snapshot.id] = {
+                'id': snapshot.id,
+                'username': data.get('username'),
+                'name': data.get('name'),
+                'avatar': avatar,
+                'online': bool(seen) and now_utc - seen < timedelta(minutes=5),
+                'last_active': seen.isoformat() if seen else None
+            }
+        
+        return cards
+    
+    def get_user_card(self, user_id: str):
+        """
+        Get the display fields of a single user.
+        
+        Args:
+            user_id: The user's Firebase ID.
+            
+        Returns:
+            dict: {'id', 'username', 'name', 'avatar', 'online', 'last_active'}, or None if not found.
+        """
+        return self.get_user_cards([user_id]).get(user_id)
+    
     #Creating user with initial weight log
     def create_user(self, user_id: str, user_data: dict):
         """
@@ -620,28 +1327,31 @@ class FirestoreUserService:
             user_tz = 'UTC'
         print(f"DEBUG: final user_tz: {user_tz}")
         user_data['timezone'] = user_tz
+        self._cache_user_timezone(user_id, user_tz)
         
         # Set initial last_activity timestamp
         user_data['last_activity'] = get_utc_now_iso()
         
-        # Store initial weight log using values from frontend
+        # Store initial weight log using values from frontend, in the same batch as the user
         weight = user_data.get('weight')
-        bmi = user_data.get('bmi')
-        bmr = user_data.get('bmr')
-        tdee = user_data.get('tdee')
-        initial_log = {
-            'weight': weight,
-            'date': get_utc_now_iso(),
-            'bmi': bmi,
-            'bmr': bmr,
-            'tdee': tdee
-        } if weight else None
-        user_data['weight_logs'] = [initial_log] if initial_log else []
-        
-        db.collection('users').document(user_id).set(user_data)
+        with WritePipeline(db) as writes:
+            writes.set(db.collection('users').document(user_id), user_data)
+            if weight:
+                now_utc_iso = get_utc_now_iso()
+                writes.set(self._weight_log_ref(user_id, now_utc_iso), {
+                    'weight': weight,
+                    'date': now_utc_iso,
+                    'bmi': user_data.get('bmi'),
+                    'bmr': user_data.get('bmr'),
+                    'tdee': user_data.get('tdee'),
+                    'created_at': now_utc_iso
+                })
         return user_id
 
     def update_user(self, user_id: str, user_data: dict):
+        # Scheduled jobs find users by their stored zone, so only valid IANA names are stored
+        if 'timezone' in user_data and not is_valid_timezone(user_data['timezone']):
+            user_data['timezone'] = 'UTC'
         username = user_data.get('username')
         if username:
             # Check if username is taken by another user
@@ -658,10 +1368,14 @@ class FirestoreUserService:
         else:
             # Document exists, perform update
             db.collection('users').document(user_id).update(user_data)
+        
+        if 'timezone' in user_data:
+            _timezone_cache.pop(user_id, None)
         return True
 
     def delete_user(self, user_id: str):
         db.collection('users').document(user_id).delete()
+        _timezone_cache.pop(user_id, None)
         return True
     
     def get_user_by_email(self, email: str):
@@ -685,36 +1399,60 @@ class FirestoreUserService:
     
     def update_user_activity(self, user_id: str):
         """
-        Update user's last_active timestamp to track online status.
+        Record a heartbeat to track online status.
+        
+        The heartbeat is kept in memory and persisted to the presence store
+        at most once per minute per user; the user document is not written.
+        The user's existence is checked on their first heartbeat in this process.
         
         Args:
             user_id: The user's Firebase ID.
             
         Returns:
-            bool: True if successful, False otherwise.
+            bool: True if successful, False if the user does not exist or on error.
         """
         try:
-            user_ref = db.collection('users').document(user_id)
-            timestamp = get_utc_now_iso()
-            #print(f"DEBUG: Updating last_active for user {user_id} with timestamp: {timestamp}")
-            user_ref.update({'last_active': timestamp})
-            #print(f"DEBUG: Successfully updated last_active for user {user_id}")
+            if not _presence.is_tracked(user_id):
+                if not db.collection('users').document(user_id).get(field_paths=['username']).exists:
+                    return False
+            _presence.heartbeat(user_id)
             return True
         except Exception as e:
             print(f"Error updating user activity: {e}")
             return False
     
-    def is_user_online(self, last_active_str: str) -> bool:
+    def import_presence(self, user_docs: list) -> int:
+        """
+        Copy the last_active timestamps stored on user documents into the presence store.
+        
+        Args:
+            user_docs: User snapshots with the 'last_active' field.
+            
+        Returns:
+            int: Number of presence entries written.
+        """
+        last_active = {}
+        for user_doc in user_docs:
+            seen = iso_to_utc_datetime((user_doc.to_dict() or {}).get('last_active') or '')
+            if seen:
+                last_active[user_doc.id] = seen
+        return _presence.import_last_active(last_active)
+    
+    def is_user_online(self, last_active_str: str, user_id: str = None) -> bool:
         """
         Check if user is online based on last_active timestamp.
         A user is considered online if their last activity was within 5 minutes.
         
         Args:
             last_active_str: ISO format UTC timestamp string.
+            user_id: The user's Firebase ID. When given, the presence store is used
+                instead of last_active_str.
             
         Returns:
             bool: True if user is online, False otherwise.
         """
+        if user_id:
+            return _presence.online_status([user_id])[user_id]
         if not last_active_str:
             return False
         try:
@@ -730,6 +1468,42 @@ class FirestoreUserService:
             return False
         
 
+    def online_status(self, user_ids: list) -> dict:
+        """
+        Check which of several users are online, without reading their user documents.
+        
+        Args:
+            user_ids: Firebase IDs of the users.
+            
+        Returns:
+            dict: Mapping of user ID to True if online.
+        """
+        return _presence.online_status(user_ids)
+    
+    def subscribe_presence(self, user_ids: list, loop, queue) -> tuple:
+        """
+        Stream online status changes for users onto an asyncio queue.
+        
+        Args:
+            user_ids: Firebase IDs of the users to watch.
+            loop: The caller's asyncio event loop.
+            queue: asyncio.Queue that receives {user_id: online} change dicts.
+            
+        Returns:
+            tuple: (subscription token, {user_id: online} snapshot). Every change
+                after the snapshot is delivered to the queue.
+        """
+        return _presence_hub.subscribe(user_ids, loop, queue)
+    
+    def update_presence_subscription(self, token: int, user_ids: list) -> dict:
+        """Change the users watched by a presence subscription, returning the status of added users."""
+        return _presence_hub.update(token, user_ids)
+    
+    def unsubscribe_presence(self, token: int):
+        """Stop a presence subscription."""
+        _presence_hub.unsubscribe(token)
+        
+
     #Friends functionality   
     def send_friend_request(self, sender_id: str, receiver_id: str):
         """Send a friend request"""
@@ -777,33 +1551,20 @@ class FirestoreUserService:
         if not request_doc:
             raise ValueError("Friend request not found")
         
-        # Update request status to accepted
-        request_doc.reference.update({
-            'status': 'accepted',
-            'updated_at': get_utc_now_iso()
-        })
-        
-        # Add each user to the other's friends list
         sender_ref = db.collection('users').document(sender_id)
         receiver_ref = db.collection('users').document(receiver_id)
+        existing_users = self._existing_document_paths([sender_ref, receiver_ref])
         
-        # Add receiver to sender's friends
-        sender_doc = sender_ref.get()
-        if sender_doc.exists:
-            sender_data = sender_doc.to_dict()
-            sender_friends = sender_data.get('friends', [])
-            if receiver_id not in sender_friends:
-                sender_friends.append(receiver_id)
-                sender_ref.update({'friends': sender_friends})
-        
-        # Add sender to receiver's friends
-        receiver_doc = receiver_ref.get()
-        if receiver_doc.exists:
-            receiver_data = receiver_doc.to_dict()
-            receiver_friends = receiver_data.get('friends', [])
-            if sender_id not in receiver_friends:
-                receiver_friends.append(sender_id)
-                receiver_ref.update({'friends': receiver_friends})
+        # Accept the request and add each user to the other's friends list in one batch
+        with WritePipeline(db) as writes:
+            writes.update(request_doc.reference, {
+                'status': 'accepted',
+                'updated_at': get_utc_now_iso()
+            })
+            if sender_ref.path in existing_users:
+                writes.update(sender_ref, {'friends': firestore.ArrayUnion([receiver_id])})
+            if receiver_ref.path in existing_users:
+                writes.update(receiver_ref, {'friends': firestore.ArrayUnion([sender_id])})
         
         return True
 
@@ -886,25 +1647,23 @@ class FirestoreUserService:
 
     def get_incoming_friend_requests(self, user_id: str):
         """Get pending friend requests sent to this user"""
-        requests = db.collection('friend_requests').where('receiver_id', '==', user_id).where('status', '==', 'pending').stream()
+        requests = [req.to_dict() | {'request_id': req.id} for req in
+                    db.collection('friend_requests').where('receiver_id', '==', user_id).where('status', '==', 'pending').stream()]
+        
+        # Get all senders' profiles in one read
+        senders = self.get_user_cards([req_data.get('sender_id') for req_data in requests])
         
         incoming_requests = []
-        for req in requests:
-            req_data = req.to_dict()
-            sender_id = req_data.get('sender_id')
-            
-            # Get sender's profile
-            sender_doc = db.collection('users').document(sender_id).get()
-            if sender_doc.exists:
-                sender_data = sender_doc.to_dict()
-                last_active = sender_data.get('last_active')
+        for req_data in requests:
+            sender = senders.get(req_data.get('sender_id'))
+            if sender:
                 incoming_requests.append({
-                    'request_id': req.id,
-                    'sender_id': sender_id,
-                    'username': sender_data.get('username'),
-                    'name': sender_data.get('name'),
-                    'avatar': sender_data.get('avatar'),
-                    'online': self.is_user_online(last_active),
+                    'request_id': req_data['request_id'],
+                    'sender_id': sender['id'],
+                    'username': sender['username'],
+                    'name': sender['name'],
+                    'avatar': sender['avatar'],
+                    'online': sender['online'],
                     'created_at': req_data.get('created_at')
                 })
         
@@ -912,25 +1671,23 @@ class FirestoreUserService:
 
     def get_outgoing_friend_requests(self, user_id: str):
         """Get pending friend requests sent by this user"""
-        requests = db.collection('friend_requests').where('sender_id', '==', user_id).where('status', '==', 'pending').stream()
+        requests = [req.to_dict() | {'request_id': req.id} for req in
+                    db.collection('friend_requests').where('sender_id', '==', user_id).where('status', '==', 'pending').stream()]
+        
+        # Get all receivers' profiles in one read
+        receivers = self.get_user_cards([req_data.get('receiver_id') for req_data in requests])
         
         outgoing_requests = []
-        for req in requests:
-            req_data = req.to_dict()
-            receiver_id = req_data.get('receiver_id')
-            
-            # Get receiver's profile
-            receiver_doc = db.collection('users').document(receiver_id).get()
-            if receiver_doc.exists:
-                receiver_data = receiver_doc.to_dict()
-                last_active = receiver_data.get('last_active')
+        for req_data in requests:
+            receiver = receivers.get(req_data.get('receiver_id'))
+            if receiver:
                 outgoing_requests.append({
-                    'request_id': req.id,
-                    'receiver_id': receiver_id,
-                    'username': receiver_data.get('username'),
-                    'name': receiver_data.get('name'),
-                    'avatar': receiver_data.get('avatar'),
-                    'online': self.is_user_online(last_active),
+                    'request_id': req_data['request_id'],
+                    'receiver_id': receiver['id'],
+                    'username': receiver['username'],
+                    'name': receiver['name'],
+                    'avatar': receiver['avatar'],
+                    'online': receiver['online'],
                     'created_at': req_data.get('created_at')
                 })
         
@@ -938,76 +1695,44 @@ class FirestoreUserService:
 
     def remove_friend(self, user_id: str, friend_id: str):
         """Remove a friend from user's friends list and clean up friend request records"""
-        # Remove from current user's list
         user_ref = db.collection('users').document(user_id)
-        user_doc = user_ref.get()
-        if user_doc.exists:
-            user_data = user_doc.to_dict()
-            friends = user_data.get('friends', [])
-            if friend_id in friends:
-                friends.remove(friend_id)
-                user_ref.update({'friends': friends})
-        
-        # Remove from friend's list
         friend_ref = db.collection('users').document(friend_id)
-        friend_doc = friend_ref.get()
-        if friend_doc.exists:
-            friend_data = friend_doc.to_dict()
-            friend_friends = friend_data.get('friends', [])
-            if user_id in friend_friends:
-                friend_friends.remove(user_id)
-                friend_ref.update({'friends': friend_friends})
-        
-        # Clean up friend request records (both directions)
-        # Direction 1: user_id -> friend_id
-        requests1 = db.collection('friend_requests').where('sender_id', '==', user_id).where('receiver_id', '==', friend_id).stream()
-        for req in requests1:
-            req.reference.delete()
+        existing_users = self._existing_document_paths([user_ref, friend_ref])
         
-        # Direction 2: friend_id -> user_id  
+        # Friend request records in both directions
+        requests1 = db.collection('friend_requests').where('sender_id', '==', user_id).where('receiver_id', '==', friend_id).stream()
         requests2 = db.collection('friend_requests').where('sender_id', '==', friend_id).where('receiver_id', '==', user_id).stream()
-        for req in requests2:
-            req.reference.delete()
+        
+        # Remove each user from the other's list and clean up requests in one batch
+        with WritePipeline(db) as writes:
+            if user_ref.path in existing_users:
+                writes.update(user_ref, {'friends': firestore.ArrayRemove([friend_id])})
+            if friend_ref.path in existing_users:
+                writes.update(friend_ref, {'friends': firestore.ArrayRemove([user_id])})
+            for req in list(requests1) + list(requests2):
+                writes.delete(req.reference)
         
         return True
 
+    def _existing_document_paths(self, refs: list) -> set:
+        """Return the paths of the given documents that exist, using one batched read."""
+        return {snapshot.reference.path for snapshot in db.get_all(refs, field_paths=['username']) if snapshot.exists}
+
+    def get_friend_ids(self, user_id: str) -> list:
+        """Get the IDs of a user's friends, reading only the 'friends' field"""
+        user_doc = db.collection('users').document(user_id).get(field_paths=['friends'])
+        if not user_doc.exists:
+            return []
+        return user_doc.to_dict().get('friends', [])
+
     def get_user_friends(self, user_id: str):
         """Get list of user's friends with their details"""
-        user_doc = db.collection('users').document(user_id).get()
-        if not user_doc.exists:
+        friend_ids = self.get_friend_ids(user_id)
+        if not friend_ids:
             return []
         
-        user_data = user_doc.to_dict()
-        friend_ids = user_data.get('friends', [])
-        
-        friends = []
-        for friend_id in friend_ids:
-            friend_doc = db.collection('users').document(friend_id).get()
-            if friend_doc.exists:
-                friend_data = friend_doc.to_dict()
-                last_active = friend_data.get('last_active')
-                
-                # Ensure friend has an avatar - only generate if none exists
-                avatar = friend_data.get('avatar')
-                if not avatar:
-                    avatar = self.generate_avatar_url(friend_data.get('name', ''), friend_data.get('username', ''))
-                    # Save the generated avatar back to the database only if none exists
-                    try:
-                        db.collection('users').document(friend_id).update({'avatar': avatar})
-                    except Exception as e:
-                        print(f"Failed to update avatar for friend {friend_id}: {e}")
-                # If avatar already exists (including Google photos), keep it as is
-                
-                friends.append({
-                    'id': friend_id,
-                    'username': friend_data.get('username'),
-                    'name': friend_data.get('name'),
-                    'avatar': avatar,
-                    'online': self.is_user_online(last_active),
-                    'last_active': last_active
-                })
-        
-        return friends
+        cards = self.get_user_cards(friend_ids)
+        return [cards[friend_id] for friend_id in friend_ids if friend_id in cards]
 
     # ===== Timezone & Daily Reset Helper Methods =====
     
@@ -1021,64 +1746,28 @@ class FirestoreUserService:
         Returns:
             str: IANA timezone name (e.g., 'Asia/Kolkata'), or 'UTC' if not set.
         """
+        cached = _timezone_cache.get(user_id)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+        
         try:
-            user_doc = db.collection('users').document(user_id).get()
+            user_doc = db.collection('users').document(user_id).get(field_paths=['timezone'])
+            user_tz = 'UTC'
             if user_doc.exists:
-                user_tz = user_doc.to_dict().get('timezone')
-                if user_tz and is_valid_timezone(user_tz):
-                    return user_tz
+                stored_tz = user_doc.to_dict().get('timezone')
+                if stored_tz and is_valid_timezone(stored_tz):
+                    user_tz = stored_tz
+            self._cache_user_timezone(user_id, user_tz)
+            return user_tz
         except Exception as e:
             print(f"Error retrieving user timezone: {e}")
         
         return 'UTC'
     
-    def check_and_reset_daily_metrics(self, user_id: str) -> bool:
-        """
-        Check if a new day has started for the user and reset daily metrics if needed.
-        
-        This method:
-        1. Fetches the user's last_activity timestamp and timezone.
-        2. Converts both UTC timestamps to the user's local timezone.
-        3. Compares local dates—if different, a new day has started.
-        4. Resets daily metrics (e.g., water intake) to 0 and updates last_activity.
-        
-        Args:
-            user_id: The user's Firebase ID.
-            
-        Returns:
-            bool: True if metrics were reset, False otherwise.
-        """
-        user_doc = db.collection('users').document(user_id).get()
-        if not user_doc.exists:
-            return False
-        
-        user_data = user_doc.to_dict()
-        last_activity_utc_iso = user_data.get('last_activity')
-        user_tz = user_data.get('timezone', 'UTC')
-        
-        # Check if new day has started
-        if not should_reset_daily_metrics(last_activity_utc_iso, user_tz):
-            return False
-        
-        # Get today's date in user's local timezone
-        today_local = get_user_local_date(user_tz)
-        
-        # Reset water intake for today
-        water_log_ref = db.collection('users').document(user_id).collection('water_logs').document(today_local)
-        water_log_ref.set({
-            'glasses': 0,
-            'date': today_local,
-            'created_at': get_utc_now_iso(),
-            'last_updated': get_utc_now_iso()
-        })
-        
-        # Update last_activity to mark that we've reset for this day
-        user_ref = db.collection('users').document(user_id)
-        user_ref.update({'last_activity': get_utc_now_iso()})
-        
-        print(f"Reset daily metrics for user {user_id} on {today_local}")
-        return True
-
+    def _cache_user_timezone(self, user_id: str, user_tz: str):
+        """Remember a user's timezone so date lookups skip the user document read."""
+        _timezone_cache[user_id] = (user_tz, time.monotonic() + TIMEZONE_CACHE_TTL_SECONDS)
+    
     def are_friends(self, user_id: str, other_user_id: str):
         """Check if two users are friends"""
         user_doc = db.collection('users').document(user_id).get()
@@ -1490,8 +2179,25 @@ class FirestoreUserService:
             
             # Store workout with date as document ID (one per day)
             workouts_ref = db.collection('users').document(user_id).collection('workouts')
+            
+            # A re-logged workout replaces today's, so fitness goals only move by the difference
+            try:
+                fitness_goals = self._get_active_goals(user_id, GOAL_CATEGORIES['workout'])
+            except Exception as e:
+                print(f"Error loading fitness goals for user {user_id}: {e}")
+                fitness_goals = []
+            previous = workouts_ref.document(today_str).get(field_paths=['duration_minutes', 'calories_burned']) if fitness_goals else None
+            
             workouts_ref.document(today_str).set(workout_data, merge=True)
             
+            if fitness_goals:
+                previous_data = previous.to_dict() if previous.exists else {}
+                self._advance_goals(user_id, 'workout', workout_amounts(
+                    not previous.exists,
+                    duration_minutes - (previous_data.get('duration_minutes') or 0),
+                    calories_burned - (previous_data.get('calories_burned') or 0)
+                ))
+            
             # Update workout streak
             streak_data = self.update_streak(user_id, 'workout')
             
@@ -1539,6 +2245,9 @@ class FirestoreUserService:
         """
         Check if user has already logged a workout today.
         
+        Workouts are stored with the user's local date as the document ID,
+        so this is a single document lookup on today's key.
+        
         Args:
             user_id: The user's Firebase ID
             
@@ -1546,36 +2255,59 @@ class FirestoreUserService:
             bool: True if user has logged a workout today, False otherwise
         """
         try:
-            # Get user's timezone
-            user_doc = db.collection('users').document(user_id).get()
-            user_data = user_doc.to_dict() if user_doc.exists else {}
-            user_tz = user_data.get('timezone', 'UTC')
-            
-            # Get today's date in user's timezone
-            today_local_dt = get_user_local_datetime(user_tz)
-            today_local = today_local_dt.date()
-            today_str = today_local.strftime('%Y-%m-%d')
-            
-            # Get start and end of today in UTC for database query
-            tz = ZoneInfo(user_tz)
-            start_of_today_local = datetime.combine(today_local, datetime.min.time()).replace(tzinfo=tz)
-            start_of_today_utc = start_of_today_local.astimezone(ZoneInfo('UTC'))
-            
-            end_of_today_local = datetime.combine(today_local, datetime.max.time()).replace(tzinfo=tz)
-            end_of_today_utc = end_of_today_local.astimezone(ZoneInfo('UTC'))
-            
-            # Query for workouts logged today
-            workouts_ref = db.collection('users').document(user_id).collection('workouts')
-            workouts_query = workouts_ref.where('created_at', '>=', start_of_today_utc.isoformat()).where('created_at', '<=', end_of_today_utc.isoformat())
-            workouts = list(workouts_query.stream())
-            
-            return len(workouts) > 0
+            today_str = get_user_local_date(self._get_user_timezone(user_id))
+            workout_ref = db.collection('users').document(user_id).collection('workouts').document(today_str)
+            return workout_ref.get(field_paths=['created_at']).exists
             
         except Exception as e:
             print(f"Error checking if user {user_id} logged today: {e}")
             return False
 
-    def get_workout_consistency(self, user_id: str, days: int = 7) -> dict:
+    def get_today_status(self, user_id: str) -> dict:
+        """
+        Get today's water total, workout flag and streaks.
+        
+        Used for the dashboard's first paint. Today's water and workout
+        documents are keyed by date and fetched with one get_all call; streaks
+        are read from the streaks subcollection, so every activity type a
+        client keeps a streak for is included.
+        
+        Args:
+            user_id: The user's Firebase ID
+            
+        Returns:
+            dict: Today's status with keys:
+                  - date: Today's date (YYYY-MM-DD) in user's timezone
+                  - water: Glasses of water logged today
+                  - has_logged_workout: Whether a workout was logged today
+                  - streaks: Dictionary mapping streak_type to streak data
+        """
+        user_tz = self._get_user_timezone(user_id)
+        today = get_user_local_date(user_tz)
+        
+        user_ref = db.collection('users').document(user_id)
+        water_ref = user_ref.collection('water_logs').document(today)
+        workout_ref = user_ref.collection('workouts').document(today)
+        
+        # get_all does not preserve request order, so index snapshots by path
+        snapshots = {
+            snapshot.reference.path: snapshot
+            for snapshot in db.get_all([water_ref, workout_ref])
+        }
+        
+        water_doc = snapshots.get(water_ref.path)
+        workout_doc = snapshots.get(workout_ref.path)
+        streaks = self.get_all_streaks(user_id)
+        
+        return {
+            'date': today,
+            'timezone': user_tz,
+            'water': water_doc.to_dict().get('glasses', 0) if water_doc and water_doc.exists else 0,
+            'has_logged_workout': bool(workout_doc and workout_doc.exists),
+            'streaks': streaks
+        }
+
+    def get_workout_consistency(self, user_id: str, days: int = 7, user_data: dict = None, reference_date: datetime.date = None) -> dict:
         """
         Calculate user's workout consistency for the current week (Monday-Sunday).
         Handles rest days scheduled in the weekly schedule.
@@ -1583,6 +2315,8 @@ class FirestoreUserService:
         Args:
             user_id: The user's Firebase ID
             days: Number of days to analyze (default 7)
+            user_data: Already-fetched user document data (optional, avoids a re-read)
+            reference_date: Local date to treat as "today" (optional, used to evaluate past weeks)
             
         Returns:
             dict: Consistency data including weekly breakdown, current streak, and lifetime consistency
@@ -1590,8 +2324,9 @@ class FirestoreUserService:
         """
         try:
             # Get user's timezone for accurate date calculations
-            user_doc = db.collection('users').document(user_id).get()
-            user_data = user_doc.to_dict() if user_doc.exists else {}
+            if user_data is None:
+                user_doc = db.collection('users').document(user_id).get()
+                user_data = user_doc.to_dict() if user_doc.exists else {}
             user_tz = user_data.get('timezone', 'UTC')
             
             # Get account creation date in user's timezone
@@ -1602,14 +2337,16 @@ class FirestoreUserService:
                     # Parse ISO format timestamp (e.g., "2025-12-06T10:30:45Z")
                     account_creation_dt = datetime.fromisoformat(account_creation_str.replace('Z', '+00:00'))
                     # Convert to user's timezone and get date
-                    account_creation_tz = account_creation_dt.astimezone(ZoneInfo(user_tz))
+                    account_creation_tz = account_creation_dt.astimezone(get_zone(user_tz))
                     account_creation_date = account_creation_tz.date()
                 except:
                     account_creation_date = None
             
             # Get today's date in user's timezone
-            today_local_dt = get_user_local_datetime(user_tz)
-            today_local = today_local_dt.date()
+            if reference_date is not None:
+                today_local = reference_date
+            else:
+                today_local = get_user_local_datetime(user_tz).date()
             
             # Calculate Monday of this week (0 = Monday, 6 = Sunday)
             days_since_monday = today_local.weekday()
@@ -1623,174 +2360,82 @@ class FirestoreUserService:
                 weekly_schedule = schedule_doc.to_dict()
                 weekly_schedule.pop('updated_at', None)
             
-            # Create a fixed weekly view: Monday through Sunday
-            daily_status = {}
+            # Fixed weekly view: Monday through Sunday as day arrays
+            week = days_ending(monday_this_week + timedelta(days=6), 7)
+            today_day = np.datetime64(today_local, 'D')
+            day_names = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
             
-            # Initialize all days of the week as 'pending' by default
-            for i in range(7):  # 0-6 = Monday to Sunday
-                date = monday_this_week + timedelta(days=i)
-                date_str = date.strftime('%Y-%m-%d')
-                
-                day_name = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'][i]
-                day_abbrev = day_name[:3]
-                
-                # Check if this day is before account creation
-                is_before_account_creation = account_creation_date and date < account_creation_date
-                
-                if is_before_account_creation:
-                    # Days before account creation should be marked as pending, not rest
-                    daily_status[date_str] = {
-                        'date': date_str,
-                        'day_of_week': day_abbrev,
-                        'status': 'pending',  # Pre-account days are always pending
-                        'workout_count': 0,
-                        'is_scheduled_rest': False
-                    }
-                else:
-                    # Check if this day is scheduled as a rest day
-                    is_rest_day_scheduled = weekly_schedule.get(day_name.lower()) == 'rest'
-                    
-                    # Only mark as 'rest' (blue) if:
-                    # 1. The day is today (user completed their rest day for today), OR
-                    # 2. The day is in the past AND user had the account on that day (already happened)
-                    # Future scheduled rest days remain 'pending' until they arrive
-                    is_rest_day_active = is_rest_day_scheduled and date == today_local
-                    
-                    daily_status[date_str] = {
-                        'date': date_str,
-                        'day_of_week': day_abbrev,
-                        'status': 'rest' if is_rest_day_active else 'pending',  # Only rest if it's today
-                        'workout_count': 0,
-                        'is_scheduled_rest': is_rest_day_scheduled  # Keep track of what's scheduled
-                    }
+            # Days before account creation are always pending, never rest or missed
+            if account_creation_date:
+                before_account = week < np.datetime64(account_creation_date, 'D')
+            else:
+                before_account = np.zeros(7, dtype=bool)
+            is_scheduled_rest = np.array([weekly_schedule.get(name.lower()) == 'rest' for name in day_names]) & ~before_account
             
-            # Fetch ALL workouts ever (for lifetime consistency and streak calculation)
+            # Fetch ALL workouts ever (for lifetime consistency and streak calculation).
+            # Document IDs are dates (YYYY-MM-DD); anything else parses to NaT and is ignored.
             workouts_ref = db.collection('users').document(user_id).collection('workouts')
-            all_workouts = list(workouts_ref.stream())
+            workout_days = parse_days(doc.id for doc in workouts_ref.select(['duration_minutes']).stream())
             
             # Track if we found ANY workouts (to distinguish new user from inactive)
-            has_any_workouts = len(all_workouts) > 0
+            has_any_workouts = len(workout_days) > 0
+            workout_days = np.unique(workout_days[~np.isnat(workout_days)])
+            first_workout_date = workout_days[0] if len(workout_days) else None
             
-            # Get the date of first workout (for lifetime consistency calculation)
-            first_workout_date = None
-            if has_any_workouts:
-                first_workout_dates = []
-                for workout_doc in all_workouts:
-                    # Document ID is the date (YYYY-MM-DD)
-                    doc_id = workout_doc.id
-                    try:
-                        workout_date = datetime.strptime(doc_id, '%Y-%m-%d').date()
-                        first_workout_dates.append(workout_date)
-                    except:
-                        pass
-                if first_workout_dates:
-                    first_workout_date = min(first_workout_dates)
-            
-            # Mark days with workouts as 'completed' (only for days in the 7-day window)
-            completed_dates_in_window = set()
-            for workout_doc in all_workouts:
-                # Document ID is the date (YYYY-MM-DD)
-                date_str = workout_doc.id
-                
-                # Check if this date is in the 7-day window
-                try:
-                    workout_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-                    if date_str in daily_status:
-                        daily_status[date_str]['status'] = 'completed'
-                        daily_status[date_str]['workout_count'] = 1  # Always 1 since one per day
-                        completed_dates_in_window.add(date_str)
-                except:
-                    pass
+            # Future scheduled rest days remain 'pending' until they arrive; only today's shows as rest
+            status = np.where(is_scheduled_rest & (week == today_day), 'rest', 'pending').astype(object)
+            has_workout = np.isin(week, workout_days)
+            status[has_workout] = 'completed'
             
-            # Only mark past days in window as 'missed' if user has logged workouts before
-            # BUT: Do NOT mark rest days as missed, and do NOT mark pre-account days as missed
-            # Future days and rest days stay as is
+            # Only mark past days as 'missed' if user has logged workouts before,
+            # and never rest days or pre-account days
             if has_any_workouts:
-                for date_str, day_data in daily_status.items():
-                    date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
-                    is_before_account = account_creation_date and date_obj < account_creation_date
-                    
-                    # Mark as missed if it's a past day with no workout AND not a rest day AND not before account creation
-                    if date_obj < today_local and day_data['status'] == 'pending' and not day_data['is_scheduled_rest'] and not is_before_account:
-                        day_data['status'] = 'missed'
+                status[(week < today_day) & (status == 'pending') & ~is_scheduled_rest & ~before_account] = 'missed'
             
             # Calculate 7-day consistency percentage
             # Formula: (Logged Workouts + Rest Days) / number of days in window
-            # Rest days and logged workouts count as "completed"
-            # Pending and missed days do NOT count as completed
             # Number of days = 7, UNLESS account was created less than 7 days ago
+            completed_count = int(np.count_nonzero((status == 'completed') | (status == 'rest')))
             
-            completed_count = 0
-            for day in daily_status.values():
-                if day['status'] == 'completed' or day['status'] == 'rest':
-                    completed_count += 1
-            
-            # Calculate the denominator: number of days from account creation to today (or 7, whichever is smaller)
             denominator = 7
             if account_creation_date:
                 days_since_creation = (today_local - account_creation_date).days + 1  # +1 to include creation day
-                # Cap at 7 days for a week view, but use actual days if account is newer
                 denominator = min(7, days_since_creation)
             
-            # Only calculate percentage if we have days to count
             consistency_7day = int((completed_count / denominator) * 100) if denominator > 0 else 0
             
             # Calculate current streak (consecutive completed days going backwards from today)
-            # IMPORTANT: Streak should NOT break on rest days, only on missed days
+            # IMPORTANT: Streak should NOT break on rest days, only on missed or pending days
             current_streak = 0
             if has_any_workouts:
-                check_date = today_local
-                while True:
-                    date_str = check_date.strftime('%Y-%m-%d')
-                    if date_str in daily_status:
-                        day_status = daily_status[date_str]['status']
-                        if day_status == 'completed':
-                            current_streak += 1
-                            check_date -= timedelta(days=1)
-                        elif day_status == 'rest':
-                            # Skip rest days, don't break streak
-                            check_date -= timedelta(days=1)
-                        else:
-                            # Break on missed or pending
-                            break
-                    else:
-                        # Date outside window, stop
-                        break
+                backwards = status[:today_local.weekday() + 1][::-1]
+                breaks = np.flatnonzero((backwards != 'completed') & (backwards != 'rest'))
+                counted = backwards[:breaks[0]] if breaks.size else backwards
+                current_streak = int(np.count_nonzero(counted == 'completed'))
             
             # Calculate lifetime consistency score (percentage of days with workouts since first workout)
             # Rest days should not affect lifetime consistency
             lifetime_consistency = 0
             lifetime_days = 0
-            if has_any_workouts and first_workout_date:
-                # Count days from first workout to today
-                lifetime_days = (today_local - first_workout_date).days + 1  # +1 to include today
-                
-                # Get unique dates with workouts (document IDs are dates)
-                unique_workout_dates = set()
-                for workout_doc in all_workouts:
-                    date_str = workout_doc.id
-                    try:
-                        workout_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-                        unique_workout_dates.add(workout_date)
-                    except:
-                        pass
-                
-                completed_lifetime = len(unique_workout_dates)
-                lifetime_consistency = int((completed_lifetime / lifetime_days) * 100) if lifetime_days > 0 else 0
-            
-            # Sort by date (oldest to newest for display)
-            sorted_days = sorted(daily_status.values(), key=lambda x: x['date'])
-            
-            # Remove the internal 'is_scheduled_rest' field before returning
-            for day in sorted_days:
-                day.pop('is_scheduled_rest', None)
+            if has_any_workouts and first_workout_date is not None:
+                lifetime_days = int((today_day - first_workout_date).astype(np.int64)) + 1  # +1 to include today
+                lifetime_consistency = int((len(workout_days) / lifetime_days) * 100) if lifetime_days > 0 else 0
+            
+            week_strings = days_to_strings(week)
+            day_of_week = weekdays(week)
+            sorted_days = [{
+                'date': week_strings[i],
+                'day_of_week': day_names[day_of_week[i]][:3],
+                'status': status[i],
+                'workout_count': int(has_workout[i])  # Always 1 since one per day
+            } for i in range(7)]
             
             return {
                 'days': days,
                 'consistency_7day': consistency_7day,
                 'lifetime_consistency': lifetime_consistency,
                 'current_streak': current_streak,
-                'total_workouts': len(set(completed_dates_in_window)),  # Unique dates with workouts
+                'total_workouts': int(np.count_nonzero(has_workout)),  # Unique dates with workouts in the week
                 'daily_breakdown': sorted_days
             }
             
@@ -2024,7 +2669,7 @@ class FirestoreUserService:
             print(f"Error retrieving schedule for user {user_id}: {e}")
             return {}
 
-    def get_week_number(self, date: datetime.date, user_id: str) -> int:
+    def get_week_number(self, date: datetime.date, user_id: str, user_data: dict = None) -> int:
         """
         Calculate the week number since the user created their account.
         Week 1 = the week in which the user created their account.
@@ -2032,16 +2677,18 @@ class FirestoreUserService:
         Args:
             date: The date to get the week number for
             user_id: The user's Firebase ID
+            user_data: Already-fetched user document data (optional, avoids a re-read)
             
         Returns:
             int: The week number (1-indexed)
         """
         try:
-            user_doc = db.collection('users').document(user_id).get()
-            if not user_doc.exists:
-                return 1
+            if user_data is None:
+                user_doc = db.collection('users').document(user_id).get()
+                if not user_doc.exists:
+                    return 1
+                user_data = user_doc.to_dict()
             
-            user_data = user_doc.to_dict()
             created_at = user_data.get('created_at', '')
             
             if not created_at:
@@ -2071,7 +2718,35 @@ class FirestoreUserService:
             print(f"Error calculating week number for user {user_id}: {e}")
             return 1
 
-    def save_weekly_workout_progress(self, user_id: str, consistency_7day: int, date_range_start: datetime.date, date_range_end: datetime.date) -> dict:
+    def build_weekly_progress_summary(self, user_id: str, consistency_7day: int, date_range_start: datetime.date, date_range_end: datetime.date, user_data: dict = None) -> tuple:
+        """
+        Build the weekly workout progress summary document without writing it.
+        
+        Args:
+            user_id: The user's Firebase ID
+            consistency_7day: The 7-day consistency percentage (0-100)
+            date_range_start: Monday of the week
+            date_range_end: Sunday of the week
+            user_data: Already-fetched user document data (optional, avoids a re-read)
+            
+        Returns:
+            tuple: (document ID, summary data) for the weekly_workout_progress collection
+        """
+        week_number = self.get_week_number(date_range_end, user_id, user_data)
+        
+        summary_data = {
+            'week_number': week_number,
+            'year': date_range_end.year,
+            'percentage': consistency_7day,
+            'date_range': f"{date_range_start.strftime('%Y-%m-%d')} to {date_range_end.strftime('%Y-%m-%d')}",
+            'start_date': date_range_start.strftime('%Y-%m-%d'),
+            'end_date': date_range_end.strftime('%Y-%m-%d'),
+            'saved_at': get_utc_now_iso()
+        }
+        
+        return f"week_{week_number}_{date_range_end.year}", summary_data
+
+    def save_weekly_workout_progress(self, user_id: str, consistency_7day: int, date_range_start: datetime.date, date_range_end: datetime.date, user_data: dict = None) -> dict:
         """
         Save the weekly workout progress summary (called at end of Sunday).
         
@@ -2080,27 +2755,17 @@ class FirestoreUserService:
             consistency_7day: The 7-day consistency percentage (0-100)
             date_range_start: Monday of the week (YYYY-MM-DD)
             date_range_end: Sunday of the week (YYYY-MM-DD)
+            user_data: Already-fetched user document data (optional, avoids a re-read)
             
         Returns:
             dict: The saved weekly progress data
         """
         try:
-            # Get week number
-            week_number = self.get_week_number(date_range_end, user_id)
-            
-            # Create summary document
-            summary_data = {
-                'week_number': week_number,
-                'year': date_range_end.year,
-                'percentage': consistency_7day,
-                'date_range': f"{date_range_start.strftime('%Y-%m-%d')} to {date_range_end.strftime('%Y-%m-%d')}",
-                'start_date': date_range_start.strftime('%Y-%m-%d'),
-                'end_date': date_range_end.strftime('%Y-%m-%d'),
-                'saved_at': get_utc_now_iso()
-            }
+            doc_id, summary_data = self.build_weekly_progress_summary(
+                user_id, consistency_7day, date_range_start, date_range_end, user_data
+            )
+            week_number = summary_data['week_number']
             
-            # Save to weekly_workout_progress collection with document ID as date range
-            doc_id = f"week_{week_number}_{date_range_end.year}"
             progress_ref = db.collection('users').document(user_id).collection('weekly_workout_progress').document(doc_id)
             progress_ref.set(summary_data, merge=True)
             
@@ -2140,24 +2805,28 @@ class FirestoreUserService:
             print(f"Error retrieving weekly workout history for user {user_id}: {e}")
             return []
 
-    def check_and_save_weekly_progress(self, user_id: str) -> dict:
+    def check_and_save_weekly_progress(self, user_id: str, user_data: dict = None, save: bool = True) -> dict:
         """
-        Check if it's Sunday and save weekly progress if needed.
-        This is called when user opens the app or at scheduled intervals.
+        Check if it's Monday and return (or, as a fallback, save) last week's progress.
+        
+        Weekly summaries are normally written by the scheduled rollup job
+        (see weekly_rollup.run_weekly_rollup) just after local Sunday midnight,
+        so this is usually a single lookup of the stored summary. The summary is
+        only computed here if the job has not reached this user yet.
         
         Args:
             user_id: The user's Firebase ID
+            user_data: Already-fetched user document data (optional, avoids a re-read)
+            save: Compute and save a missing summary (False only looks it up, for read paths)
             
         Returns:
             dict: Result indicating if progress was saved
         """
         try:
-            user_doc = db.collection('users').document(user_id).get()
-            if not user_doc.exists:
-                return {'saved': False, 'reason': 'User not found'}
-            
-            user_data = user_doc.to_dict()
-            user_tz = user_data.get('timezone', 'UTC')
+            if user_data is not None:
+                user_tz = user_data.get('timezone') or 'UTC'
+            else:
+                user_tz = self._get_user_timezone(user_id)
             
             # Get today's date in user's timezone
             today_local_dt = get_user_local_datetime(user_tz)
@@ -2171,28 +2840,36 @@ class FirestoreUserService:
             sunday_last_week = today_local - timedelta(days=1)
             monday_last_week = sunday_last_week - timedelta(days=6)  # Go back 6 days to get Monday
             
-            # Check if we already saved progress for this week
-            week_number = self.get_week_number(sunday_last_week, user_id)
-            doc_id = f"week_{week_number}_{sunday_last_week.year}"
+            # Check if progress for this week was already saved (usually by the rollup job)
+            progress_ref = db.collection('users').document(user_id).collection('weekly_workout_progress')
+            existing = list(progress_ref.where('end_date', '==', sunday_last_week.strftime('%Y-%m-%d')).limit(1).stream())
+            
+            if existing:
+                return {'saved': False, 'reason': 'Weekly progress already saved', 'summary': existing[0].to_dict()}
             
-            progress_ref = db.collection('users').document(user_id).collection('weekly_workout_progress').document(doc_id)
-            existing = progress_ref.get()
+            if not save:
+                return {'saved': False, 'reason': 'Weekly progress not saved yet'}
             
-            if existing.exists:
-                return {'saved': False, 'reason': 'Weekly progress already saved'}
+            # Fallback: the rollup has not processed this user yet, compute it now
+            if user_data is None:
+                user_doc = db.collection('users').document(user_id).get()
+                if not user_doc.exists:
+                    return {'saved': False, 'reason': 'User not found'}
+                user_data = user_doc.to_dict()
             
             # Get the consistency data for last week
-            consistency_data = self.get_workout_consistency(user_id, days=7)
+            consistency_data = self.get_workout_consistency(user_id, days=7, user_data=user_data, reference_date=sunday_last_week)
             
             # Save the weekly summary
             summary = self.save_weekly_workout_progress(
                 user_id, 
                 consistency_data['consistency_7day'],
                 monday_last_week,
-                sunday_last_week
+                sunday_last_week,
+                user_data
             )
             
-            return {'saved': True, 'week_number': week_number, 'percentage': consistency_data['consistency_7day'], 'summary': summary}
+            return {'saved': True, 'week_number': summary['week_number'], 'percentage': consistency_data['consistency_7day'], 'summary': summary}
             
         except Exception as e:
             print(f"Error checking and saving weekly progress for user {user_id}: {e}")
@@ -2200,4 +2877,353 @@ class FirestoreUserService:
             traceback.print_exc()
             return {'saved': False, 'error': str(e)}
 
+    # ===== GOALS =====
+    
+    # Stored alongside 'priority' so goals can be ordered by importance in queries
+    GOAL_PRIORITY_RANKS = {'high': 0, 'medium': 1, 'low': 2}
+    GOAL_STATUSES = ('active', 'completed', 'paused')
+    
+    def _goals_ref(self, user_id: str):
+        return db.collection('users').document(user_id).collection('goals')
+    
+    def _goal_stats_ref(self, user_id: str):
+        return db.collection('users').document(user_id).collection('summaries').document('goals')
+    
+    def _goal_progress(self, goal: dict) -> float:
+        """Fraction of the target reached, capped at 1."""
+        target = goal.get('targetValue') or 0
+        if target <= 0:
+            return 0.0
+        return min(max((goal.get('currentValue') or 0) / target, 0.0), 1.0)
+    
+    def _goal_counter_deltas(self, goal: dict, sign: int) -> dict:
+        """Counter increments that add (sign=1) or remove (sign=-1) a goal from the stats document."""
+        return {
+            'total': firestore.Increment(sign),
+            'by_status': {goal.get('status', 'active'): firestore.Increment(sign)},
+            'by_category': {goal.get('category', 'other'): firestore.Increment(sign)},
+            'progress_sum': firestore.Increment(sign * self._goal_progress(goal))
+        }
+    
+    def create_goal(self, user_id: str, goal_data: dict) -> bool:
+        """
+        Create a goal and count it in the user's goal stats.
+        
+        Args:
+            user_id: The user's Firebase ID.
+            goal_data: Goal fields including 'id', 'status', 'category', 'priority' and 'deadline'.
+            
+        Returns:
+            bool: True if created.
+        """
+        goal = dict(goal_data)
+        goal['priorityRank'] = self.GOAL_PRIORITY_RANKS.get(goal.get('priority'), 1)
+        goal['updatedDate'] = get_utc_now_iso()
+        goal_ref = self._goals_ref(user_id).document(goal['id'])
+        stats_ref = self._goal_stats_ref(user_id)
+        
+        # The goal and its counters are committed in the same transaction so stats never drift
+        @firestore.transactional
+        def apply(transaction):
+            goals = self._unseeded_goals(transaction, user_id)
+            transaction.create(goal_ref, goal)
+            if goals is None:
+                transaction.set(stats_ref, self._goal_counter_deltas(goal, 1), merge=True)
+            else:
+                goals[goal['id']] = goal
+                transaction.set(stats_ref, self._count_goal_stats(goals.values()))
+        
+        apply(db.transaction())
+        _active_goals.upsert(user_id, goal)
+        return True
+    
+    def get_user_goals(self, user_id: str, status: str = None) -> list:
+        """
+        Get a user's goals, soonest deadline first and then by priority.
+        
+        Args:
+            user_id: The user's Firebase ID.
+            status: Only return goals with this status ('active', 'completed' or 'paused').
+            
+        Returns:
+            list: Goal dictionaries.
+        """
+        query = self._goals_ref(user_id)
+        if status:
+            query = query.where('status', '==', status)
+        query = query.order_by('deadline').order_by('priorityRank')
+        
+        goals = []
+        for doc in query.stream():
+            goal = doc.to_dict()
+            goal.pop('priorityRank', None)
+            goal['id'] = doc.id
+            goals.append(goal)
+        return goals
+    
+    def update_goal(self, user_id: str, goal_id: str, updates: dict) -> bool:
+        """
+        Update a goal's progress or status, keeping the stats counters in step.
+        
+        Args:
+            user_id: The user's Firebase ID.
+            goal_id: The goal's ID.
+            updates: Fields to change, e.g. 'currentValue' and/or 'status'.
+            
+        Returns:
+            bool: True if updated, False if the goal does not exist.
+        """
+        goal_ref = self._goals_ref(user_id).document(goal_id)
+        stats_ref = self._goal_stats_ref(user_id)
+        
+        @firestore.transactional
+        def apply(transaction):
+            snapshot = goal_ref.get(transaction=transaction)
+            if not snapshot.exists:
+                return False
+            
+            old_goal = snapshot.to_dict()
+            changes = dict(updates)
+            if 'priority' in changes:
+                changes['priorityRank'] = self.GOAL_PRIORITY_RANKS.get(changes['priority'], 1)
+            if changes.get('status') == 'completed' and old_goal.get('status') != 'completed':
+                changes['completedDate'] = get_utc_now_iso()
+            changes['updatedDate'] = get_utc_now_iso()
+            new_goal = {**old_goal, **changes}
+            
+            goals = self._unseeded_goals(transaction, user_id)
+            transaction.update(goal_ref, changes)
+            if goals is not None:
+                goals[goal_id] = new_goal
+                transaction.set(stats_ref, self._count_goal_stats(goals.values()))
+                return True
+            
+            # Move the goal between counters only where its status or progress changed
+            counters = {'progress_sum': firestore.Increment(self._goal_progress(new_goal) - self._goal_progress(old_goal))}
+            old_status, new_status = old_goal.get('status', 'active'), new_goal.get('status', 'active')
+            if old_status != new_status:
+                counters['by_status'] = {old_status: firestore.Increment(-1), new_status: firestore.Increment(1)}
+            transaction.set(stats_ref, counters, merge=True)
+            return True
+        
+        updated = apply(db.transaction())
+        _active_goals.invalidate(user_id)
+        return updated
+    
+    def delete_goal(self, user_id: str, goal_id: str) -> bool:
+        """
+        Delete a goal and remove it from the stats counters.
+        
+        Args:
+            user_id: The user's Firebase ID.
+            goal_id: The goal's ID.
+            
+        Returns:
+            bool: True if deleted, False if the goal does not exist.
+        """
+        goal_ref = self._goals_ref(user_id).document(goal_id)
+        stats_ref = self._goal_stats_ref(user_id)
+        
+        @firestore.transactional
+        def apply(transaction):
+            snapshot = goal_ref.get(transaction=transaction)
+            if not snapshot.exists:
+                return False
+            goals = self._unseeded_goals(transaction, user_id)
+            transaction.delete(goal_ref)
+            if goals is None:
+                transaction.set(stats_ref, self._goal_counter_deltas(snapshot.to_dict(), -1), merge=True)
+            else:
+                goals.pop(goal_id, None)
+                transaction.set(stats_ref, self._count_goal_stats(goals.values()))
+            return True
+        
+        deleted = apply(db.transaction())
+        _active_goals.invalidate(user_id)
+        return deleted
+    
+    def _get_active_goals(self, user_id: str, category: str) -> list:
+        """
+        Get a user's active goals in a category from the in-memory index, loading it on a miss.
+        
+        Args:
+            user_id: The user's Firebase ID.
+            category: Goal category, e.g. 'hydration'.
+            
+        Returns:
+            list: Active goal dictionaries with 'id'.
+        """
+        goals = _active_goals.get(user_id, category)
+        if goals is None:
+            active = [{**doc.to_dict(), 'id': doc.id} for doc in self._goals_ref(user_id).where('status', '==', 'active').stream()]
+            _active_goals.put(user_id, active)
+            goals = [goal for goal in active if goal.get('category') == category]
+        return goals
+    
+    def _advance_goals(self, user_id: str, activity: str, amounts: dict, absolute: bool = False, day: str = None):
+        """
+        Move the user's active goals matching a logged activity.
+        
+        Goal and stats updates are committed in their own batch, separate from
+        the activity's writes, so a goal deleted in the meantime only fails
+        that batch. Failures are logged and never fail the activity itself.
+        
+        Args:
+            user_id: The user's Firebase ID.
+            activity: 'water', 'workout' or 'weight'.
+            amounts: Amount of the activity per unit (see goal_progress).
+            absolute: Set currentValue to the amount instead of adding it.
+            day: Local date when amounts are that day's totals (daily hydration goals).
+        """
+        try:
+            changes = evaluate_goals(self._get_active_goals(user_id, GOAL_CATEGORIES[activity]), amounts, absolute, day)
+            if not changes:
+                return
+            
+            self._ensure_goal_stats(user_id)
+            now_utc_iso = get_utc_now_iso()
+            stats_ref = self._goal_stats_ref(user_id)
+            with WritePipeline(db) as writes:
+                for goal, increment, new_goal in changes:
+                    # Increments stay correct even if the indexed value is slightly stale
+                    goal_update = {
+                        'currentValue': firestore.Increment(increment) if increment is not None else new_goal['currentValue'],
+                        'updatedDate': now_utc_iso
+                    }
+                    for field in ('progressDate', 'lastCompletedDate'):
+                        if new_goal.get(field) != goal.get(field):
+                            goal_update[field] = new_goal[field]
+                    counters = {'progress_sum': firestore.Increment(self._goal_progress(new_goal) - self._goal_progress(goal))}
+                    if new_goal.get('status') != goal.get('status'):
+                        goal_update['status'] = new_goal['status']
+                        goal_update['completedDate'] = now_utc_iso
+                        counters['by_status'] = {goal.get('status', 'active'): firestore.Increment(-1), new_goal['status']: firestore.Increment(1)}
+                    writes.update(self._goals_ref(user_id).document(goal['id']), goal_update)
+                    writes.set(stats_ref, counters, merge=True)
+            for _, _, new_goal in changes:
+                _active_goals.upsert(user_id, new_goal)
+        except Exception as e:
+            print(f"Error advancing {activity} goals for user {user_id}: {e}")
+            _active_goals.invalidate(user_id)
+    
+    def _count_goal_stats(self, goals) -> dict:
+        """Counters for the stats document computed from goal dictionaries."""
+        counters = {'total': 0, 'by_status': {}, 'by_category': {}, 'progress_sum': 0.0}
+        for goal in goals:
+            counters['total'] += 1
+            status = goal.get('status', 'active')
+            category = goal.get('category', 'other')
+            counters['by_status'][status] = counters['by_status'].get(status, 0) + 1
+            counters['by_category'][category] = counters['by_category'].get(category, 0) + 1
+            counters['progress_sum'] += self._goal_progress(goal)
+        return counters
+    
+    def _unseeded_goals(self, transaction, user_id: str):
+        """
+        Read a user's goals inside a transaction if their stats document does not exist yet.
+        
+        Incremental counter updates on a missing stats document would create it
+        with only that change counted, so callers write a full recount instead.
+        
+        Returns:
+            dict: Goals by ID when the stats document is missing, otherwise None.
+        """
+        if self._goal_stats_ref(user_id).get(transaction=transaction).exists:
+            return None
+        query = self._goals_ref(user_id).select(['status', 'category', 'currentValue', 'targetValue'])
+        return {doc.id: doc.to_dict() for doc in transaction.get(query)}
+    
+    def _ensure_goal_stats(self, user_id: str):
+        """Create the stats document from a recount if it does not exist yet."""
+        stats_ref = self._goal_stats_ref(user_id)
+        
+        @firestore.transactional
+        def apply(transaction):
+            goals = self._unseeded_goals(transaction, user_id)
+            if goals is not None:
+                transaction.set(stats_ref, self._count_goal_stats(goals.values()))
+        
+        apply(db.transaction())
+    
+    def _rebuild_goal_stats(self, user_id: str) -> dict:
+        """Recount goal stats from the goals subcollection (used when the counters document is missing)."""
+        goals = self._goals_ref(user_id).select(['status', 'category', 'currentValue', 'targetValue']).stream()
+        counters = self._count_goal_stats(doc.to_dict() for doc in goals)
+        self._goal_stats_ref(user_id).set(counters)
+        return counters
+    
+    def get_goal_stats(self, user_id: str) -> dict:
+        """
+        Get goal statistics from the incrementally maintained counters document.
+        
+        Args:
+            user_id: The user's Firebase ID.
+            
+        Returns:
+            dict: 'total', 'active', 'completed', 'paused', 'completionRate' (%),
+                  'averageProgress' (%) and 'byCategory' counts.
+        """
+        stats_doc = self._goal_stats_ref(user_id).get()
+        counters = stats_doc.to_dict() if stats_doc.exists else self._rebuild_goal_stats(user_id)
+        
+        total = counters.get('total', 0)
+        by_status = counters.get('by_status', {})
+        stats = {'total': total}
+        for status in self.GOAL_STATUSES:
+            stats[status] = by_status.get(status, 0)
+        stats['completionRate'] = round(stats['completed'] / total * 100, 1) if total else 0
+        stats['averageProgress'] = round(counters.get('progress_sum', 0) / total * 100, 1) if total else 0
+        stats['byCategory'] = {category: count for category, count in counters.get('by_category', {}).items() if count}
+        return stats
+    
+    # ===== DASHBOARD BOOTSTRAP =====
 
+    def get_dashboard_bootstrap(self, user_id: str) -> dict:
+        """
+        Fetch everything the dashboard needs for its first paint in one call.
+        
+        The user document is read once and shared with every section, and the
+        independent sections are fetched concurrently. A failing section is
+        returned as None instead of failing the whole payload.
+        
+        Args:
+            user_id: The user's Firebase ID
+            
+        Returns:
+            dict: Combined payload with 'user', 'today', 'consistency',
+                  'body_fat', 'goals' (active) and 'weekly_progress', or None if the user does not exist
+        """
+        user_data = self.get_user(user_id)
+        if user_data is None:
+            return None
+        
+        user_tz = user_data.get('timezone')
+        if not user_tz or not is_valid_timezone(user_tz):
+            user_tz = 'UTC'
+        self._cache_user_timezone(user_id, user_tz)
+        
+        sections = {
+            'today': lambda: self.get_today_status(user_id),
+            'consistency': lambda: self.get_workout_consistency(user_id, days=7, user_data=user_data),
+            'body_fat': lambda: self.get_latest_body_fat(user_id),
+            'goals': lambda: self.get_user_goals(user_id, 'active'),
+            # Read-only: saving a missing summary is left to the rollup job and the check-weekly-progress endpoint
+            'weekly_progress': lambda: self.check_and_save_weekly_progress(user_id, user_data=user_data, save=False),
+        }
+        
+        # Run each section in a copy of the request context so deferred writes join the request's buffer
+        with ThreadPoolExecutor(max_workers=len(sections)) as executor:
+            futures = {name: executor.submit(contextvars.copy_context().run, fetch) for name, fetch in sections.items()}
+        
+        payload = {}
+        for name, future in futures.items():
+            try:
+                payload[name] = future.result()
+            except Exception as e:
+                print(f"Error loading dashboard section '{name}' for user {user_id}: {e}")
+                payload[name] = None
+        
+        # Weight history has its own endpoint and is not needed for first paint
+        user_data.pop('weight_logs', None)
+        payload['user'] = user_data
+        return payload
@@ -0,0 +1,155 @@
+"""
+Goal progress driven by logged activity.
+
+When water, a workout or a weight measurement is logged, the user's active
+goals in the matching category are advanced server-side, so clients no longer
+push currentValue themselves. Active goals are looked up through a short-lived
+in-memory index per user, which goal writes keep up to date, so logging an
+activity does not query the goals subcollection each time.
+
+Each activity event carries its amount in every unit it can be expressed in;
+a goal picks the one matching its own unit and is left untouched if none does.
+
+Hydration goals are daily targets: their currentValue is the day's total
+(with 'progressDate'), and reaching the target records 'lastCompletedDate'
+instead of completing the goal, so it counts again the next day.
+"""
+
+import threading
+import time
+
+# Activity category -> goal category
+GOAL_CATEGORIES = {
+    'water': 'hydration',
+    'workout': 'fitness',
+    'weight': 'weight',
+}
+
+# Goal units as typed by users, mapped to the canonical units events are expressed in
+UNIT_ALIASES = {
+    'glass': 'glasses', 'glasses': 'glasses', 'cup': 'glasses', 'cups': 'glasses',
+    'ml': 'ml', 'milliliters': 'ml', 'millilitres': 'ml',
+    'l': 'l', 'liter': 'l', 'liters': 'l', 'litre': 'l', 'litres': 'l',
+    'workout': 'workouts', 'workouts': 'workouts', 'session': 'workouts', 'sessions': 'workouts',
+    'min': 'minutes', 'mins': 'minutes', 'minute': 'minutes', 'minutes': 'minutes',
+    'h': 'hours', 'hr': 'hours', 'hrs': 'hours', 'hour': 'hours', 'hours': 'hours',
+    'cal': 'calories', 'calories': 'calories', 'kcal': 'calories',
+    'kg': 'kg', 'kgs': 'kg', 'kilograms': 'kg',
+    'lb': 'lbs', 'lbs': 'lbs', 'pounds': 'lbs',
+}
+
+ML_PER_GLASS = 250
+LBS_PER_KG = 2.20462
+
+# How long a user's active goals are trusted before being re-read
+INDEX_TTL_SECONDS = 60
+MAX_INDEXED_USERS = 10000
+
+
+def normalize_unit(unit: str):
+    """Map a goal's free-text unit to a canonical unit, or None if unsupported."""
+    return UNIT_ALIASES.get((unit or '').strip().lower())
+
+
+def water_amounts(glasses: float) -> dict:
+    return {'glasses': glasses, 'ml': glasses * ML_PER_GLASS, 'l': glasses * ML_PER_GLASS / 1000}
+
+
+def workout_amounts(new_workout: bool, minutes: float, calories: float) -> dict:
+    return {'workouts': 1 if new_workout else 0, 'minutes': minutes, 'hours': minutes / 60, 'calories': calories}
+
+
+def weight_amounts(weight_kg: float) -> dict:
+    return {'kg': weight_kg, 'lbs': weight_kg * LBS_PER_KG}
+
+
+def evaluate_goals(goals: list, amounts: dict, absolute: bool = False, day: str = None) -> list:
+    """
+    Work out how an activity event moves each goal.
+
+    Args:
+        goals: Active goal dicts (with 'id', 'unit', 'currentValue', 'targetValue').
+        amounts: Event amount per canonical unit.
+        absolute: Replace currentValue (e.g. body weight) instead of adding to it.
+        day: Local date ('YYYY-MM-DD') for daily goals; amounts are then that day's
+            totals, set as currentValue and never completing the goal.
+
+    Returns:
+        list: (goal, increment, new_goal) for every goal whose value changes.
+            increment is None for absolute and daily updates.
+    """
+    results = []
+    for goal in goals:
+        unit = normalize_unit(goal.get('unit'))
+        amount = amounts.get(unit)
+        if amount is None:
+            continue
+
+        current = goal.get('currentValue') or 0
+        target = goal.get('targetValue') or 0
+        if day:
+            new_value, increment = round(amount, 2), None
+            if new_value == current and goal.get('progressDate') == day:
+                continue
+            new_goal = {**goal, 'currentValue': new_value, 'progressDate': day}
+            if target > 0 and new_value >= target:
+                new_goal['lastCompletedDate'] = day
+            results.append((goal, increment, new_goal))
+            continue
+
+        if absolute:
+            new_value, increment = round(amount, 1), None
+        else:
+            increment = round(amount, 2)
+            new_value = current + increment
+        if new_value == current:
+            continue
+
+        new_goal = {**goal, 'currentValue': new_value}
+        # Additive goals complete when they reach their target; weight goals can go either way, so they are left to the user
+        if not absolute and target > 0 and current < target <= new_value:
+            new_goal['status'] = 'completed'
+        results.append((goal, increment, new_goal))
+    return results
+
+
+class ActiveGoalIndex:
+    """Per-user cache of active goals grouped by category, expiring after INDEX_TTL_SECONDS."""
+
+    def __init__(self, ttl_seconds: float = INDEX_TTL_SECONDS):
+        self._ttl_seconds = ttl_seconds
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str, category: str):
+        """Active goals for a category, or None if the user's goals are not indexed."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[1] <= time.monotonic():
+                return None
+            return list(entry[0].get(category, {}).values())
+
+    def put(self, user_id: str, goals: list):
+        by_category = {}
+        for goal in goals:
+            by_category.setdefault(goal.get('category'), {})[goal['id']] = goal
+        with self._lock:
+            if len(self._entries) >= MAX_INDEXED_USERS:
+                now = time.monotonic()
+                self._entries = {key: entry for key, entry in self._entries.items() if entry[1] > now}
+            self._entries[user_id] = (by_category, time.monotonic() + self._ttl_seconds)
+
+    def upsert(self, user_id: str, goal: dict):
+        """Apply a goal write to an indexed user, dropping the goal once it is no longer active."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return
+            for goals in entry[0].values():
+                goals.pop(goal['id'], None)
+            if goal.get('status', 'active') == 'active':
+                entry[0].setdefault(goal.get('category'), {})[goal['id']] = goal
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            self._entries.pop(user_id, None)
@@ -0,0 +1,625 @@
+"""
+Presence tracking with throttled persistence and pluggable storage.
+
+Heartbeats update an in-process last-seen map, which answers online checks
+for users seen by this process without any read. A user's heartbeat is
+persisted to the presence backend at most once per PERSIST_INTERVAL_SECONDS;
+the backend is the source of truth for users this process has not seen
+(other instances, restarts).
+
+Backends:
+    MemoryPresenceBackend     single process / local development and tests
+    FirestorePresenceBackend  small presence/{uid} documents, writes batched in the background
+    RedisPresenceBackend      any Redis-compatible client (SET/MGET), for multi-instance deployments
+
+Bulk online_status(ids) reads only presence entries, never user documents.
+PresenceHub listens to the backend for streamed users (query listeners,
+pub/sub or in-process callbacks) and fans out only the status changes to each
+subscriber.
+"""
+
+import itertools
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from firebase_admin import firestore
+
+from .timezone_utils import get_utc_now, iso_to_utc_datetime
+from .write_pipeline import BackfillQueue
+
+# A user is online if their last heartbeat was within this window
+ONLINE_WINDOW = timedelta(minutes=5)
+
+# Minimum time between persisted heartbeats for the same user
+PERSIST_INTERVAL_SECONDS = 60
+
+# Entries older than the online window are dropped once the map grows past this size,
+# at most once per prune interval so a map full of online users is not rescanned on every heartbeat
+MAX_TRACKED_USERS = 50000
+PRUNE_INTERVAL_SECONDS = 60
+
+# How often the hub checks in memory for watched users whose online window has passed
+HUB_SWEEP_INTERVAL_SECONDS = 5
+
+PRESENCE_COLLECTION = 'presence'
+REDIS_KEY_PREFIX = 'presence:'
+REDIS_CHANNEL_PREFIX = 'presence-events:'
+REDIS_TTL_SECONDS = 30 * 24 * 3600
+
+
+class PresenceListener:
+    """Handle returned by a backend's listen(); unsubscribe() stops the callbacks for some or all of its users."""
+
+    def __init__(self, user_ids, stop):
+        self._user_ids = set(user_ids)
+        self._stop = stop
+
+    def unsubscribe(self, user_ids=None):
+        user_ids = set(self._user_ids) if user_ids is None else self._user_ids & set(user_ids)
+        self._user_ids -= user_ids
+        if user_ids:
+            self._stop(user_ids)
+
+
+class MemoryPresenceBackend:
+    """Process-local presence store."""
+
+    def __init__(self):
+        self._entries = {}
+        self._listeners = {}
+
+    def save(self, user_id: str, last_active: datetime):
+        self._entries[user_id] = last_active
+        for callback in list(self._listeners.get(user_id, ())):
+            callback(user_id, last_active)
+
+    def get_many(self, user_ids: list) -> dict:
+        return {user_id: self._entries[user_id] for user_id in user_ids if user_id in self._entries}
+
+    def listen(self, user_ids: list, callback) -> PresenceListener:
+        """Call callback(user_id, last_active) whenever one of the users' entries is saved."""
+        user_ids = list(dict.fromkeys(user_ids))
+        for user_id in user_ids:
+            self._listeners.setdefault(user_id, []).append(callback)
+        return PresenceListener(user_ids, lambda stopped: self._remove_listeners(stopped, callback))
+
+    def _remove_listeners(self, user_ids: set, callback):
+        for user_id in user_ids:
+            callbacks = self._listeners.get(user_id, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if not callbacks:
+                self._listeners.pop(user_id, None)
+
+
+class FirestorePresenceBackend:
+    """Presence in presence/{uid} documents, written through a background batch queue."""
+
+    # Documents requested per batched read
+    GET_ALL_CHUNK = 300
+
+    # Documents per listener query (Firestore limit on values in an 'in' filter)
+    LISTEN_CHUNK = 30
+
+    def __init__(self, client):
+        self._client = client
+        self._writes = BackfillQueue(client, upsert=True)
+        self._listeners = {}
+        self._chunks = []
+        self._chunk_of = {}
+        self._lock = threading.Lock()
+
+    def save(self, user_id: str, last_active: datetime):
+        self._writes.enqueue(
+            self._client.collection(PRESENCE_COLLECTION).document(user_id),
+            {'last_active': last_active.isoformat()}
+        )
+
+    def get_many(self, user_ids: list) -> dict:
+        collection = self._client.collection(PRESENCE_COLLECTION)
+        found = {}
+        for i in range(0, len(user_ids), self.GET_ALL_CHUNK):
+            refs = [collection.document(user_id) for user_id in user_ids[i:i + self.GET_ALL_CHUNK]]
+            for snapshot in self._client.get_all(refs):
+                last_active = iso_to_utc_datetime((snapshot.to_dict() or {}).get('last_active') or '')
+                if last_active:
+                    found[snapshot.id] = last_active
+        return found
+
+    def listen(self, user_ids: list, callback) -> PresenceListener:
+        """
+        Call callback(user_id, last_active) whenever one of the users' presence documents changes.
+
+        Watched users are packed into query listeners over document IDs, up to
+        LISTEN_CHUNK per query, so the number of streams (each with its own
+        consumer thread in the client) stays small. Adding or removing users
+        restarts only the affected queries.
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        with self._lock:
+            changed = []
+            for user_id in user_ids:
+                callbacks = self._listeners.setdefault(user_id, [])
+                callbacks.append(callback)
+                if len(callbacks) > 1:
+                    continue
+                chunk = next((chunk for chunk in self._chunks if len(chunk['user_ids']) < self.LISTEN_CHUNK), None)
+                if chunk is None:
+                    chunk = {'user_ids': set(), 'watch': None}
+                    self._chunks.append(chunk)
+                chunk['user_ids'].add(user_id)
+                self._chunk_of[user_id] = chunk
+                if not any(chunk is other for other in changed):
+                    changed.append(chunk)
+            closed = [self._restart(chunk) for chunk in changed]
+        self._close(closed)
+        return PresenceListener(user_ids, lambda stopped: self._remove_listeners(stopped, callback))
+
+    def _remove_listeners(self, user_ids: set, callback):
+        with self._lock:
+            changed = []
+            for user_id in user_ids:
+                callbacks = self._listeners.get(user_id, [])
+                if callback in callbacks:
+                    callbacks.remove(callback)
+                if callbacks or self._listeners.pop(user_id, None) is None:
+                    continue
+                chunk = self._chunk_of.pop(user_id)
+                chunk['user_ids'].discard(user_id)
+                if not any(chunk is other for other in changed):
+                    changed.append(chunk)
+            closed = [self._restart(chunk) for chunk in changed]
+        self._close(closed)
+
+    def _restart(self, chunk: dict):
+        """Replace a chunk's query listener with one for its current users; returns the old one. Called with the lock held."""
+        previous = chunk['watch']
+        chunk['watch'] = None
+        if not chunk['user_ids']:
+            self._chunks.remove(chunk)
+            return previous
+        collection = self._client.collection(PRESENCE_COLLECTION)
+        query = collection.where(
+            firestore.FieldPath.document_id(), 'in', [collection.document(user_id) for user_id in sorted(chunk['user_ids'])]
+        )
+        chunk['watch'] = query.on_snapshot(self._on_snapshot)
+        return previous
+
+    def _close(self, watches: list):
+        # Closing waits for the listener's consumer thread, which may be running a callback, so it happens outside the lock
+        for watch in watches:
+            if watch is not None:
+                try:
+                    watch.unsubscribe()
+                except Exception as e:
+                    print(f"[PRESENCE] Could not close a presence listener: {e}")
+
+    def _on_snapshot(self, snapshots, changes, read_time):
+        for snapshot in snapshots:
+            last_active = iso_to_utc_datetime((snapshot.to_dict() or {}).get('last_active') or '')
+            if not last_active:
+                continue
+            with self._lock:
+                callbacks = list(self._listeners.get(snapshot.id, ()))
+            for callback in callbacks:
+                callback(snapshot.id, last_active)
+
+    def flush(self) -> int:
+        return self._writes.flush()
+
+
+class RedisPresenceBackend:
+    """
+    Presence in a Redis-compatible store (redis-py style client with set/mget).
+
+    Every save is also published on a per-user channel, which listen() subscribes
+    to through one pub/sub connection per process.
+    """
+
+    def __init__(self, client, ttl_seconds: int = REDIS_TTL_SECONDS):
+        self._client = client
+        self._ttl_seconds = ttl_seconds
+        self._listeners = {}
+        self._pubsub = None
+        self._pubsub_thread = None
+        self._lock = threading.Lock()
+
+    def save(self, user_id: str, last_active: datetime):
+        value = last_active.isoformat()
+        self._client.set(REDIS_KEY_PREFIX + user_id, value, ex=self._ttl_seconds)
+        self._client.publish(REDIS_CHANNEL_PREFIX + user_id, value)
+
+    def get_many(self, user_ids: list) -> dict:
+        if not user_ids:
+            return {}
+        values = self._client.mget([REDIS_KEY_PREFIX + user_id for user_id in user_ids])
+        found = {}
+        for user_id, value in zip(user_ids, values):
+            if isinstance(value, bytes):
+                value = value.decode()
+            last_active = iso_to_utc_datetime(value) if value else None
+            if last_active:
+                found[user_id] = last_active
+        return found
+
+    def listen(self, user_ids: list, callback) -> PresenceListener:
+        """Call callback(user_id, last_active) whenever any process saves one of the users' entries."""
+        user_ids = list(dict.fromkeys(user_ids))
+        with self._lock:
+            channels = []
+            for user_id in user_ids:
+                callbacks = self._listeners.setdefault(user_id, [])
+                callbacks.append(callback)
+                if len(callbacks) == 1:
+                    channels.append(REDIS_CHANNEL_PREFIX + user_id)
+            if channels:
+                if self._pubsub is None:
+                    self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+                self._pubsub.subscribe(**{channel: self._on_message for channel in channels})
+                if self._pubsub_thread is None:
+                    self._pubsub_thread = self._pubsub.run_in_thread(sleep_time=1, daemon=True)
+        return PresenceListener(user_ids, lambda stopped: self._remove_listeners(stopped, callback))
+
+    def _remove_listeners(self, user_ids: set, callback):
+        with self._lock:
+            channels = []
+            for user_id in user_ids:
+                callbacks = self._listeners.get(user_id, [])
+                if callback in callbacks:
+                    callbacks.remove(callback)
+                if not callbacks and self._listeners.pop(user_id, None) is not None:
+                    channels.append(REDIS_CHANNEL_PREFIX + user_id)
+            if channels:
+                self._pubsub.unsubscribe(*channels)
+
+    def _on_message(self, message: dict):
+        channel, value = message['channel'], message['data']
+        if isinstance(channel, bytes):
+            channel = channel.decode()
+        if isinstance(value, bytes):
+            value = value.decode()
+        user_id = channel[len(REDIS_CHANNEL_PREFIX):]
+        last_active = iso_to_utc_datetime(value) if value else None
+        if not last_active:
+            return
+        with self._lock:
+            callbacks = list(self._listeners.get(user_id, ()))
+        for callback in callbacks:
+            callback(user_id, last_active)
+
+
+def create_presence_backend(kind: str, firestore_client=None, redis_url: str = None):
+    """
+    Build a presence backend from configuration.
+
+    Args:
+        kind: 'firestore', 'redis' or 'memory'.
+        firestore_client: Firestore client for the 'firestore' backend.
+        redis_url: Connection URL for the 'redis' backend.
+
+    Returns:
+        The presence backend.
+    """
+    if kind == 'memory':
+        return MemoryPresenceBackend()
+    if kind == 'redis':
+        # Optional dependency, only needed when presence is stored in Redis
+        import redis
+        return RedisPresenceBackend(redis.Redis.from_url(redis_url))
+    if kind == 'firestore':
+        return FirestorePresenceBackend(firestore_client)
+    raise ValueError(f"Unknown presence backend '{kind}'")
+
+
+class PresenceTracker:
+    """Last-seen map for heartbeats with at most one persisted write per user per interval."""
+
+    def __init__(self, backend, persist_interval: float = PERSIST_INTERVAL_SECONDS):
+        self.backend = backend
+        self._persist_interval = timedelta(seconds=persist_interval)
+        self._last_seen = {}
+        self._last_persisted = {}
+        self._last_prune = None
+        self._lock = threading.Lock()
+
+    def is_tracked(self, user_id: str) -> bool:
+        """Whether this process has received a heartbeat from the user that has not been pruned."""
+        return user_id in self._last_seen
+
+    def heartbeat(self, user_id: str) -> datetime:
+        """
+        Record that a user is active now.
+
+        Args:
+            user_id: The user's Firebase ID.
+
+        Returns:
+            datetime: The recorded UTC time.
+        """
+        now_utc = get_utc_now()
+        with self._lock:
+            self._last_seen[user_id] = now_utc
+            last_persisted = self._last_persisted.get(user_id)
+            due = last_persisted is None or now_utc - last_persisted >= self._persist_interval
+            if due:
+                self._last_persisted[user_id] = now_utc
+            if len(self._last_seen) > MAX_TRACKED_USERS and (
+                    self._last_prune is None or now_utc - self._last_prune >= timedelta(seconds=PRUNE_INTERVAL_SECONDS)):
+                self._last_prune = now_utc
+                self._prune(now_utc)
+
+        if due:
+            self.backend.save(user_id, now_utc)
+        return now_utc
+
+    def _prune(self, now_utc: datetime):
+        expired = [user_id for user_id, seen in self._last_seen.items() if now_utc - seen > ONLINE_WINDOW]
+        for user_id in expired:
+            del self._last_seen[user_id]
+            self._last_persisted.pop(user_id, None)
+
+    def last_seen_many(self, user_ids: list) -> dict:
+        """
+        Get the most recent heartbeat for several users.
+
+        Users with a heartbeat in this process within the online window are
+        answered from memory; the rest are read from the backend in bulk.
+
+        Args:
+            user_ids: Firebase IDs of the users.
+
+        Returns:
+            dict: Mapping of user ID to UTC datetime, for users that have ever been seen.
+        """
+        now_utc = get_utc_now()
+        found, missing = {}, []
+        for user_id in dict.fromkeys(user_ids):
+            seen = self._last_seen.get(user_id)
+            if seen and now_utc - seen < ONLINE_WINDOW:
+                found[user_id] = seen
+            else:
+                missing.append(user_id)
+
+        if missing:
+            try:
+                stored = self.backend.get_many(missing)
+            except Exception as e:
+                print(f"[PRESENCE] Could not read presence for {len(missing)} users: {e}")
+                stored = {}
+            for user_id in missing:
+                candidates = [value for value in (self._last_seen.get(user_id), stored.get(user_id)) if value]
+                if candidates:
+                    found[user_id] = max(candidates)
+        return found
+
+    def online_status(self, user_ids: list) -> dict:
+        """
+        Check which users are online.
+
+        Args:
+            user_ids: Firebase IDs of the users.
+
+        Returns:
+            dict: Mapping of every given user ID to True if online.
+        """
+        now_utc = get_utc_now()
+        last_seen = self.last_seen_many(user_ids)
+        return {user_id: user_id in last_seen and now_utc - last_seen[user_id] < ONLINE_WINDOW for user_id in user_ids}
+
+    def import_last_active(self, last_active: dict) -> int:
+        """
+        Seed the backend with last-active times recorded elsewhere (e.g. on user documents).
+
+        Only entries newer than what the backend already has are saved, so a
+        heartbeat persisted in the meantime is never moved back.
+
+        Args:
+            last_active: Mapping of user ID to UTC datetime.
+
+        Returns:
+            int: Number of entries saved.
+        """
+        if not last_active:
+            return 0
+        stored = self.backend.get_many(list(last_active))
+        saved = 0
+        for user_id, seen in last_active.items():
+            if user_id not in stored or stored[user_id] < seen:
+                self.backend.save(user_id, seen)
+                saved += 1
+        if hasattr(self.backend, 'flush'):
+            self.backend.flush()
+        return saved
+
+    def last_active(self, user_id: str) -> Optional[str]:
+        """Get a user's last heartbeat as an ISO UTC timestamp, or None if never seen."""
+        seen = self.last_seen_many([user_id]).get(user_id)
+        return seen.isoformat() if seen else None
+
+
+class PresenceHub:
+    """
+    Fan-out of online status changes to streaming subscribers.
+
+    Each watched user is listened to once in the backend (Firestore query
+    listeners over document IDs, Redis pub/sub channels or in-process
+    callbacks), shared by all subscribers watching them, so the presence
+    store is only read when a
+    heartbeat is persisted, not on a timer. Going offline writes nothing, so a
+    background sweep flips users whose last heartbeat has left the online
+    window using the last-seen times held in memory. Each subscriber receives
+    only the changes for the users it watches, delivered onto its asyncio queue.
+    """
+
+    def __init__(self, tracker: PresenceTracker, interval: float = HUB_SWEEP_INTERVAL_SECONDS):
+        self._tracker = tracker
+        self._interval = interval
+        self._subscriptions = {}
+        self._listeners = {}
+        self._watchers = {}
+        self._last_seen = {}
+        self._status = {}
+        self._tokens = itertools.count()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self, user_ids: list, loop, queue) -> tuple:
+        """
+        Watch users for status changes.
+
+        Args:
+            user_ids: Firebase IDs of the users to watch.
+            loop: The subscriber's asyncio event loop.
+            queue: asyncio.Queue receiving {user_id: online} change dicts.
+
+        Returns:
+            tuple: (token for update() and unsubscribe(), initial {user_id: online} snapshot).
+                Changes after the snapshot are delivered to the queue.
+        """
+        with self._lock:
+            token = next(self._tokens)
+            self._subscriptions[token] = (set(), loop, queue)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='presence-hub', daemon=True)
+                self._thread.start()
+        return token, self._watch(token, set(user_ids))
+
+    def update(self, token: int, user_ids: list) -> dict:
+        """
+        Replace the users watched by a subscription (e.g. after the friend list changed).
+
+        Returns:
+            dict: Online status of the users that were added.
+        """
+        user_ids = set(user_ids)
+        with self._lock:
+            if token not in self._subscriptions:
+                return {}
+            watched, _, _ = self._subscriptions[token]
+            removed = watched - user_ids
+            watched -= removed
+            stopped = self._unwatch(removed)
+            added = user_ids - watched
+        self._stop_listeners(stopped)
+        return self._watch(token, added)
+
+    def unsubscribe(self, token: int):
+        with self._lock:
+            subscription = self._subscriptions.pop(token, None)
+            stopped = self._unwatch(subscription[0]) if subscription else []
+        self._stop_listeners(stopped)
+
+    def _watch(self, token: int, user_ids: set) -> dict:
+        """Start listening to users for a subscription and return their current status."""
+        with self._lock:
+            new = []
+            for user_id in user_ids:
+                self._watchers[user_id] = self._watchers.get(user_id, 0) + 1
+                if self._watchers[user_id] == 1:
+                    new.append(user_id)
+            unknown = [user_id for user_id in user_ids if user_id not in self._last_seen]
+
+        # Listeners are started and stopped outside the lock: closing a Firestore
+        # listener waits for its consumer thread, which may be delivering to this hub
+        if new:
+            listener = self._tracker.backend.listen(new, self._on_presence)
+            with self._lock:
+                orphaned = [user_id for user_id in new if user_id not in self._watchers or user_id in self._listeners]
+                for user_id in new:
+                    if user_id not in orphaned:
+                        self._listeners[user_id] = listener
+            self._stop_listeners([(user_id, listener) for user_id in orphaned])
+
+        # One read for users nobody was watching yet; later changes arrive through the listeners
+        initial = self._tracker.last_seen_many(unknown) if unknown else {}
+
+        with self._lock:
+            for user_id, seen in initial.items():
+                if user_id in self._watchers:
+                    self._last_seen[user_id] = max(seen, self._last_seen.get(user_id, seen))
+            # Other subscribers get any change first, so this one's snapshot and queue never overlap
+            self._refresh([user_id for user_id in user_ids if user_id in self._watchers], get_utc_now())
+            if token in self._subscriptions:
+                self._subscriptions[token][0].update(user_ids)
+                return {user_id: self._status.get(user_id, False) for user_id in user_ids}
+            # Unsubscribed while the initial status was read
+            stopped = self._unwatch(user_ids)
+        self._stop_listeners(stopped)
+        return {}
+
+    def _unwatch(self, user_ids: set) -> list:
+        """
+        Drop a subscription's interest in users; called with the lock held.
+
+        Returns:
+            list: (user_id, listener) pairs to stop with _stop_listeners() once the lock is released.
+        """
+        stopped = []
+        for user_id in user_ids:
+            remaining = self._watchers.get(user_id, 0) - 1
+            if remaining > 0:
+                self._watchers[user_id] = remaining
+                continue
+            self._watchers.pop(user_id, None)
+            self._last_seen.pop(user_id, None)
+            self._status.pop(user_id, None)
+            listener = self._listeners.pop(user_id, None)
+            if listener is not None:
+                stopped.append((user_id, listener))
+        return stopped
+
+    def _stop_listeners(self, stopped: list):
+        by_listener = {}
+        for user_id, listener in stopped:
+            by_listener.setdefault(id(listener), (listener, []))[1].append(user_id)
+        for listener, user_ids in by_listener.values():
+            try:
+                listener.unsubscribe(user_ids)
+            except Exception as e:
+                print(f"[PRESENCE] Could not stop listening to {len(user_ids)} users: {e}")
+
+    def _on_presence(self, user_id: str, last_active: datetime):
+        """Backend listener callback for a persisted heartbeat."""
+        with self._lock:
+            if user_id not in self._watchers:
+                return
+            seen = self._last_seen.get(user_id)
+            if seen is None or last_active > seen:
+                self._last_seen[user_id] = last_active
+            self._refresh([user_id], get_utc_now())
+
+    def _refresh(self, user_ids: list, now_utc: datetime):
+        """Recompute status from last-seen times and deliver changes; called with the lock held."""
+        changes = {}
+        for user_id in user_ids:
+            seen = self._last_seen.get(user_id)
+            online = seen is not None and now_utc - seen < ONLINE_WINDOW
+            if self._status.get(user_id) != online:
+                self._status[user_id] = online
+                changes[user_id] = online
+        if not changes:
+            return
+
+        for watched, loop, queue in self._subscriptions.values():
+            delta = {user_id: online for user_id, online in changes.items() if user_id in watched}
+            if delta:
+                try:
+                    loop.call_soon_threadsafe(queue.put_nowait, delta)
+                except RuntimeError:
+                    # The subscriber's event loop has closed; it will unsubscribe on its way out
+                    pass
+
+    def sweep(self):
+        """Mark watched users offline once their last heartbeat leaves the online window."""
+        with self._lock:
+            self._refresh([user_id for user_id, online in self._status.items() if online], get_utc_now())
+
+    def _run(self):
+        while True:
+            time.sleep(self._interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"[PRESENCE] Hub sweep failed: {e}")
@@ -0,0 +1,269 @@
+"""
+Server-side downsampling and smoothing for metric charts (weight, body fat).
+
+Provides vectorized NumPy helpers to aggregate irregular measurements into
+calendar buckets (mean/min/max/count per day, week or month), to reduce a
+line series to a fixed number of visually representative points with the
+Largest-Triangle-Three-Buckets (LTTB) algorithm, and to smooth series with
+time-weighted moving averages.
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from .date_arrays import week_starts
+
+RESOLUTIONS = ('day', 'week', 'month')
+
+# Finished-bucket aggregates kept in memory, most recently used last
+MAX_CACHED_SERIES = 1024
+
+
+def bucket_starts(local_days: np.ndarray, resolution: str) -> np.ndarray:
+    """
+    Map local calendar days to the first day of their bucket.
+
+    Args:
+        local_days: Array of datetime64[D] local dates.
+        resolution: 'day', 'week' (Monday-start) or 'month'.
+
+    Returns:
+        np.ndarray: datetime64[D] bucket start for each input day.
+    """
+    if resolution == 'day':
+        return local_days
+    if resolution == 'week':
+        return week_starts(local_days)
+    if resolution == 'month':
+        return local_days.astype('datetime64[M]').astype('datetime64[D]')
+    raise ValueError(f"Unsupported resolution '{resolution}', expected one of {RESOLUTIONS}")
+
+
+def aggregate_buckets(local_days: np.ndarray, values: np.ndarray, resolution: str) -> dict:
+    """
+    Aggregate values into calendar buckets.
+
+    Args:
+        local_days: Array of datetime64[D] local dates, one per value.
+        values: Array of float measurements.
+        resolution: 'day', 'week' or 'month'.
+
+    Returns:
+        dict: Mapping of bucket start ('YYYY-MM-DD') to {'mean', 'min', 'max', 'count'}.
+    """
+    if len(values) == 0:
+        return {}
+
+    keys = bucket_starts(local_days, resolution)
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    values = values[order]
+
+    unique_keys, starts, counts = np.unique(keys, return_index=True, return_counts=True)
+    sums = np.add.reduceat(values, starts)
+    mins = np.minimum.reduceat(values, starts)
+    maxs = np.maximum.reduceat(values, starts)
+    means = sums / counts
+
+    return {
+        str(key): {
+            'mean': round(float(mean), 2),
+            'min': round(float(low), 2),
+            'max': round(float(high), 2),
+            'count': int(count)
+        }
+        for key, mean, low, high, count in zip(unique_keys, means, mins, maxs, counts)
+    }
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Downsample a line series with Largest-Triangle-Three-Buckets.
+
+    Keeps the first and last points and, for each of the (threshold - 2) middle
+    buckets, the point forming the largest triangle with the previously kept
+    point and the average of the next bucket.
+
+    Args:
+        x: Sorted x values (e.g. epoch seconds).
+        y: y values.
+        threshold: Maximum number of points to keep.
+
+    Returns:
+        np.ndarray: Indexes of the points to keep, in ascending order.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start = end
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        areas = np.abs(
+            (x[previous] - avg_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (avg_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[i + 1] = previous
+
+    return selected
+
+
+def ema_series(x: np.ndarray, y: np.ndarray, half_life: float) -> np.ndarray:
+    """
+    Exponential moving average over irregularly spaced samples.
+
+    Each sample decays the previous average by exp(-dt / tau), so gaps between
+    measurements are weighted by elapsed time rather than sample count. The
+    recurrence is solved in closed form with a cumulative sum; long histories
+    are processed in segments to keep the exponentials within float range.
+
+    Args:
+        x: Sorted sample times (e.g. epoch seconds).
+        y: Sample values.
+        half_life: Time for a sample's weight to halve, in the units of x.
+
+    Returns:
+        np.ndarray: EMA value after each sample.
+    """
+    n = len(y)
+    result = np.empty(n, dtype=np.float64)
+    if n == 0:
+        return result
+
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    tau = half_life / np.log(2)
+    # exp(600) is still well inside float64 range
+    max_span = 600 * tau
+
+    start = 0
+    previous = y[0]
+    while start < n:
+        end = start + int(np.searchsorted(x[start:], x[start] + max_span, side='right'))
+        growth = np.exp((x[start:end] - x[start]) / tau)
+        increments = np.diff(growth, prepend=1.0) * y[start:end]
+        if start == 0:
+            # Seed with the first sample rather than decaying towards it
+            increments[0] = y[0]
+        else:
+            previous = ema_update(previous, x[start - 1], y[start], x[start], half_life)
+            increments[0] = previous
+        result[start:end] = np.cumsum(increments) / growth
+        previous = result[end - 1]
+        start = end
+    return result
+
+
+def ema_update(previous: float, previous_x: float, value: float, x: float, half_life: float) -> float:
+    """
+    Advance an irregular-interval EMA by one sample.
+
+    Args:
+        previous: EMA after the previous sample.
+        previous_x: Time of the previous sample.
+        value: New sample value.
+        x: Time of the new sample (not earlier than previous_x).
+        half_life: Half-life in the units of x.
+
+    Returns:
+        float: Updated EMA.
+    """
+    decay = 0.5 ** (max(x - previous_x, 0.0) / half_life)
+    return decay * previous + (1 - decay) * value
+
+
+def rolling_daily_mean(local_days: np.ndarray, values: np.ndarray, window: int) -> tuple:
+    """
+    Trailing calendar-window mean over daily averages.
+
+    Each day's measurements are averaged first, then every calendar day from
+    the first to the last measurement gets the mean of the daily averages in
+    the preceding `window` days (days without measurements are skipped).
+
+    Args:
+        local_days: Array of datetime64[D] local dates, one per value.
+        values: Array of float measurements.
+        window: Window length in days.
+
+    Returns:
+        tuple: (datetime64[D] days, means) with NaN where the window is empty.
+    """
+    if len(values) == 0:
+        return np.array([], dtype='datetime64[D]'), np.array([], dtype=np.float64)
+
+    unique_days, inverse = np.unique(local_days, return_inverse=True)
+    daily_means = np.bincount(inverse, weights=values) / np.bincount(inverse)
+
+    first = unique_days[0]
+    grid = np.arange(first, unique_days[-1] + np.timedelta64(1, 'D'), dtype='datetime64[D]')
+    offsets = (unique_days - first).astype(np.int64)
+    sums = np.zeros(len(grid))
+    counts = np.zeros(len(grid))
+    sums[offsets] = daily_means
+    counts[offsets] = 1
+
+    window_sums = np.cumsum(sums)
+    window_counts = np.cumsum(counts)
+    window_sums[window:] -= window_sums[:-window].copy()
+    window_counts[window:] -= window_counts[:-window].copy()
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(window_counts > 0, window_sums / window_counts, np.nan)
+    return grid, means
+
+
+class FinishedBucketCache:
+    """
+    LRU cache of aggregates for buckets that can no longer change.
+
+    Each entry stores the aggregated buckets, 'complete_before' (the start of
+    the first bucket that was still open when it was computed, so only
+    measurements from that date onwards need to be re-read) and the version
+    of the user's series it was computed from. Callers pass the current
+    version on lookup, so a backdated measurement written through another
+    process, which bumps the stored version, makes the entry unusable.
+    """
+
+    def __init__(self, max_entries: int = MAX_CACHED_SERIES):
+        self._entries = OrderedDict()
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, version: int = 0):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry['version'] != version:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: tuple, buckets: dict, complete_before: str, version: int = 0):
+        with self._lock:
+            self._entries[key] = {'buckets': buckets, 'complete_before': complete_before, 'version': version}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: str, metric: str = None):
+        """Drop cached series for a user, e.g. after a backdated measurement."""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == user_id and (metric is None or key[1] == metric)]:
+                del self._entries[key]
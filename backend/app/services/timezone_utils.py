@@ -6,12 +6,98 @@ This module provides reusable functions for:
 - Computing user's local date string
 - Checking if a new day has started for the user
 - Normalizing timestamps to ISO UTC format
+
+Zones are resolved once and memoized, and each zone's current local date is
+cached together with the UTC instant of its next local midnight, so "what is
+today for this user" is a single comparison until the day rolls over.
 """
 
-from datetime import datetime, timezone, timedelta
-from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import threading
+from datetime import datetime, timezone, timedelta, tzinfo
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError, available_timezones
 from typing import Optional
 
+from .date_arrays import days_ending, days_to_strings
+
+# zone name -> (local date 'YYYY-MM-DD', local midnight starting it in UTC, next local midnight in UTC),
+# keyed by zone_key() so client-supplied names cannot grow it past the known zones
+_local_day_cache = {}
+_local_day_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def _valid_zone_names() -> frozenset:
+    return frozenset(available_timezones()) | {'UTC'}
+
+
+# Only called with names from _valid_zone_names(), which bounds the cache
+@lru_cache(maxsize=None)
+def _resolve_zone(timezone_name: str) -> tzinfo:
+    try:
+        return ZoneInfo(timezone_name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return timezone.utc
+
+
+def zone_key(timezone_name: Optional[str]) -> str:
+    """
+    Get the name a timezone resolves to, for keying per-zone caches.
+    
+    Args:
+        timezone_name: IANA timezone name from a client or user document.
+        
+    Returns:
+        str: The name itself if it is a known IANA zone, otherwise 'UTC'.
+    """
+    return timezone_name if is_valid_timezone(timezone_name) else 'UTC'
+
+
+def get_zone(timezone_name: Optional[str]) -> tzinfo:
+    """
+    Get the tzinfo for an IANA timezone name, memoized.
+    
+    Args:
+        timezone_name: IANA timezone name. Invalid names and None resolve to UTC.
+        
+    Returns:
+        tzinfo: The zone.
+    """
+    key = zone_key(timezone_name)
+    if key == 'UTC':
+        return timezone.utc
+    return _resolve_zone(key)
+
+
+def get_local_day_bounds(user_timezone: Optional[str], now_utc: datetime = None) -> tuple:
+    """
+    Get the current local date in a timezone and the UTC instants bounding it.
+    
+    Cached per zone until the next local midnight passes, so repeated calls
+    within a day are a dictionary lookup and a comparison.
+    
+    Args:
+        user_timezone: IANA timezone name (invalid or None means UTC).
+        now_utc: Time to evaluate at (defaults to now).
+        
+    Returns:
+        tuple: (local date 'YYYY-MM-DD', local midnight as UTC datetime, next local midnight as UTC datetime)
+    """
+    now_utc = now_utc or get_utc_now()
+    key = zone_key(user_timezone)
+    cached = _local_day_cache.get(key)
+    if cached and cached[1] <= now_utc < cached[2]:
+        return cached
+    
+    tz = get_zone(key)
+    local_date = now_utc.astimezone(tz).date()
+    day_start = datetime.combine(local_date, datetime.min.time(), tzinfo=tz).astimezone(timezone.utc)
+    next_midnight = datetime.combine(local_date + timedelta(days=1), datetime.min.time(), tzinfo=tz).astimezone(timezone.utc)
+    bounds = (local_date.strftime('%Y-%m-%d'), day_start, next_midnight)
+    with _local_day_lock:
+        _local_day_cache[key] = bounds
+    return bounds
+
 
 def get_utc_now() -> datetime:
     """
@@ -68,16 +154,7 @@ def get_user_local_date(user_timezone: str) -> str:
     Returns:
         str: Date string in format 'YYYY-MM-DD' in the user's local timezone.
     """
-    try:
-        tz = ZoneInfo(user_timezone)
-    except Exception:
-        # Fallback to UTC if timezone is invalid
-        tz = timezone.utc
-    
-    now_utc = get_utc_now()
-    local_now = now_utc.astimezone(tz)
-    
-    return local_now.strftime('%Y-%m-%d')
+    return get_local_day_bounds(user_timezone)[0]
 
 
 def get_user_local_datetime(user_timezone: str) -> datetime:
@@ -91,13 +168,7 @@ def get_user_local_datetime(user_timezone: str) -> datetime:
     Returns:
         datetime: Timezone-aware datetime in user's local timezone.
     """
-    try:
-        tz = ZoneInfo(user_timezone)
-    except Exception:
-        tz = timezone.utc
-    
-    now_utc = get_utc_now()
-    return now_utc.astimezone(tz)
+    return get_utc_now().astimezone(get_zone(user_timezone))
 
 
 def convert_utc_to_user_local(utc_dt: datetime, user_timezone: str) -> datetime:
@@ -111,10 +182,7 @@ def convert_utc_to_user_local(utc_dt: datetime, user_timezone: str) -> datetime:
     Returns:
         datetime: Timezone-aware datetime in user's local timezone.
     """
-    try:
-        tz = ZoneInfo(user_timezone)
-    except Exception:
-        tz = timezone.utc
+    tz = get_zone(user_timezone)
     
     # Ensure input is UTC
     if utc_dt.tzinfo is None:
@@ -143,25 +211,13 @@ def should_reset_daily_metrics(last_activity_utc_iso: Optional[str], user_timezo
         # First time, no reset needed
         return False
     
-    try:
-        last_activity_utc = iso_to_utc_datetime(last_activity_utc_iso)
-        if not last_activity_utc:
-            return False
-        
-        tz = ZoneInfo(user_timezone)
-    except Exception:
+    last_activity_utc = iso_to_utc_datetime(last_activity_utc_iso)
+    if not last_activity_utc or not is_valid_timezone(user_timezone):
         return False
     
-    # Convert both times to user's local timezone
-    last_activity_local = last_activity_utc.astimezone(tz)
-    now_utc = get_utc_now()
-    now_local = now_utc.astimezone(tz)
-    
-    # Compare local dates
-    last_date = last_activity_local.strftime('%Y-%m-%d')
-    current_date = now_local.strftime('%Y-%m-%d')
-    
-    return last_date != current_date
+    # The last activity belongs to an earlier local day if it happened before today's local midnight
+    _, day_start, _ = get_local_day_bounds(user_timezone)
+    return last_activity_utc < day_start
 
 
 def get_local_date_range(user_timezone: str, days: int = 7) -> list:
@@ -175,39 +231,23 @@ def get_local_date_range(user_timezone: str, days: int = 7) -> list:
     Returns:
         list: List of date strings in format 'YYYY-MM-DD', sorted in descending order (newest first).
     """
-    try:
-        tz = ZoneInfo(user_timezone)
-    except Exception:
-        tz = timezone.utc
-    
-    now_utc = get_utc_now()
-    now_local = now_utc.astimezone(tz)
-    
-    date_range = []
-    for i in range(days):
-        date_local = (now_local - timedelta(days=i)).strftime('%Y-%m-%d')
-        date_range.append(date_local)
-    
-    return date_range
+    today = get_local_day_bounds(user_timezone)[0]
+    return days_to_strings(days_ending(today, days)[::-1])
 
 
 def is_valid_timezone(timezone_name: str) -> bool:
     """
     Check if a timezone name is valid (IANA timezone database).
     
+    A set lookup against the zone names known to zoneinfo, computed once.
+    
     Args:
         timezone_name: IANA timezone name to validate.
         
     Returns:
         bool: True if valid, False otherwise.
     """
-    try:
-        ZoneInfo(timezone_name)
-        print(f"DEBUG: is_valid_timezone() - '{timezone_name}' is valid.")
-        return True
-    except Exception as e:
-        print(f"DEBUG: is_valid_timezone() exception for '{timezone_name}': {type(e).__name__}: {e}")
-        return False
+    return isinstance(timezone_name, str) and timezone_name in _valid_zone_names()
 
 
 def get_browser_timezone_js_snippet() -> str:
@@ -0,0 +1,104 @@
+"""
+Waitlist positions assigned after the fact, in join order.
+
+Joins only write their own entry, so signup spikes do not contend on a shared
+counter document. A scheduled job (POST /jobs/assign-waitlist-positions) walks
+entries in (joined_at, document ID) order from a cursor kept in
+waitlist_meta/positions and stores consecutive 'position' numbers; it is the
+only writer of that document. The first run numbers every existing entry,
+including those that joined before positions existed, so legacy and new
+entries share one sequence without collisions.
+
+Until the job reaches an entry, its position is the last assigned number plus
+a count() of the unassigned entries that joined up to it.
+"""
+
+from datetime import datetime, timedelta
+
+from firebase_admin import firestore
+
+from .firebase_service import db
+
+# Entries numbered per page (one batch write each)
+PAGE_SIZE = 400
+
+# Pages numbered per job run, to keep a run well inside the request timeout
+MAX_PAGES_PER_RUN = 25
+
+# Entries younger than this are left for the next run, so a join whose
+# transaction commits shortly after its joined_at is never skipped
+SETTLE_SECONDS = 60
+
+positions_ref = db.collection('waitlist_meta').document('positions')
+
+
+def _count(query) -> int:
+    result = query.count(alias='count').get()
+    return int(result[0][0].value)
+
+
+def unassigned_position(joined_at: datetime) -> int:
+    """
+    Position of an entry the job has not numbered yet.
+
+    Args:
+        joined_at: The entry's join time.
+
+    Returns:
+        int: Last assigned position plus the unassigned entries that joined up to joined_at.
+    """
+    state_doc = positions_ref.get()
+    state = state_doc.to_dict() if state_doc.exists else {}
+    query = db.collection('waitlist').where('joined_at', '<=', joined_at)
+    if state.get('cursor_joined_at'):
+        query = query.where('joined_at', '>', state['cursor_joined_at'])
+    return state.get('last', 0) + _count(query)
+
+
+def run_position_assignment(now: datetime = None) -> dict:
+    """
+    Number the entries that joined since the last run.
+
+    Args:
+        now: Time to settle entries against (defaults to now, naive UTC like joined_at).
+
+    Returns:
+        dict: 'assigned' count, 'last' position and 'done' (False if entries remain for the next run).
+    """
+    settled_before = (now or datetime.utcnow()) - timedelta(seconds=SETTLE_SECONDS)
+    waitlist_ref = db.collection('waitlist')
+    state_doc = positions_ref.get()
+    state = state_doc.to_dict() if state_doc.exists else {}
+    last = state.get('last', 0)
+    cursor_joined_at, cursor_id = state.get('cursor_joined_at'), state.get('cursor_id')
+
+    assigned = 0
+    for _ in range(MAX_PAGES_PER_RUN):
+        query = (waitlist_ref
+                 .where('joined_at', '<', settled_before)
+                 .order_by('joined_at')
+                 .order_by(firestore.FieldPath.document_id())
+                 .select(['joined_at']))
+        if cursor_joined_at:
+            query = query.start_after({'joined_at': cursor_joined_at, '__name__': waitlist_ref.document(cursor_id)})
+        docs = list(query.limit(PAGE_SIZE).stream())
+        if not docs:
+            return {'assigned': assigned, 'last': last, 'done': True}
+
+        # Positions and the cursor commit together, so a failed page is simply numbered again
+        batch = db.batch()
+        for doc in docs:
+            last += 1
+            batch.update(doc.reference, {'position': last, 'sequence': firestore.DELETE_FIELD})
+        cursor_joined_at, cursor_id = docs[-1].get('joined_at'), docs[-1].id
+        batch.set(positions_ref, {
+            'last': last,
+            'cursor_joined_at': cursor_joined_at,
+            'cursor_id': cursor_id,
+            'updated_at': datetime.utcnow()
+        })
+        batch.commit()
+        assigned += len(docs)
+        if len(docs) < PAGE_SIZE:
+            return {'assigned': assigned, 'last': last, 'done': True}
+    return {'assigned': assigned, 'last': last, 'done': False}
@@ -0,0 +1,128 @@
+"""
+Scheduled weekly workout progress rollup.
+
+Meant to be triggered hourly (e.g. by Cloud Scheduler via POST /jobs/weekly-rollup).
+Each run picks the timezone buckets whose local week ended at the last Sunday
+midnight, computes every user's weekly summary with bounded parallelism and
+writes the summaries through the batched write pipeline. Zones whose users
+were all summarized are recorded in jobs/weekly_rollup so later runs on the
+same Monday skip them; a zone with failures is retried on the next run, which
+rewrites the same summary documents.
+
+Users are selected by their stored timezone, so every user needs a valid IANA
+name: update_user only stores valid zones and POST /jobs/backfill-timezones
+fills in 'UTC' for older users without one.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo, available_timezones
+
+from .firebase_service import db, FirestoreUserService
+from .timezone_utils import get_utc_now, get_utc_now_iso
+from .write_pipeline import WritePipeline
+
+# Users processed concurrently (each one streams its workouts)
+MAX_PARALLEL_USERS = 8
+
+# Firestore limit on values per 'in' filter
+IN_FILTER_LIMIT = 30
+
+
+def due_timezone_buckets(now_utc: datetime, completed_zones: dict) -> dict:
+    """
+    Group timezones whose local week has just ended by that week's Sunday.
+
+    A zone is due when its local date is Monday and its bucket for the
+    preceding Sunday has not been rolled up yet.
+
+    Args:
+        now_utc: Current time as a timezone-aware UTC datetime.
+        completed_zones: Mapping of zone name to the last rolled-up Sunday ('YYYY-MM-DD').
+
+    Returns:
+        dict: Mapping of Sunday date string to the list of zone names due for that week.
+    """
+    buckets = {}
+    for zone_name in sorted(available_timezones()):
+        local_today = now_utc.astimezone(ZoneInfo(zone_name)).date()
+        if local_today.weekday() != 0:  # 0 = Monday
+            continue
+        week_end = (local_today - timedelta(days=1)).strftime('%Y-%m-%d')
+        if completed_zones.get(zone_name) == week_end:
+            continue
+        buckets.setdefault(week_end, []).append(zone_name)
+    return buckets
+
+
+def _summarize_user(service: FirestoreUserService, user_doc, week_end: date):
+    """Compute one user's weekly summary, returning (document reference, data) or None on failure."""
+    try:
+        user_data = user_doc.to_dict()
+        week_start = week_end - timedelta(days=6)
+        consistency = service.get_workout_consistency(user_doc.id, days=7, user_data=user_data, reference_date=week_end)
+        doc_id, summary = service.build_weekly_progress_summary(
+            user_doc.id, consistency['consistency_7day'], week_start, week_end, user_data
+        )
+        progress_ref = db.collection('users').document(user_doc.id).collection('weekly_workout_progress').document(doc_id)
+        return progress_ref, summary
+    except Exception as e:
+        print(f"[ROLLUP] Failed to summarize week ending {week_end} for user {user_doc.id}: {e}")
+        return None
+
+
+def run_weekly_rollup(now_utc: datetime = None) -> dict:
+    """
+    Save last week's workout progress for every user whose local week just ended.
+
+    Args:
+        now_utc: Time to evaluate buckets at (defaults to now, useful for backfills).
+
+    Returns:
+        dict: Run statistics with 'weeks', 'zones', 'users' and 'failed' counts.
+    """
+    now_utc = now_utc or get_utc_now()
+    service = FirestoreUserService()
+
+    state_ref = db.collection('jobs').document('weekly_rollup')
+    state_doc = state_ref.get()
+    completed_zones = state_doc.to_dict().get('completed_zones', {}) if state_doc.exists else {}
+
+    buckets = due_timezone_buckets(now_utc, completed_zones)
+    stats = {'weeks': len(buckets), 'zones': 0, 'users': 0, 'failed': 0}
+    newly_completed = {}
+
+    for week_end_str, zones in buckets.items():
+        week_end = datetime.strptime(week_end_str, '%Y-%m-%d').date()
+
+        user_docs = []
+        for i in range(0, len(zones), IN_FILTER_LIMIT):
+            query = (db.collection('users')
+                     .where('timezone', 'in', zones[i:i + IN_FILTER_LIMIT])
+                     .select(['timezone', 'created_at']))
+            user_docs.extend(query.stream())
+
+        with ThreadPoolExecutor(max_workers=MAX_PARALLEL_USERS) as executor:
+            results = list(executor.map(lambda doc: _summarize_user(service, doc, week_end), user_docs))
+
+        writes = [result for result in results if result is not None]
+        with WritePipeline(db) as pipeline:
+            for progress_ref, summary in writes:
+                pipeline.set(progress_ref, summary, merge=True)
+
+        failed_zones = {user_doc.get('timezone') for user_doc, result in zip(user_docs, results) if result is None}
+        stats['zones'] += len(zones)
+        stats['users'] += len(writes)
+        stats['failed'] += len(results) - len(writes)
+        for zone_name in zones:
+            if zone_name not in failed_zones:
+                newly_completed[zone_name] = week_end_str
+
+    if newly_completed:
+        state_ref.set({
+            'completed_zones': newly_completed,
+            'last_run_at': get_utc_now_iso()
+        }, merge=True)
+
+    print(f"[ROLLUP] Weekly rollup finished: {stats}")
+    return stats
@@ -0,0 +1,341 @@
+"""
+Batched Firestore write pipeline.
+
+Collects set/update/delete/create operations and commits them as WriteBatch
+RPCs of at most 500 operations, retrying transient failures with exponential
+backoff. A request-scoped buffer can be opened by middleware so writes that
+do not affect the response are committed together before the response is
+sent, and a BackfillQueue commits best-effort writes from a background thread
+so reads never wait on them.
+
+Each deferred_writes() block is one operation: the request buffer packs
+operations into shared batches, but an operation is never split across
+batches and a failing batch is retried operation by operation, so one
+failing write only loses the operation it belongs to.
+
+Usage:
+    with WritePipeline(db) as writes:
+        writes.update(user_ref, {...})
+        writes.delete(request_ref)
+    # committed here, one RPC per 500 operations
+"""
+
+import atexit
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from google.api_core import exceptions as gcp_exceptions
+
+# Firestore's maximum number of operations in a single batched write
+BATCH_WRITE_LIMIT = 500
+
+MAX_COMMIT_ATTEMPTS = 5
+BACKOFF_BASE_SECONDS = 0.2
+BACKOFF_MAX_SECONDS = 5.0
+
+# Errors where the batch is known not to have been applied, so retrying is safe
+# (ambiguous errors such as DeadlineExceeded are not retried to avoid replaying increments)
+RETRYABLE_ERRORS = (
+    gcp_exceptions.Aborted,
+    gcp_exceptions.ServiceUnavailable,
+    gcp_exceptions.TooManyRequests,
+)
+
+BACKFILL_FLUSH_INTERVAL_SECONDS = 5.0
+
+# Every BackfillQueue, so request handling can flush the ones that are due
+_backfill_queues = []
+
+_request_writes: ContextVar[Optional['RequestWrites']] = ContextVar('request_writes', default=None)
+
+
+class WritePipeline:
+    """Queue of Firestore writes committed in chunked batches."""
+
+    def __init__(self, client, max_batch_size: int = BATCH_WRITE_LIMIT):
+        self._client = client
+        self._max_batch_size = min(max_batch_size, BATCH_WRITE_LIMIT)
+        self._operations = []
+        self.committed = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Only commit if the block completed; a failed block discards its queued writes
+        if exc_type is None:
+            self.flush()
+        else:
+            self._operations.clear()
+        return False
+
+    def __len__(self):
+        return len(self._operations)
+
+    def set(self, reference, data: dict, merge: bool = False):
+        self._queue(('set', reference, data, merge, None))
+
+    def update(self, reference, data: dict, option=None):
+        """Queue an update; option is a write precondition from client.write_option()."""
+        self._queue(('update', reference, data, None, option))
+
+    def create(self, reference, data: dict):
+        self._queue(('create', reference, data, None, None))
+
+    def delete(self, reference):
+        self._queue(('delete', reference, None, None, None))
+
+    def _queue(self, operation: tuple):
+        self._operations.append(operation)
+        if len(self._operations) >= self._max_batch_size:
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        Commit all queued operations.
+
+        Returns:
+            int: Number of operations committed.
+        """
+        committed = 0
+        while self._operations:
+            chunk = self._operations[:self._max_batch_size]
+            self._commit_with_retry(chunk)
+            del self._operations[:len(chunk)]
+            committed += len(chunk)
+        self.committed += committed
+        return committed
+
+    def _commit_with_retry(self, chunk: list):
+        for attempt in range(MAX_COMMIT_ATTEMPTS):
+            batch = self._client.batch()
+            for kind, reference, data, merge, option in chunk:
+                if kind == 'set':
+                    batch.set(reference, data, merge=merge)
+                elif kind == 'update':
+                    batch.update(reference, data, option=option)
+                elif kind == 'create':
+                    batch.create(reference, data)
+                else:
+                    batch.delete(reference)
+            try:
+                batch.commit()
+                return
+            except RETRYABLE_ERRORS as e:
+                if attempt == MAX_COMMIT_ATTEMPTS - 1:
+                    raise
+                delay = min(BACKOFF_BASE_SECONDS * (2 ** attempt), BACKOFF_MAX_SECONDS)
+                delay *= random.uniform(0.5, 1.0)
+                print(f"[WRITES] Batch commit failed ({type(e).__name__}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+
+
+class RequestWrites:
+    """Operations deferred during one request, committed together when the request ends."""
+
+    def __init__(self, client):
+        self._client = client
+        self._operations = []
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def add(self, operation: WritePipeline) -> bool:
+        """
+        Queue an operation's writes.
+
+        Returns:
+            bool: False if the buffer was already flushed (e.g. writes from a
+                streaming body or a background task), so the caller commits itself.
+        """
+        with self._lock:
+            if self._closed:
+                return False
+            self._operations.append(operation)
+            return True
+
+    def flush(self) -> list:
+        """
+        Commit all queued operations and close the buffer.
+
+        Returns:
+            list: Exceptions of the operations that could not be committed.
+        """
+        with self._lock:
+            self._closed = True
+            operations, self._operations = self._operations, []
+
+        # Pack whole operations into batches of at most BATCH_WRITE_LIMIT writes
+        packs, pack, size = [], [], 0
+        for operation in operations:
+            if pack and size + len(operation) > BATCH_WRITE_LIMIT:
+                packs.append(pack)
+                pack, size = [], 0
+            pack.append(operation)
+            size += len(operation)
+        if pack:
+            packs.append(pack)
+
+        failures = []
+        for pack in packs:
+            try:
+                self._commit(pack)
+                continue
+            except Exception as e:
+                if len(pack) == 1:
+                    failures.append(e)
+                    continue
+                print(f"[WRITES] Request batch failed ({e}), retrying {len(pack)} operations individually")
+            for operation in pack:
+                try:
+                    self._commit([operation])
+                except Exception as e:
+                    failures.append(e)
+        return failures
+
+    def _commit(self, operations: list):
+        pipeline = WritePipeline(self._client)
+        for operation in operations:
+            pipeline._operations.extend(operation._operations)
+        pipeline.flush()
+
+
+def begin_request_pipeline(client):
+    """Open the write buffer for the current request. Returns (buffer, token) for end_request_pipeline."""
+    buffer = RequestWrites(client)
+    return buffer, _request_writes.set(buffer)
+
+
+def end_request_pipeline(token):
+    """Detach the request buffer opened by begin_request_pipeline."""
+    _request_writes.reset(token)
+
+
+@contextmanager
+def deferred_writes(client):
+    """
+    Yield a pipeline for one operation's writes whose result the caller does not need to read back.
+
+    Inside a request the writes are handed to the request buffer when the block
+    exits and committed before the response is sent. Outside a request (jobs,
+    scripts, executor threads without the request context) or once the request
+    buffer has been flushed (streaming bodies, background tasks), they are
+    committed when the block exits. A block that raises discards its writes.
+    """
+    operation = WritePipeline(client)
+    yield operation
+    buffer = _request_writes.get()
+    if buffer is None or not buffer.add(operation):
+        operation.flush()
+
+
+class BackfillQueue:
+    """
+    Deduplicated queue of best-effort document updates flushed in the background.
+
+    Updates to the same document are merged until the next flush, so hot reads
+    that keep discovering the same missing data queue a single write. A daemon
+    thread commits the queue every flush interval and on interpreter exit.
+    Instances that only get CPU while serving requests (Cloud Run) cannot rely
+    on that thread, so the request middleware also calls flush_due_backfills().
+    """
+
+    def __init__(self, client, interval: float = BACKFILL_FLUSH_INTERVAL_SECONDS, upsert: bool = False):
+        self._client = client
+        self._interval = interval
+        # Merge into documents that may not exist yet instead of updating existing ones
+        self._upsert = upsert
+        self._pending = {}
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._thread = None
+        _backfill_queues.append(self)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def enqueue(self, reference, data: dict, last_update_time=None):
+        """
+        Queue an update of the given fields; later values for the same field win.
+
+        Args:
+            reference: Document to update.
+            data: Fields to set.
+            last_update_time: Update time of the snapshot the data was derived from. The write is
+                dropped if the document changed since, so it never overwrites newer data.
+        """
+        with self._lock:
+            _, queued, queued_time = self._pending.get(reference.path, (reference, {}, None))
+            if queued_time is not None and last_update_time is not None:
+                last_update_time = max(queued_time, last_update_time)
+            self._pending[reference.path] = (reference, {**queued, **data}, last_update_time)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='backfill-queue', daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def flush_if_due(self) -> int:
+        """Flush if updates are pending and the flush interval has passed since the last flush."""
+        if not self._pending or time.monotonic() - self._last_flush < self._interval:
+            return 0
+        return self.flush()
+
+    def flush(self) -> int:
+        """
+        Commit all queued updates.
+
+        Returns:
+            int: Number of documents updated.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        if not pending:
+            return 0
+
+        try:
+            with WritePipeline(self._client) as writes:
+                for reference, data, last_update_time in pending.values():
+                    if self._upsert:
+                        writes.set(reference, data, merge=True)
+                    else:
+                        writes.update(reference, data, option=self._precondition(last_update_time))
+            return len(pending)
+        except Exception as e:
+            # A single deleted or since-changed document fails its whole batch, so retry the documents one by one
+            print(f"[WRITES] Backfill batch failed ({e}), retrying {len(pending)} updates individually")
+
+        updated = 0
+        for reference, data, last_update_time in pending.values():
+            try:
+                if self._upsert:
+                    reference.set(data, merge=True)
+                else:
+                    reference.update(data, option=self._precondition(last_update_time))
+                updated += 1
+            except Exception as e:
+                print(f"[WRITES] Dropping backfill for {reference.path}: {e}")
+        return updated
+
+    def _precondition(self, last_update_time):
+        return self._client.write_option(last_update_time=last_update_time) if last_update_time else None
+
+    def _run(self):
+        while True:
+            time.sleep(self._interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[WRITES] Backfill flush failed: {e}")
+
+
+def flush_due_backfills():
+    """Flush every BackfillQueue whose flush interval has passed. Failures are logged, never raised."""
+    for queue in list(_backfill_queues):
+        try:
+            queue.flush_if_due()
+        except Exception as e:
+            print(f"[WRITES] Backfill flush failed: {e}")
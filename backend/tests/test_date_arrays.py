@@ -0,0 +1,76 @@
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pytest
+
+from app.services.date_arrays import daily_totals, days_to_strings, iso_weeks, local_days, parse_days
+
+
+def epoch(iso: str) -> int:
+    return int(datetime.fromisoformat(iso).timestamp())
+
+
+@pytest.mark.parametrize('instant, expected', [
+    # New York springs forward at 07:00 UTC on 2024-03-10 (EST -5 to EDT -4)
+    ('2024-03-10T04:59:59+00:00', '2024-03-09'),
+    ('2024-03-10T05:00:00+00:00', '2024-03-10'),
+    ('2024-03-11T03:59:59+00:00', '2024-03-10'),
+    ('2024-03-11T04:00:00+00:00', '2024-03-11'),
+    # ...and falls back at 06:00 UTC on 2024-11-03
+    ('2024-11-03T03:59:59+00:00', '2024-11-02'),
+    ('2024-11-03T04:00:00+00:00', '2024-11-03'),
+    ('2024-11-04T04:59:59+00:00', '2024-11-03'),
+    ('2024-11-04T05:00:00+00:00', '2024-11-04'),
+])
+def test_local_days_at_dst_transitions(instant, expected):
+    days = local_days([epoch(instant)], ZoneInfo('America/New_York'))
+    assert days_to_strings(days) == [expected]
+
+
+@pytest.mark.parametrize('zone_name', [
+    'America/New_York',
+    'Europe/London',
+    'America/Santiago',  # transitions at local midnight
+    'Australia/Lord_Howe',  # 30-minute DST shift
+    'Asia/Kolkata',
+])
+def test_local_days_match_datetime_across_a_year(zone_name):
+    tz = ZoneInfo(zone_name)
+    epochs = np.arange(epoch('2024-01-01T00:00:00+00:00'), epoch('2025-01-01T00:00:00+00:00'), 15 * 60)
+    expected = [datetime.fromtimestamp(int(t), tz).date().isoformat() for t in epochs]
+    assert days_to_strings(local_days(epochs, tz)) == expected
+
+
+def test_local_days_empty():
+    assert local_days([], timezone.utc).size == 0
+
+
+def test_iso_weeks_match_isocalendar_across_year_boundaries():
+    start = date(2014, 12, 20)
+    dates = [start + timedelta(days=offset) for offset in range((date(2027, 1, 10) - start).days)]
+    years, weeks = iso_weeks(parse_days(day.isoformat() for day in dates))
+    assert list(zip(years.tolist(), weeks.tolist())) == [day.isocalendar()[:2] for day in dates]
+
+
+@pytest.mark.parametrize('day, expected', [
+    ('2020-12-31', (2020, 53)),
+    ('2021-01-03', (2020, 53)),
+    ('2021-01-04', (2021, 1)),
+    ('2024-12-30', (2025, 1)),
+])
+def test_iso_weeks_assign_boundary_days_to_the_thursday_year(day, expected):
+    years, weeks = iso_weeks(parse_days([day]))
+    assert (int(years[0]), int(weeks[0])) == expected
+
+
+def test_daily_totals_skip_nat_and_out_of_range_days():
+    days = parse_days(['2024-01-01', 'not a date', '2024-01-03', '2023-12-31', '2024-01-05', '2024-01-03'])
+    assert np.isnat(days[1])
+
+    totals = daily_totals(days, [1, 2, 3, 4, 5, 6], '2024-01-01', 4)
+    assert totals.tolist() == [1.0, 0.0, 9.0, 0.0]
+
+
+def test_daily_totals_empty():
+    assert daily_totals(np.array([], dtype='datetime64[D]'), [], '2024-01-01', 3).tolist() == [0.0, 0.0, 0.0]
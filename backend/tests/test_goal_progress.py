@@ -0,0 +1,60 @@
+from app.services.goal_progress import evaluate_goals, water_amounts, weight_amounts, workout_amounts
+
+
+def goal(goal_id, unit, current, target, **extra):
+    return {'id': goal_id, 'unit': unit, 'currentValue': current, 'targetValue': target, **extra}
+
+
+def test_additive_goals_use_the_matching_unit():
+    goals = [goal('glasses', 'Glasses', 2, 8), goal('ml', ' ml ', 500, 2000), goal('steps', 'steps', 0, 10000)]
+    results = evaluate_goals(goals, water_amounts(2))
+
+    assert [(before['id'], increment, after['currentValue']) for before, increment, after in results] == [
+        ('glasses', 2, 4),
+        ('ml', 500, 1000),
+    ]
+    assert all('status' not in after for _, _, after in results)
+
+
+def test_additive_goal_completes_when_it_reaches_its_target():
+    results = evaluate_goals([goal('minutes', 'min', 100, 150)], workout_amounts(True, 60, 300))
+    assert results[0][2]['currentValue'] == 160
+    assert results[0][2]['status'] == 'completed'
+
+
+def test_goal_already_past_its_target_is_not_completed_again():
+    results = evaluate_goals([goal('workouts', 'sessions', 12, 10)], workout_amounts(True, 30, 200))
+    assert results[0][2]['currentValue'] == 13
+    assert 'status' not in results[0][2]
+
+
+def test_zero_amounts_leave_goals_unchanged():
+    assert evaluate_goals([goal('workouts', 'workouts', 3, 10)], workout_amounts(False, 0, 0)) == []
+
+
+def test_absolute_goals_replace_the_value_without_completing():
+    results = evaluate_goals([goal('weight', 'lbs', 180, 170)], weight_amounts(75), absolute=True)
+    before, increment, after = results[0]
+    assert increment is None
+    assert after['currentValue'] == 165.3
+    assert 'status' not in after
+
+
+def test_daily_goals_track_the_days_total():
+    goals = [goal('water', 'glasses', 3, 8, progressDate='2024-06-09')]
+
+    results = evaluate_goals(goals, water_amounts(5), day='2024-06-10')
+    assert results[0][1] is None
+    assert results[0][2]['currentValue'] == 5
+    assert results[0][2]['progressDate'] == '2024-06-10'
+    assert 'lastCompletedDate' not in results[0][2]
+
+    results = evaluate_goals([results[0][2]], water_amounts(8), day='2024-06-10')
+    assert results[0][2]['lastCompletedDate'] == '2024-06-10'
+    assert 'status' not in results[0][2]
+
+
+def test_daily_goals_update_for_a_new_day_with_the_same_total():
+    goals = [goal('water', 'glasses', 4, 8, progressDate='2024-06-09')]
+    assert evaluate_goals(goals, water_amounts(4), day='2024-06-09') == []
+    assert evaluate_goals(goals, water_amounts(4), day='2024-06-10')[0][2]['progressDate'] == '2024-06-10'
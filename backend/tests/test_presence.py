@@ -0,0 +1,325 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+
+pytest.importorskip("google.api_core")
+
+from app.services import presence
+from app.services.presence import (
+    FirestorePresenceBackend,
+    MemoryPresenceBackend,
+    PresenceHub,
+    PresenceListener,
+    PresenceTracker,
+    RedisPresenceBackend,
+    create_presence_backend,
+)
+from app.services.timezone_utils import get_utc_now
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeDocument:
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    def set(self, data, merge=False):
+        current = self._client.store.get(self.path, {}) if merge else {}
+        self._client.store[self.path] = {**current, **data}
+        snapshot = FakeSnapshot(self.id, self._client.store[self.path])
+        for paths, callback in list(self._client.watches):
+            if self.path in paths:
+                callback([snapshot], [], None)
+
+
+class FakeWatch:
+    def __init__(self, client, watch):
+        self._client = client
+        self._watch = watch
+
+    def unsubscribe(self):
+        self._client.watches.remove(self._watch)
+
+
+class FakeQuery:
+    def __init__(self, client, references):
+        self._client = client
+        self._paths = frozenset(reference.path for reference in references)
+
+    def on_snapshot(self, callback):
+        watch = (self._paths, callback)
+        self._client.watches.append(watch)
+        return FakeWatch(self._client, watch)
+
+
+class FakeCollection:
+    def __init__(self, client, name):
+        self._client = client
+        self._name = name
+
+    def document(self, doc_id):
+        return FakeDocument(self._client, f"{self._name}/{doc_id}")
+
+    def where(self, field_path, op_string, value):
+        assert op_string == 'in' and len(value) <= 30
+        return FakeQuery(self._client, value)
+
+
+class FakeBatch:
+    def __init__(self):
+        self._writes = []
+
+    def set(self, reference, data, merge=False):
+        self._writes.append((reference, data, merge))
+
+    def commit(self):
+        for reference, data, merge in self._writes:
+            reference.set(data, merge=merge)
+
+
+class FakeFirestore:
+    """In-memory stand-in for the parts of the Firestore client the presence backend uses."""
+
+    def __init__(self):
+        self.store = {}
+        self.reads = 0
+        self.watches = []
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def batch(self):
+        return FakeBatch()
+
+    def get_all(self, references):
+        for reference in references:
+            self.reads += 1
+            yield FakeSnapshot(reference.id, self.store.get(reference.path))
+
+
+class FakePubSub:
+    def __init__(self, client):
+        self._client = client
+
+    def subscribe(self, **handlers):
+        self._client.handlers.update(handlers)
+
+    def unsubscribe(self, *channels):
+        for channel in channels:
+            self._client.handlers.pop(channel, None)
+
+    def run_in_thread(self, sleep_time=None, daemon=False):
+        return None
+
+
+class FakeRedis:
+    """Minimal redis-py style client with set/mget and synchronous pub/sub."""
+
+    def __init__(self):
+        self.values = {}
+        self.handlers = {}
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value.encode()
+
+    def mget(self, keys):
+        return [self.values.get(key) for key in keys]
+
+    def publish(self, channel, value):
+        handler = self.handlers.get(channel)
+        if handler:
+            handler({'type': 'message', 'channel': channel.encode(), 'data': value.encode()})
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return FakePubSub(self)
+
+
+@pytest.fixture
+def firestore_backend():
+    return FirestorePresenceBackend(FakeFirestore())
+
+
+@pytest.fixture(params=['memory', 'firestore', 'redis'])
+def backend(request):
+    if request.param == 'memory':
+        return MemoryPresenceBackend()
+    if request.param == 'firestore':
+        return FirestorePresenceBackend(FakeFirestore())
+    return RedisPresenceBackend(FakeRedis())
+
+
+def flush(backend):
+    if hasattr(backend, 'flush'):
+        backend.flush()
+
+
+def test_backend_round_trip(backend):
+    now = get_utc_now()
+    backend.save('alice', now)
+    flush(backend)
+
+    assert backend.get_many(['alice', 'bob']) == {'alice': now}
+
+
+def test_heartbeat_is_persisted_once_per_interval(backend):
+    tracker = PresenceTracker(backend, persist_interval=60)
+    first = tracker.heartbeat('alice')
+    tracker.heartbeat('alice')
+    flush(backend)
+
+    assert backend.get_many(['alice']) == {'alice': first}
+    assert tracker.is_tracked('alice')
+
+
+def test_online_status_reads_other_instances_from_backend(backend):
+    now = get_utc_now()
+    backend.save('alice', now)
+    backend.save('bob', now - presence.ONLINE_WINDOW - timedelta(minutes=1))
+    flush(backend)
+
+    tracker = PresenceTracker(backend)
+    assert tracker.online_status(['alice', 'bob', 'carol']) == {'alice': True, 'bob': False, 'carol': False}
+    assert tracker.last_active('carol') is None
+
+
+def test_recent_heartbeats_are_answered_from_memory(firestore_backend):
+    tracker = PresenceTracker(firestore_backend)
+    tracker.heartbeat('alice')
+    reads = firestore_backend._client.reads
+
+    assert tracker.online_status(['alice']) == {'alice': True}
+    assert firestore_backend._client.reads == reads
+
+
+def test_import_last_active_keeps_newer_heartbeats(backend):
+    now = get_utc_now()
+    backend.save('alice', now)
+    flush(backend)
+
+    tracker = PresenceTracker(backend)
+    saved = tracker.import_last_active({'alice': now - timedelta(days=1), 'bob': now - timedelta(hours=1)})
+
+    assert saved == 1
+    assert backend.get_many(['alice', 'bob']) == {'alice': now, 'bob': now - timedelta(hours=1)}
+
+
+def test_listen_delivers_saves_until_unsubscribed(backend):
+    received = []
+    listener = backend.listen(['alice', 'carol'], lambda user_id, seen: received.append((user_id, seen)))
+    now = get_utc_now()
+    backend.save('alice', now)
+    backend.save('bob', now)
+    flush(backend)
+    listener.unsubscribe()
+    backend.save('alice', now + timedelta(minutes=1))
+    flush(backend)
+
+    assert received == [('alice', now)]
+
+
+def test_listen_stops_only_the_given_users(backend):
+    received = []
+    listener = backend.listen(['alice', 'bob'], lambda user_id, seen: received.append(user_id))
+    listener.unsubscribe(['alice'])
+    now = get_utc_now()
+    backend.save('alice', now)
+    backend.save('bob', now)
+    flush(backend)
+    listener.unsubscribe()
+
+    assert received == ['bob']
+    assert backend._listeners == {}
+
+
+def test_firestore_listen_packs_users_into_query_listeners(firestore_backend):
+    client = firestore_backend._client
+    first = firestore_backend.listen([f"user{i}" for i in range(20)], lambda user_id, seen: None)
+    second = firestore_backend.listen([f"user{i}" for i in range(15, 45)], lambda user_id, seen: None)
+    assert sorted(len(paths) for paths, _ in client.watches) == [15, 30]
+
+    first.unsubscribe()
+    assert sorted(len(paths) for paths, _ in client.watches) == [15, 15]
+    second.unsubscribe()
+    assert client.watches == []
+
+
+class FakeLoop:
+    def call_soon_threadsafe(self, callback, *args):
+        callback(*args)
+
+
+def drain(queue):
+    changes = []
+    while not queue.empty():
+        changes.append(queue.get_nowait())
+    return changes
+
+
+def test_hub_delivers_changes_without_polling_reads(firestore_backend):
+    client = firestore_backend._client
+    firestore_backend.save('bob', get_utc_now() - presence.ONLINE_WINDOW - timedelta(minutes=1))
+    flush(firestore_backend)
+    hub = PresenceHub(PresenceTracker(firestore_backend), interval=3600)
+    queue = asyncio.Queue()
+
+    token, snapshot = hub.subscribe(['alice', 'bob'], FakeLoop(), queue)
+    assert snapshot == {'alice': False, 'bob': False}
+    reads = client.reads
+
+    firestore_backend.save('alice', get_utc_now())
+    flush(firestore_backend)
+    hub.sweep()
+    assert drain(queue) == [{'alice': True}]
+    assert client.reads == reads
+
+    hub.unsubscribe(token)
+    assert client.watches == []
+
+
+def test_hub_sweep_marks_expired_users_offline():
+    backend = MemoryPresenceBackend()
+    hub = PresenceHub(PresenceTracker(backend), interval=3600)
+    queue = asyncio.Queue()
+    token, snapshot = hub.subscribe(['alice'], FakeLoop(), queue)
+    backend.save('alice', get_utc_now() - presence.ONLINE_WINDOW + timedelta(seconds=1))
+    assert drain(queue) == [{'alice': True}]
+
+    hub._last_seen['alice'] -= timedelta(seconds=2)
+    hub.sweep()
+    assert drain(queue) == [{'alice': False}]
+
+
+def test_hub_snapshot_matches_state_shared_with_other_subscribers():
+    backend = MemoryPresenceBackend()
+    hub = PresenceHub(PresenceTracker(backend), interval=3600)
+    first_queue, second_queue = asyncio.Queue(), asyncio.Queue()
+    first, _ = hub.subscribe(['alice'], FakeLoop(), first_queue)
+    backend.save('alice', get_utc_now())
+
+    second, snapshot = hub.subscribe(['alice', 'bob'], FakeLoop(), second_queue)
+    assert snapshot == {'alice': True, 'bob': False}
+    assert drain(first_queue) == [{'alice': True}]
+    assert drain(second_queue) == []
+
+    assert hub.update(second, ['bob', 'carol']) == {'carol': False}
+    hub.unsubscribe(first)
+    hub.unsubscribe(second)
+    assert backend._listeners == {}
+
+
+def test_create_presence_backend():
+    assert isinstance(create_presence_backend('memory'), MemoryPresenceBackend)
+    assert isinstance(create_presence_backend('firestore', FakeFirestore()), FirestorePresenceBackend)
+    with pytest.raises(ValueError):
+        create_presence_backend('unknown')
@@ -0,0 +1,61 @@
+import sys
+import types
+from datetime import datetime, timezone
+from unittest import mock
+
+import pytest
+
+pytest.importorskip("google.api_core")
+
+# The rollup modules import the Firestore client at module level; the bucket functions never use it
+_firebase_service = types.ModuleType('app.services.firebase_service')
+_firebase_service.db = None
+_firebase_service.FirestoreUserService = type('FirestoreUserService', (), {'STREAK_TYPES': []})
+with mock.patch.dict(sys.modules, {'app.services.firebase_service': _firebase_service}):
+    sys.modules.pop('app.services.daily_rollover', None)
+    sys.modules.pop('app.services.weekly_rollup', None)
+    from app.services import daily_rollover, weekly_rollup
+
+# A Monday, when UTC-12 is just past midnight and UTC+14 is already on Tuesday
+NOW = datetime(2024, 6, 10, 12, 0, tzinfo=timezone.utc)
+
+
+def zones_by_bucket(buckets):
+    return {zone: bucket for bucket, zones in buckets.items() for zone in zones}
+
+
+def test_daily_buckets_group_zones_by_local_day():
+    zones = zones_by_bucket(daily_rollover.due_timezone_buckets(NOW, {}))
+    assert set(zones.values()) == {'2024-06-10', '2024-06-11'}
+    assert zones['UTC'] == '2024-06-10'
+    assert zones['Etc/GMT+12'] == '2024-06-10'
+    assert zones['Pacific/Kiritimati'] == '2024-06-11'
+    assert zones['Asia/Tokyo'] == '2024-06-10'
+
+
+def test_daily_buckets_skip_zones_already_rolled_over():
+    buckets = daily_rollover.due_timezone_buckets(NOW, {'UTC': '2024-06-10', 'Asia/Tokyo': '2024-06-09'})
+    zones = zones_by_bucket(buckets)
+    assert 'UTC' not in zones
+    assert zones['Asia/Tokyo'] == '2024-06-10'
+
+
+def test_weekly_buckets_include_only_zones_on_monday():
+    zones = zones_by_bucket(weekly_rollup.due_timezone_buckets(NOW, {}))
+    assert set(zones.values()) == {'2024-06-09'}
+    assert {'UTC', 'Etc/GMT+12', 'Pacific/Pago_Pago', 'Asia/Tokyo'} <= set(zones)
+    assert 'Pacific/Kiritimati' not in zones
+
+
+def test_weekly_buckets_skip_weeks_already_rolled_up():
+    zones = zones_by_bucket(weekly_rollup.due_timezone_buckets(NOW, {'UTC': '2024-06-09', 'Asia/Tokyo': '2024-06-02'}))
+    assert 'UTC' not in zones
+    assert zones['Asia/Tokyo'] == '2024-06-09'
+
+
+def test_weekly_buckets_wait_for_each_zones_own_week_end():
+    sunday = datetime(2024, 6, 9, 12, 0, tzinfo=timezone.utc)
+    zones = zones_by_bucket(weekly_rollup.due_timezone_buckets(sunday, {}))
+    assert 'UTC' not in zones
+    # UTC+14 is already on Monday
+    assert zones['Pacific/Kiritimati'] == '2024-06-09'
@@ -0,0 +1,48 @@
+import numpy as np
+
+from app.services.timeseries import ema_series, ema_update, lttb
+
+
+def test_lttb_keeps_everything_below_the_threshold():
+    x = np.arange(10)
+    assert lttb(x, x, 10).tolist() == list(range(10))
+    assert lttb(x, x, 2).tolist() == list(range(10))
+
+
+def test_lttb_keeps_endpoints_and_spikes():
+    x = np.arange(100)
+    y = np.zeros(100)
+    y[37] = 50
+    y[71] = -20
+
+    selected = lttb(x, y, 10)
+    assert len(selected) == 10
+    assert selected[0] == 0 and selected[-1] == 99
+    assert np.all(np.diff(selected) > 0)
+    assert 37 in selected and 71 in selected
+
+
+def test_ema_starts_at_the_first_sample_and_holds_constants():
+    x = np.array([0.0, 1.0, 5.0, 5.5, 20.0])
+    np.testing.assert_allclose(ema_series(x, np.full(5, 7.0), half_life=2), 7.0)
+    assert ema_series(x, np.array([3.0, 1, 1, 1, 1]), half_life=2)[0] == 3.0
+    assert ema_series(np.array([]), np.array([]), half_life=2).size == 0
+
+
+def test_ema_matches_sequential_updates_across_long_gaps():
+    rng = np.random.default_rng(7)
+    # Gaps far longer than 600 time constants force the segmented path
+    x = np.cumsum(np.concatenate([rng.uniform(0.1, 3, 50), [5000.0], rng.uniform(0.1, 3, 50), [9000.0], rng.uniform(0.1, 3, 20)]))
+    y = rng.normal(80, 5, len(x))
+    half_life = 2.0
+
+    expected = [y[0]]
+    for i in range(1, len(x)):
+        expected.append(ema_update(expected[-1], x[i - 1], y[i], x[i], half_life))
+
+    np.testing.assert_allclose(ema_series(x, y, half_life), expected, rtol=1e-9)
+
+
+def test_ema_update_weights_by_elapsed_time():
+    assert ema_update(10.0, 0.0, 20.0, 0.0, half_life=5) == 10.0
+    assert ema_update(10.0, 0.0, 20.0, 5.0, half_life=5) == 15.0